@@ -1,6 +1,44 @@
 from banking_system import BankingSystem
+from array import array
 from collections import deque 
+from concurrent.futures import ThreadPoolExecutor
 import bisect
+import functools
+import gc
+import heapq
+import itertools
+import random
+import sys
+import time
+
+import change_feed as cdc
+from change_feed import ChangeFeed
+from frozen_state import FrozenState, sorted_insert, sorted_position, sorted_range, sorted_remove
+from history_codec import CompressedHistory
+from history_tiering import TieredHistoryStore
+from shared_balances import SharedBalances
+from idempotency import IdempotencyCache, bypass_idempotency, idempotent
+from memory_accounting import deep_sizeof, estimate_container
+import transaction_log as txlog
+from transaction_log import NO_REF, TransactionLog
+from spend_window import SpendWindow
+from snapshot import (DELTA_MAGIC, EXTEND, KEYED, PIECE_ENTRIES, SET, UPDATE, SnapshotChain, SnapshotReader,
+                      write_snapshot)
+
+_MISSING = object()
+_LISTING_CHUNK = 64  # ids list_accounts reads at a time before looking up its position again
+_FOLD_MIN_ENTRIES = 8  # shorter plain-list histories take less memory than a sealed CompressedHistory
+
+
+def _restore_item(mapping, key, value):
+    '''
+    Undo journal action: put back the value a key held, or remove a key that
+    did not exist
+    '''
+    if value is _MISSING:
+        mapping.pop(key, None)
+    else:
+        mapping[key] = value
 
 class BankingSystemImpl(BankingSystem):
     '''
@@ -8,34 +46,955 @@ class BankingSystemImpl(BankingSystem):
     payments with delayed cashback, account merging, top-spender queries, and
     historical balance lookup.
     '''
-    def __init__(self):
+    _PER_ACCOUNT_STATE = ("balances", "outgoing", "payments", "balance_history", "merged_time", "outgoing_history",
+                          "pending_cashback", "transactions", "settled_payments",
+                          "spend_windows")
+    _GLOBAL_STATE = ("cashback", "sorted_outgoing", "outgoing_change_ts", "outgoing_change_accounts",
+                     "spending_checkpoints", "total_balance", "total_outgoing", "total_balance_history",
+                     "total_outgoing_history", "account_names")
+    # Per-account structures that only grow while the account lives
+    _APPEND_ONLY = ("balance_history", "outgoing_history", "transactions")
+    # System-wide logs that deltas store as the entries appended since the last
+    # checkpoint, with how many earlier entries to rewrite as well (the totals
+    # histories coalesce entries sharing a timestamp into the last one)
+    _CHECKPOINT_LOGS = {"outgoing_change_ts": 0, "outgoing_change_accounts": 0, "spending_checkpoints": 0,
+                        "total_balance_history": 1, "total_outgoing_history": 1, "account_names": 0}
+    # Constructor arguments with plain values that snapshots and forks carry over
+    _CONFIG = ("history_block_size", "spending_checkpoint_interval", "history_retention_ms", "history_bucket_ms",
+               "spend_window_ms", "spend_limit", "spend_buckets", "transaction_log", "total_history")
+
+    def __init__(self, history_tier: TieredHistoryStore | None = None, history_block_size: int | None = None,
+                 spending_checkpoint_interval: int = 10_000, change_feed: ChangeFeed | None = None,
+                 idempotency: IdempotencyCache | None = None, history_retention_ms: int | None = None,
+                 history_bucket_ms: int = 86_400_000, spend_window_ms: int | None = None,
+                 spend_limit: int | None = None, spend_buckets: int = 24,
+                 shared_balances: SharedBalances | None = None, transaction_log: bool = False,
+                 total_history: bool = False):
         self.balances = {}
         self.outgoing = {}
         self.payments = {}
         self.payment_counter = 0
         self.merged_time = {}
-        self.balance_history = {}
+        self.history_tier = history_tier
+        self.balance_history = {} if history_tier is None else history_tier
+        self.history_block_size = history_block_size
+        self.history_retention_ms = history_retention_ms
+        self.history_bucket_ms = history_bucket_ms
+        self._retention_queue = deque()
+        self._downsampled = {}
+        self._compaction_queue = deque()
+        self._compaction = {"payments_compacted": 0, "histories_folded": 0, "bytes_reclaimed": 0}
         self.cashback = deque()
         self.sorted_outgoing = []
         self.outgoing_key_map = {}
-    def _process_cashbacks(self, timestamp: int):
+        self.sorted_accounts = []
+        self.outgoing_history = {}
+        self.outgoing_change_ts = []
+        self.outgoing_change_accounts = []
+        self.spending_checkpoints = []
+        self.spending_checkpoint_interval = spending_checkpoint_interval
+        self.pending_cashback = {}
+        self.transaction_log = transaction_log
+        self.transactions = {}
+        self.settled_payments = {}
+        self.spend_window_ms = spend_window_ms
+        self.spend_limit = spend_limit
+        self.spend_buckets = spend_buckets
+        self.spend_windows = {}
+        self.account_names = []
+        self.account_handles = {}
+        self.change_feed = change_feed
+        self.idempotency = idempotency
+        if idempotency is None:
+            bypass_idempotency(self)
+        self.shared_balances = shared_balances
+        self.total_history = total_history
+        self.total_balance = 0
+        self.total_outgoing = 0
+        self.total_balance_history = []
+        self.total_outgoing_history = []
+        self._deferred_totals = []
+        self._journal = None
+        self._savepoints = []
+        self._snapshot = None
+        self._faulted = set()
+        self._index_loader = None
+        self._snapshot_refund_ts = None
+        self.clock = 0
+        self._settled_through = 0
+        self._chain = None
+        self._dirty = None
+        self._log_marks = dict.fromkeys(self._CHECKPOINT_LOGS, 0)
+
+    def _snapshot_record(self, acc: str) -> dict:
+        '''
+        Collect the state of one account from every per-account structure
+
+        :param acc: Account identifier
+        :type acc: str
+        :return: Values keyed by the attribute name of the structure they came from
+        :rtype: dict
+        '''
+        record = {}
+        for name in self._PER_ACCOUNT_STATE:
+            structure = getattr(self, name)
+            if name == "balance_history" and self.history_tier is not None:
+                if acc in structure:
+                    record[name] = self.history_tier.history(acc)
+            elif acc in structure:
+                record[name] = structure[acc]
+        return record
+
+    def _install_record(self, acc: str, record: dict):
+        '''
+        Install one decoded snapshot record into the in-memory structures
+
+        :param acc: Account identifier
+        :type acc: str
+        :param record: Values keyed by structure attribute name
+        :type record: dict
+        '''
+        for name, value in record.items():
+            getattr(self, name)[acc] = value
+
+    @staticmethod
+    def _prepare_extras(extras: dict, pause=None) -> dict:
+        '''
+        Turn decoded snapshot extras into ready-to-install structures, rebuilding
+        the ones that are derived rather than stored
+
+        :param extras: Structures keyed by attribute name, as written by `snapshot`
+        :type extras: dict
+        :param pause: Called between pieces of work, as for `load_extras`;
+            the indexes are then built `PIECE_ENTRIES` entries at a time and
+            the account list is sorted in runs merged afterwards
+        :rtype: dict
+        '''
+        def paced(entries):
+            for count, entry in enumerate(entries, 1):
+                yield entry
+                if count % PIECE_ENTRIES == 0:
+                    pause()
+
+        extras["cashback"] = deque(extras["cashback"])
+        if pause is None:
+            extras["outgoing_key_map"] = {key[1]: key for key in extras["sorted_outgoing"]}
+            extras["sorted_accounts"] = sorted(extras["outgoing_key_map"])
+            extras["account_handles"] = {acc: handle for handle, acc in enumerate(extras["account_names"])}
+            return extras
+        extras["outgoing_key_map"] = {key[1]: key for key in paced(extras["sorted_outgoing"])}
+        accounts, runs = list(extras["outgoing_key_map"]), []
+        for start in range(0, len(accounts), PIECE_ENTRIES):
+            runs.append(sorted(accounts[start:start + PIECE_ENTRIES]))
+            pause()
+        extras["sorted_accounts"] = list(paced(heapq.merge(*runs)))
+        extras["account_handles"] = {acc: handle for handle, acc in paced(enumerate(extras["account_names"]))}
+        return extras
+
+    def _fault_in(self, *accounts: str):
+        '''
+        Materialize accounts from a lazily restored snapshot the first time an
+        operation touches them
+
+        :param accounts: Account identifiers about to be read or written
+        :type accounts: str
+        '''
+        for acc in accounts:
+            if acc not in self._faulted:
+                self._faulted.add(acc)
+                record = self._snapshot.get(acc)
+                if record is not None:
+                    self._install_record(acc, record)
+
+    def _await_indexes(self):
+        '''
+        Wait for the background rebuild of the system-wide structures after a
+        lazy restore and install the result
+        '''
+        if self._index_loader is not None:
+            loader, self._index_loader = self._index_loader, None
+            for name, value in loader().items():
+                setattr(self, name, value)
+            if self._log_marks is None:
+                self._log_marks = {name: len(getattr(self, name)) for name in self._CHECKPOINT_LOGS}
+            deferred, self._deferred_totals = self._deferred_totals, []
+            for timestamp, balance_delta, outgoing_delta in deferred:
+                self._record_totals(timestamp, balance_delta, outgoing_delta)
+
+    def snapshot(self, path: str):
+        '''
+        Write a full snapshot of the current state to `path`
+
+        Accounts that were never materialized from a lazily restored snapshot
+        are copied over without being decoded. The snapshot starts a new chain
+        for `checkpoint` to add deltas to.
+
+        :param path: Destination file
+        :type path: str
+        '''
+        if self._savepoints:
+            raise ValueError("cannot snapshot while a savepoint is open")
+        self._chain = (random.getrandbits(64), 0)
+        self._write_snapshot(path)
+
+    def _write_snapshot(self, path: str):
+        '''
+        Write a full snapshot at the current position of the chain and start
+        tracking changes from it
+        '''
+        self._await_indexes()
+        accounts = set()
+        for name in self._PER_ACCOUNT_STATE:
+            accounts.update(getattr(self, name))
+        raw_records = ()
+        if self._snapshot is not None:
+            raw_records = ((acc, data) for acc, data in self._snapshot.raw_records() if acc not in self._faulted)
+        write_snapshot(
+            path,
+            ((acc, self._snapshot_record(acc)) for acc in accounts),
+            {name: getattr(self, name) for name in self._GLOBAL_STATE},
+            self.payment_counter,
+            self.cashback[0][0] if self.cashback else None,
+            raw_records,
+            *self._chain,
+            config=self._config(),
+        )
+        self._reset_checkpoint()
+
+    def _config(self) -> dict:
+        '''
+        Return the constructor arguments listed in `_CONFIG` as this system was built with
+
+        :rtype: dict
+        '''
+        return {name: getattr(self, name) for name in self._CONFIG}
+
+    def _reset_checkpoint(self):
+        '''
+        Forget the changes written by the last snapshot or checkpoint
+        '''
+        self._dirty = {} if self.history_tier is None else None
+        self._log_marks = {name: len(getattr(self, name)) for name in self._CHECKPOINT_LOGS}
+
+    def _mark_dirty(self, *accounts: str):
+        '''
+        Note accounts about to change since the last checkpoint, remembering
+        which append-only and payment objects they had and how long the former were
+
+        :param accounts: Account identifiers about to be written
+        :type accounts: str
+        '''
+        dirty = self._dirty
+        for acc in accounts:
+            if acc not in dirty:
+                lengths = {}
+                for name in self._APPEND_ONLY:
+                    value = getattr(self, name).get(acc)
+                    if value is not None:
+                        lengths[name] = (value, len(value))
+                dirty[acc] = [lengths, self.payments.get(acc), set()]
+
+    def _mark_paid(self, acc: str, payment: str):
+        '''
+        Note a payment of an account created or settled since the last checkpoint
+
+        :param acc: Account identifier
+        :type acc: str
+        :param payment: Payment identifier
+        :type payment: str
+        '''
+        self._mark_dirty(acc)
+        paid = self._dirty[acc][2]
+        if paid is not None:
+            paid.add(payment)
+
+    def _account_patch(self, acc: str, mark: list) -> dict:
+        '''
+        Build the delta record of one changed account
+
+        Histories and transaction logs still held in the same object as at the
+        mark are written as the entries appended since, payments as the ones added or settled since;
+        everything else is written whole. Structures the account has left are
+        omitted, which removes them on restore.
+
+        :param acc: Account identifier
+        :type acc: str
+        :param mark: Entry of `_dirty` for the account
+        :type mark: list
+        :return: Patch operations keyed by structure attribute name
+        :rtype: dict
+        '''
+        lengths, payments, paid = mark
+        patch = {}
+        for name in self._PER_ACCOUNT_STATE:
+            structure = getattr(self, name)
+            if acc not in structure:
+                continue
+            value = structure[acc]
+            if name in self._APPEND_ONLY:
+                held, start = lengths.get(name, (None, 0))
+                if value is not held or start == 0:
+                    patch[name] = (SET, value)
+                else:
+                    patch[name] = (EXTEND, start, value[start:])
+            elif name == "payments" and value is payments and paid is not None:
+                patch[name] = (UPDATE, {payment: value[payment] for payment in paid if payment in value})
+            else:
+                patch[name] = (SET, value)
+        return patch
+
+    def checkpoint(self, path: str):
+        '''
+        Write the changes since the last snapshot or checkpoint to a delta file
+
+        Only accounts changed since then are written, with their histories
+        and payments reduced to what was appended, together with the cashback
+        queue, the ranking entries of the changed accounts and the tails of the
+        system-wide logs. Restore a full snapshot plus its deltas with
+        `restore(path, deltas=...)` and fold them back into one file with
+        `compact`.
+
+        :param path: Destination file
+        :type path: str
+        '''
+        if self._chain is None:
+            raise ValueError("take a full snapshot before checkpointing")
+        if self._dirty is None:
+            raise ValueError("checkpoints need in-memory balance histories")
+        if self._savepoints:
+            raise ValueError("cannot checkpoint while a savepoint is open")
+        self._await_indexes()
+        extras = {
+            "cashback": (SET, list(self.cashback)),
+            "sorted_outgoing": (KEYED, {acc: self.outgoing_key_map.get(acc) for acc in self._dirty}),
+            "total_balance": (SET, self.total_balance),
+            "total_outgoing": (SET, self.total_outgoing),
+        }
+        for name, overlap in self._CHECKPOINT_LOGS.items():
+            start = max(0, self._log_marks[name] - overlap)
+            extras[name] = (EXTEND, start, getattr(self, name)[start:])
+        chain_id, sequence = self._chain
+        write_snapshot(
+            path,
+            ((acc, self._account_patch(acc, mark)) for acc, mark in self._dirty.items()),
+            extras,
+            self.payment_counter,
+            self.cashback[0][0] if self.cashback else None,
+            chain_id=chain_id,
+            sequence=sequence + 1,
+            magic=DELTA_MAGIC,
+            config=self._config(),
+        )
+        self._chain = (chain_id, sequence + 1)
+        self._reset_checkpoint()
+
+    @classmethod
+    def compact(cls, path: str, deltas, output: str):
+        '''
+        Fold a full snapshot and its deltas into a single full snapshot
+
+        Accounts no delta touched are copied without being decoded. The result
+        keeps the chain position of the last delta, so deltas written after it
+        can still be applied on top.
+
+        :param path: Full snapshot file
+        :type path: str
+        :param deltas: Delta files in the order they were written
+        :param output: Destination file
+        :type output: str
+        '''
+        system = cls.restore(path, lazy=True, deltas=deltas)
+        try:
+            system._write_snapshot(output)
+        finally:
+            system.close()
+
+    def close(self):
+        '''
+        Release the snapshot mapping and history store held by this system
+        '''
+        self._await_indexes()
+        if self._snapshot is not None:
+            self._snapshot.close()
+        if self.history_tier is not None:
+            self.history_tier.close()
+
+    @classmethod
+    def restore(cls, path: str, lazy: bool = False, deltas=(), **options) -> "BankingSystemImpl":
+        '''
+        Rebuild a system from a snapshot written by `snapshot`, followed by
+        any deltas written by `checkpoint` after it
+
+        The system is built with the configuration saved by the last file of
+        the chain, such as spend limits and history retention.
+
+        In lazy mode only the snapshot header is read up front. Accounts are
+        materialized on first touch, and the cashback queue, ranking and
+        spending log are rebuilt on a background thread; operations that need
+        them before the rebuild finishes wait for it. The rebuild decodes the
+        snapshot a piece at a time and lets other threads run in between, so
+        operations that do not need it are not held up. A shared balance
+        mirror passed in `options` is filled with every account before
+        `restore` returns, which waits for the rebuild and materializes every
+        account even in lazy mode.
+
+        :param path: Snapshot file
+        :type path: str
+        :param lazy: Serve from the memory-mapped snapshot instead of loading everything
+        :type lazy: bool
+        :param deltas: Delta files in the order they were written
+        :param options: Constructor arguments that take precedence over the
+            saved configuration, e.g. a change feed, which is not saved
+        :return: The restored system
+        :rtype: BankingSystemImpl
+        '''
+        deltas = list(deltas)
+        reader = SnapshotChain(path, deltas) if deltas else SnapshotReader(path)
+        if not deltas and reader.delta:
+            reader.close()
+            raise ValueError(f"{path} is a delta, not a full snapshot")
+        system = cls(**{**reader.config, **options})
+        system.payment_counter = reader.payment_counter
+        system._chain = (reader.chain_id, reader.sequence)
+        if lazy:
+            system._snapshot = reader
+            system._snapshot_refund_ts = reader.next_refund_ts
+            system._reset_checkpoint()
+            system._log_marks = None
+            executor = ThreadPoolExecutor(max_workers=1)
+            pause = functools.partial(time.sleep, 0)
+            system._index_loader = executor.submit(
+                lambda: cls._prepare_extras(reader.load_extras(pause), pause)).result
+            executor.shutdown(wait=False)
+        else:
+            for acc, record in reader.records():
+                system._install_record(acc, record)
+            for name, value in cls._prepare_extras(reader.load_extras()).items():
+                setattr(system, name, value)
+            reader.close()
+            system._reset_checkpoint()
+        if system.shared_balances is not None:
+            system._await_indexes()
+            system._mirror(*system.account_handles)
+        return system
+
+    def fork(self) -> "BankingSystemImpl":
+        '''
+        Return an independent system starting from the current state
+
+        Forking costs O(1): the current structures are frozen and shared by
+        both systems, and each side copies an account's record the first time
+        it touches that account and the system-wide structures the first time
+        it needs them. Memory therefore grows with how far each side diverges.
+        Histories compressed with `compress_histories` share their sealed
+        blocks instead of being copied entry by entry. Repeated forks of a
+        system that has not changed since its last fork share one frozen state.
+
+        The fork starts without a change feed, idempotency cache or shared balance mirror.
+
+        :return: The new system
+        :rtype: BankingSystemImpl
+        '''
+        if self.history_tier is not None:
+            raise ValueError("fork needs in-memory balance histories")
+        if self._savepoints:
+            raise ValueError("cannot fork while a savepoint is open")
+        if not (isinstance(self._snapshot, FrozenState) and not self._faulted and self._index_loader is not None):
+            self._await_indexes()
+            extras = {name: getattr(self, name) for name in self._GLOBAL_STATE}
+            extras["outgoing_key_map"] = self.outgoing_key_map
+            extras["sorted_accounts"] = self.sorted_accounts
+            extras["account_handles"] = self.account_handles
+            frozen = FrozenState(
+                {name: getattr(self, name) for name in self._PER_ACCOUNT_STATE},
+                extras,
+                self._faulted,
+                self._snapshot,
+            ).acquire()
+            self._share(frozen)
+        child = type(self)(**self._config())
+        child._share(self._snapshot.acquire())
+        child.payment_counter = self.payment_counter
+        child.clock = self.clock
+        child._settled_through = self._settled_through
+        return child
+
+    def _share(self, frozen: FrozenState):
+        '''
+        Start serving this system's state copy-on-write from `frozen`
+        '''
+        for name in self._PER_ACCOUNT_STATE:
+            setattr(self, name, {})
+        self._faulted = set()
+        self._snapshot = frozen
+        self._snapshot_refund_ts = frozen.next_refund_ts
+        self._index_loader = frozen.extras
+
+    def prepare_process_fork(self, block_size: int = 256):
+        '''
+        Get the current state ready to be shared with child processes created
+        by `os.fork`
+
+        Histories are compressed so that reading them touches a few block
+        objects rather than every entry, and all live objects are moved into
+        the collector's permanent generation so that garbage collection in the
+        children does not write to their pages. Children should call `fork`
+        and work on the result, leaving the inherited system untouched.
+
+        :param block_size: Entries per sealed history block
+        :type block_size: int
+        '''
+        self._await_indexes()
+        self.compress_histories(block_size)
+        gc.collect()
+        gc.freeze()
+
+    def _journal_item(self, mapping, key):
+        '''
+        Record the current value of mapping[key] so a rollback can restore it
+        '''
+        self._journal.append((_restore_item, mapping, key, mapping.get(key, _MISSING)))
+
+    def savepoint(self) -> int:
+        '''
+        Start recording an undo journal and return a savepoint to roll back to
+
+        While any savepoint is open every mutation appends its inverse to the
+        journal, so rolling back costs O(operations since the savepoint).
+        Events already published to the change feed are not retracted.
+
+        :return: Savepoint handle for `rollback` and `release`
+        :rtype: int
+        '''
+        if self.history_tier is not None:
+            raise ValueError("savepoints need in-memory balance histories")
+        self._await_indexes()
+        if self._journal is None:
+            self._journal = []
+        self._savepoints.append({
+            "journal": len(self._journal),
+            "payment_counter": self.payment_counter,
+            "clock": self.clock,
+            "settled_through": self._settled_through,
+            "total_balance": self.total_balance,
+            "total_outgoing": self.total_outgoing,
+            "total_balance_history": (len(self.total_balance_history), self.total_balance_history[-1:]),
+            "total_outgoing_history": (len(self.total_outgoing_history), self.total_outgoing_history[-1:]),
+            "outgoing_changes": len(self.outgoing_change_ts),
+            "spending_checkpoints": len(self.spending_checkpoints),
+        })
+        return len(self._savepoints) - 1
+
+    def rollback(self, savepoint: int):
+        '''
+        Undo every change made since `savepoint`; the savepoint stays open and
+        any savepoints taken after it are discarded
+
+        :param savepoint: Handle returned by `savepoint`
+        :type savepoint: int
+        '''
+        if not 0 <= savepoint < len(self._savepoints):
+            raise ValueError(f"unknown savepoint {savepoint}")
+        mark = self._savepoints[savepoint]
+        journal, self._journal = self._journal, None
+        while len(journal) > mark["journal"]:
+            action, *args = journal.pop()
+            action(*args)
+
+        for acc in reversed(self.outgoing_change_accounts[mark["outgoing_changes"]:]):
+            history = self.outgoing_history[acc]
+            history.pop()
+            if not history:
+                del self.outgoing_history[acc]
+        del self.outgoing_change_ts[mark["outgoing_changes"]:]
+        del self.outgoing_change_accounts[mark["outgoing_changes"]:]
+        del self.spending_checkpoints[mark["spending_checkpoints"]:]
+        for name in ("total_balance_history", "total_outgoing_history"):
+            length, last = mark[name]
+            history = getattr(self, name)
+            del history[length:]
+            history[length - len(last):] = last
+        self.payment_counter = mark["payment_counter"]
+        self.clock = mark["clock"]
+        self._settled_through = mark["settled_through"]
+        self.total_balance = mark["total_balance"]
+        self.total_outgoing = mark["total_outgoing"]
+        if self.shared_balances is not None:
+            self._mirror(*self.account_handles)
+            self.shared_balances.truncate(len(self.account_names))
+
+        self._journal = journal
+        del self._savepoints[savepoint + 1:]
+
+    def release(self, savepoint: int):
+        '''
+        Keep every change made since `savepoint` and close it along with any
+        later savepoints; journaling stops once no savepoint is open
+
+        :param savepoint: Handle returned by `savepoint`
+        :type savepoint: int
+        '''
+        if not 0 <= savepoint < len(self._savepoints):
+            raise ValueError(f"unknown savepoint {savepoint}")
+        del self._savepoints[savepoint:]
+        if not self._savepoints:
+            self._journal = None
+
+    def memory_report(self, sample_size: int = 1_000, top_n: int = 10, seed: int | None = None) -> dict:
+        '''
+        Estimate the memory held by each internal structure
+
+        Per-structure sizes come from deep-sizing up to `sample_size` randomly
+        chosen entries and extrapolating to the rest, so the cost is bounded by
+        the sample rather than the state size. Finding the longest histories is
+        a single pass over the history lengths; pass `top_n=0` to skip it.
+
+        :param sample_size: Maximum number of entries deep-sized per structure
+        :type sample_size: int
+        :param top_n: Number of accounts with the longest balance history to report
+        :type top_n: int
+        :param seed: Random seed for reproducible sampling
+        :type seed: int | None
+        :return: {"structures": {name: {"entries", "bytes", "sampled"}}, "total_bytes", "top_history"}
+        :rtype: dict
+        '''
+        self._await_indexes()
+        rng = random.Random(seed)
+        history = self.history_tier.hot_tails if self.history_tier is not None else self.balance_history
+        structures = {
+            "balances": self.balances,
+            "outgoing": self.outgoing,
+            "balance_history": history,
+            "payments": self.payments,
+            "merged_time": self.merged_time,
+            "cashback": self.cashback,
+            "sorted_outgoing": self.sorted_outgoing,
+            "outgoing_key_map": self.outgoing_key_map,
+            "sorted_accounts": self.sorted_accounts,
+            "outgoing_history": self.outgoing_history,
+            "pending_cashback": self.pending_cashback,
+            "transactions": self.transactions,
+            "settled_payments": self.settled_payments,
+            "spend_windows": self.spend_windows,
+        }
+        report = {name: estimate_container(container, sample_size, rng) for name, container in structures.items()}
+        top_history = []
+        if top_n > 0:
+            top_history = heapq.nlargest(top_n, ((len(h), acc) for acc, h in history.items()))
+        return {
+            "structures": report,
+            "total_bytes": sum(entry["bytes"] for entry in report.values()),
+            "top_history": [(acc, length) for length, acc in top_history],
+        }
+
+    def compress_histories(self, block_size: int = 256) -> int:
+        '''
+        Re-encode every plain-list balance history longer than one block as a
+        CompressedHistory
+
+        :param block_size: Entries per sealed block
+        :type block_size: int
+        :return: Number of histories converted
+        :rtype: int
+        '''
+        if self.history_tier is not None:
+            return 0
+        converted = 0
+        for acc, history in self.balance_history.items():
+            if type(history) is list and len(history) >= block_size:
+                self.balance_history[acc] = CompressedHistory(history, block_size)
+                converted += 1
+        return converted
+
+    def advance_time(self, timestamp: int, limit: int | None = 1_000) -> bool:
+        '''
+        Move the virtual clock forward to `timestamp` and settle cashbacks due
+        by then, at most `limit` of them per call
+
+        A scheduler can call this between requests or on a timer, repeating
+        while it returns False, so that requests at or before the clock find
+        nothing left to settle. Refunds are recorded at their own refund
+        timestamps either way, so results are the same as settling them on the
+        request path; a request past the settled point still settles the rest
+        first. The clock must not run ahead of requests still to come.
+
+        :param timestamp: New clock time; an earlier time leaves the clock where it is
+        :type timestamp: int
+        :param limit: Maximum number of cashbacks to settle, or None for all
+        :type limit: int | None
+        :return: True once every cashback due by the clock is settled
+        :rtype: bool
+        '''
+        self.clock = max(self.clock, timestamp)
+        return self._process_cashbacks(self.clock, limit)
+
+    def tick(self, limit: int | None = 1_000) -> bool:
+        '''
+        Settle the next chunk of cashbacks due by the clock, then apply the
+        history retention policy and `compact_accounts` to the next chunk of
+        accounts
+
+        :param limit: Maximum number of cashbacks to settle and of accounts to visit, or None for all
+        :type limit: int | None
+        :return: True once every cashback due by the clock is settled and the
+            current retention and compaction passes are complete
+        :rtype: bool
+        '''
+        if not self._process_cashbacks(self.clock, limit):
+            return False
+        retained = self.apply_retention(self.clock, limit)
+        compacted = self.compact_accounts(self.clock, limit)
+        return retained and compacted
+
+    def apply_retention(self, timestamp: int, max_accounts: int | None = 1_000) -> bool:
+        '''
+        Downsample balance history older than the retention horizon to the
+        last entry of each bucket, for the next `max_accounts` accounts
+
+        Accounts are visited in passes. Only whole buckets before the one
+        holding `timestamp - history_retention_ms` are downsampled, and each
+        account's first entry is kept, so `get_balance` stays exact within
+        the horizon and reports end-of-bucket balances before it. Entries
+        downsampled by an earlier pass are not scanned again. Histories not
+        materialized from a lazy snapshot or fork are skipped, and nothing is
+        done while a savepoint is open.
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param max_accounts: Maximum number of accounts to visit, or None for all
+        :type max_accounts: int | None
+        :return: True once the current pass over all accounts is complete
+        :rtype: bool
+        '''
+        if self.history_retention_ms is None or self.history_tier is not None or self._savepoints:
+            return True
+        bucket = self.history_bucket_ms
+        cutoff = (timestamp - self.history_retention_ms) // bucket * bucket
+        queue = self._retention_queue
+        if not queue:
+            queue.extend(self.balance_history)
+        count = len(queue) if max_accounts is None else min(max_accounts, len(queue))
+        for _ in range(count):
+            acc = queue.popleft()
+            history = self.balance_history.get(acc)
+            if history is not None:
+                self._downsample_history(acc, history, cutoff)
+        return not queue
+
+    def _downsample_history(self, acc: str, history, cutoff: int):
+        '''
+        Keep only the first entry and the last entry of each bucket among the
+        entries of `history` before `cutoff`
+
+        :param acc: Account identifier
+        :type acc: str
+        :param history: The account's balance history
+        :param cutoff: Bucket-aligned timestamp before which entries are downsampled
+        :type cutoff: int
+        '''
+        bucket = self.history_bucket_ms
+        held, done = self._downsampled.get(acc, (None, 0))
+        if held is not history:
+            done = 0
+        end = bisect.bisect_left(history, cutoff, lo=done, key=lambda entry: entry[0])
+        segment = history[done:end]
+        kept = [entry for entry, following in zip(segment, segment[1:]) if entry[0] // bucket != following[0] // bucket]
+        kept.extend(segment[-1:])
+        if done == 0 and segment and kept[0] is not segment[0]:
+            kept.insert(0, segment[0])
+        if len(kept) < len(segment):
+            if type(history) is list:
+                history[done:end] = kept
+            else:
+                history.replace(done, end, kept)
+            if self._dirty is not None:
+                self._mark_dirty(acc)
+                self._dirty[acc][0].pop("balance_history", None)  # the prefix changed, so write it whole
+        self._downsampled[acc] = (history, done + len(kept))
+
+    def compact_accounts(self, timestamp: int, max_accounts: int | None = 1_000) -> bool:
+        '''
+        Reclaim memory from settled payments and merged accounts, for the next
+        `max_accounts` accounts
+
+        Payments whose cashback was received are dropped from `payments` and
+        remembered as ordinals in a sorted array per account, which is all
+        `get_payment_status` needs. The balance histories of accounts merged
+        away, which can no longer grow, are folded into sealed compressed
+        blocks; when a retention horizon is configured this waits until the
+        merge is behind it, and the history is first downsampled to the last
+        entry of each bucket. `get_balance` before the merge keeps answering
+        as `apply_retention` describes. Accounts are visited in passes, and
+        nothing is done while a savepoint is open.
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param max_accounts: Maximum number of accounts to visit, or None for all
+        :type max_accounts: int | None
+        :return: True once the current pass over all accounts is complete
+        :rtype: bool
+        '''
+        if self._savepoints or self.history_tier is not None:
+            return True
+        horizon = None if self.history_retention_ms is None else timestamp - self.history_retention_ms
+        queue = self._compaction_queue
+        if not queue:
+            queue.extend(self.balance_history)
+        count = len(queue) if max_accounts is None else min(max_accounts, len(queue))
+        for _ in range(count):
+            acc = queue.popleft()
+            merged_at = self.merged_time.get(acc)
+            if merged_at is not None:
+                if horizon is None or merged_at < horizon:
+                    self._fold_merged(acc, downsample=horizon is not None)
+            elif self.payments.get(acc):
+                self._compact_payments(acc)
+        return not queue
+
+    def _compact_payments(self, acc: str):
+        '''
+        Move an account's settled payments from `payments` to `settled_payments`
+
+        :param acc: Account identifier
+        :type acc: str
+        '''
+        acc_payments = self.payments[acc]
+        settled = [name for name, info in acc_payments.items() if info["status"] == "CASHBACK_RECEIVED"]
+        if not settled:
+            return
+        reclaimed = sys.getsizeof(acc_payments)
+        for name in settled:
+            reclaimed += sys.getsizeof(name) + sys.getsizeof(acc_payments[name])
+        remaining = self.payments[acc] = {name: info for name, info in acc_payments.items()
+                                          if info["status"] != "CASHBACK_RECEIVED"}
+        reclaimed -= sys.getsizeof(remaining)
+        ordinals = sorted(int(name[len("payment"):]) for name in settled)
+        existing = self.settled_payments.get(acc)
+        if existing is None:
+            merged = array("q", ordinals)
+        else:
+            reclaimed += sys.getsizeof(existing)
+            merged = array("q", heapq.merge(existing, ordinals))
+        self.settled_payments[acc] = merged
+        reclaimed -= sys.getsizeof(merged)
+        if self._dirty is not None:
+            self._mark_dirty(acc)
+            self._dirty[acc][2] = None
+        self._compaction["payments_compacted"] += len(settled)
+        self._compaction["bytes_reclaimed"] += reclaimed
+
+    def _fold_merged(self, acc: str, downsample: bool):
+        '''
+        Encode the balance history of an account merged away as sealed
+        compressed blocks, keeping only the first entry and the last entry of
+        each bucket when `downsample` is set; histories left too short to
+        gain from encoding stay plain lists
+
+        :param acc: Account identifier
+        :type acc: str
+        :param downsample: Whether the whole history is past the retention horizon
+        :type downsample: bool
+        '''
+        history = self.balance_history.get(acc)
+        if history is None or (type(history) is not list and history.sealed):
+            return
+        reclaimed = deep_sizeof(history)
+        if downsample:
+            bucket = self.history_bucket_ms
+            self._downsample_history(acc, history, (self.merged_time[acc] // bucket + 1) * bucket)
+        if type(history) is list:
+            if len(history) < _FOLD_MIN_ENTRIES:
+                return
+            history = self.balance_history[acc] = CompressedHistory(history)
+        history.seal()
+        if self._dirty is not None:
+            self._mark_dirty(acc)
+            self._dirty[acc][0].pop("balance_history", None)
+        self._compaction["histories_folded"] += 1
+        self._compaction["bytes_reclaimed"] += reclaimed - deep_sizeof(history)
+
+    def compaction_metrics(self) -> dict:
+        '''
+        Return counts of payments compacted and merged histories folded by
+        `compact_accounts`, with the estimated bytes reclaimed
+        '''
+        return dict(self._compaction)
+
+    def _process_cashbacks(self, timestamp: int, limit: int | None = None) -> bool:
         '''
         Docstring for _process_cashbacks
 
+        Returns at once when everything due by `timestamp` has already been
+        settled, e.g. by `advance_time`.
+
         :param timestamp: The current timestamp. All payments with refund_ts <= timestamp are refunded
         :type timestamp: int
+        :param limit: Maximum number of cashbacks to settle, or None for all
+        :type limit: int | None
+        :return: True once every cashback due by `timestamp` is settled
+        :rtype: bool
         '''
+        if timestamp <= self._settled_through:
+            return True
+        if self.history_tier is not None:
+            self.history_tier.advance(timestamp)
+        if self._index_loader is not None:
+            if self._snapshot_refund_ts is None or timestamp < self._snapshot_refund_ts:
+                return True
+            self._await_indexes()
+        settled = 0
         while self.cashback and self.cashback[0][0] <= timestamp:
-            refund_ts, acc, name = self.cashback.popleft() # pop from the front of the queue 
+            if settled == limit:
+                return False
+            settled += 1
+            item = self.cashback.popleft() # pop from the front of the queue 
+            refund_ts, acc, name = item
+            if self._journal is not None:
+                self._journal.append((self.cashback.appendleft, item))
+            if self._snapshot is not None:
+                self._fault_in(acc)
             acc_payments = self.payments.get(acc)
             if acc_payments:
                 info = acc_payments.get(name)
 
                 if info["status"] == "IN_PROGRESS":
+                    if self._dirty is not None:
+                        self._mark_paid(acc, name)
+                    if self._journal is not None:
+                        self._journal_item(info, "status")
+                        self._journal_item(self.pending_cashback, acc)
                     if acc in self.balances:
+                        if self._journal is not None:
+                            self._journal_item(self.balances, acc)
+                            self._journal.append((self.balance_history[acc].pop,))
+                            if self.transaction_log:
+                                self._journal.append((self.transactions[acc].pop,))
                         self.balances[acc] += info["cashback"]
                         self.balance_history[acc].append((info["refund_ts"], self.balances[acc]))
+                        if self.transaction_log:
+                            self.transactions[acc].append(
+                                (info["refund_ts"], txlog.CASHBACK, info["cashback"], int(name[len("payment"):])))
+                        if self.total_history:
+                            self._record_totals(info["refund_ts"], info["cashback"], 0)
+                        if self.change_feed is not None:
+                            self.change_feed.emit(cdc.CASHBACK, info["refund_ts"], acc, info["cashback"],
+                                                  self.balances[acc], name)
+                        if self.shared_balances is not None:
+                            self._mirror(acc)
                     info["status"] = "CASHBACK_RECEIVED"
+                    pending = self.pending_cashback[acc]
+                    if self._journal is not None:
+                        self._journal_item(pending, "total")
+                        self._journal_item(pending, "count")
+                        self._journal.append((pending["refunds"].appendleft, pending["refunds"][0]))
+                    pending["total"] -= info["cashback"]
+                    pending["count"] -= 1
+                    pending["refunds"].popleft()
+                    if not pending["count"]:
+                        del self.pending_cashback[acc]
+        self._settled_through = timestamp
+        return True
+
     def _remove_from_sorted(self, acc: str):
         '''
         Remove an account's outgoing spending entry from the sorted structure
@@ -43,12 +1002,14 @@ class BankingSystemImpl(BankingSystem):
         :param acc: Account identifier whose entry should be removed
         :type acc: str
         '''
+        if self._index_loader is not None:
+            self._await_indexes()
         key = self.outgoing_key_map.pop(acc, None)
         if key is None:
             return
-        idx = bisect.bisect_left(self.sorted_outgoing, key)
-        if idx < len(self.sorted_outgoing) and self.sorted_outgoing[idx] == key:
-            self.sorted_outgoing.pop(idx)
+        if self._journal is not None:
+            self._journal.append((self._restore_sorted, acc, key))
+        sorted_remove(self.sorted_outgoing, key)
 
     def _insert_into_sorted(self, acc: str):
         '''
@@ -57,10 +1018,47 @@ class BankingSystemImpl(BankingSystem):
         :param acc: Account identifier to be inserted
         :type acc: str
         '''
+        if self._index_loader is not None:
+            self._await_indexes()
         key = (-self.outgoing[acc], acc)
-        bisect.insort(self.sorted_outgoing, key)
+        sorted_insert(self.sorted_outgoing, key)
+        self.outgoing_key_map[acc] = key
+        if self._journal is not None:
+            self._journal.append((self._remove_from_sorted, acc))
+
+    def _restore_sorted(self, acc: str, key: tuple):
+        '''
+        Undo journal action: put back a ranking entry removed by _remove_from_sorted
+
+        :param acc: Account identifier
+        :type acc: str
+        :param key: The (-outgoing, acc) key that was removed
+        :type key: tuple
+        '''
+        sorted_insert(self.sorted_outgoing, key)
         self.outgoing_key_map[acc] = key
 
+    def _index_account(self, acc: str):
+        '''
+        Add a live account to the sorted account-id index
+
+        :param acc: Account identifier
+        :type acc: str
+        '''
+        sorted_insert(self.sorted_accounts, acc)
+        if self._journal is not None:
+            self._journal.append((self._unindex_account, acc))
+
+    def _unindex_account(self, acc: str):
+        '''
+        Remove an account from the sorted account-id index
+
+        :param acc: Account identifier
+        :type acc: str
+        '''
+        if sorted_remove(self.sorted_accounts, acc) and self._journal is not None:
+            self._journal.append((self._index_account, acc))
+
     def _update_sorted_outgoing(self, acc: str):
         '''
         Update an account’s outgoing spending ranking after any spending change
@@ -73,6 +1071,297 @@ class BankingSystemImpl(BankingSystem):
             return
         self._remove_from_sorted(acc)
         self._insert_into_sorted(acc)
+    def _record_totals(self, timestamp: int, balance_delta: int, outgoing_delta: int):
+        '''
+        Apply a change to the system-wide balance and outgoing totals and
+        record the new values, keeping one entry per timestamp; callers skip
+        it unless the system keeps `total_history`
+
+        :param timestamp: Timestamp of the change
+        :type timestamp: int
+        :param balance_delta: Money added to (or removed from) the system
+        :type balance_delta: int
+        :param outgoing_delta: Amount added to total outgoing
+        :type outgoing_delta: int
+        '''
+        if self._index_loader is not None:
+            # totals are still being restored in the background
+            self._deferred_totals.append((timestamp, balance_delta, outgoing_delta))
+            return
+        if balance_delta:
+            self.total_balance += balance_delta
+            history = self.total_balance_history
+            if history and history[-1][0] == timestamp:
+                history[-1] = (timestamp, self.total_balance)
+            else:
+                history.append((timestamp, self.total_balance))
+        if outgoing_delta:
+            self.total_outgoing += outgoing_delta
+            history = self.total_outgoing_history
+            if history and history[-1][0] == timestamp:
+                history[-1] = (timestamp, self.total_outgoing)
+            else:
+                history.append((timestamp, self.total_outgoing))
+
+    def total_balance_at(self, timestamp: int, time_at: int) -> int | None:
+        '''
+        Return the total money held by all accounts at a historical timestamp
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param time_at: Historical timestamp to check
+        :type time_at: int
+        :return: Sum of all account balances at that time, or None if the system was built
+            without `total_history`
+        :rtype: int | None
+        '''
+        self._process_cashbacks(timestamp)
+        if not self.total_history:
+            return None
+        self._await_indexes()
+        history = self.total_balance_history
+        idx = bisect.bisect_right(history, time_at, key=lambda entry: entry[0])
+        return history[idx - 1][1] if idx else 0
+
+    def total_outgoing_at(self, timestamp: int, time_at: int) -> int | None:
+        '''
+        Return the total outgoing of all accounts at a historical timestamp
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param time_at: Historical timestamp to check
+        :type time_at: int
+        :return: Sum of all money transferred out or paid by that time, or None if the system was built
+            without `total_history`
+        :rtype: int | None
+        '''
+        self._process_cashbacks(timestamp)
+        if not self.total_history:
+            return None
+        self._await_indexes()
+        history = self.total_outgoing_history
+        idx = bisect.bisect_right(history, time_at, key=lambda entry: entry[0])
+        return history[idx - 1][1] if idx else 0
+
+    def _mirror(self, *accounts: str):
+        '''
+        Publish the current balance and outgoing total of accounts to the shared
+        balance mirror, or clear their slots if they no longer exist
+        '''
+        self._await_indexes()
+        if self._snapshot is not None:
+            self._fault_in(*accounts)
+        mirror = self.shared_balances
+        for acc in accounts:
+            if acc in self.balances:
+                mirror.publish(self.account_handles[acc], acc, self.balances[acc], self.outgoing[acc])
+            else:
+                mirror.clear(self.account_handles[acc])
+
+    def _spend_limit_of(self, window: SpendWindow | None) -> int | None:
+        if window is not None and window.limit is not None:
+            return window.limit
+        return self.spend_limit
+
+    def _spend_allowed(self, timestamp: int, acc: str, amount: int) -> bool:
+        '''
+        Check an outgoing amount against the account's rolling-window spend limit
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param acc: Paying account
+        :type acc: str
+        :param amount: Amount about to leave the account
+        :type amount: int
+        :rtype: bool
+        '''
+        window = self.spend_windows.get(acc)
+        limit = self._spend_limit_of(window)
+        if limit is None:
+            return True
+        return (0 if window is None else window.spent(timestamp)) + amount <= limit
+
+    def _record_spend(self, timestamp: int, acc: str, amount: int):
+        '''
+        Add an accepted outgoing amount to the account's spend window; under a
+        savepoint the window is replaced by an updated copy so it can be put back
+        '''
+        window = self.spend_windows.get(acc)
+        if window is None:
+            window = SpendWindow(self.spend_window_ms, self.spend_buckets)
+        elif self._journal is not None:
+            window = window.copy()
+        else:
+            window.add(timestamp, amount)
+            return
+        if self._journal is not None:
+            self._journal_item(self.spend_windows, acc)
+        window.add(timestamp, amount)
+        self.spend_windows[acc] = window
+
+    def _record_outgoing(self, timestamp: int, acc: str):
+        '''
+        Append the current outgoing total of an account, or None once it has
+        been merged away, to its outgoing history and the global change log
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param acc: Account whose outgoing total changed
+        :type acc: str
+        '''
+        if self._index_loader is not None:
+            self._await_indexes()
+        history = self.outgoing_history.get(acc)
+        if history is None:
+            history = self.outgoing_history[acc] = []
+        history.append((timestamp, self.outgoing.get(acc)))
+        change_ts = self.outgoing_change_ts
+        change_ts.append(timestamp)
+        self.outgoing_change_accounts.append(acc)
+        checkpoints = self.spending_checkpoints
+        last = checkpoints[-1][0] if checkpoints else 0
+        if len(change_ts) - last >= self.spending_checkpoint_interval:
+            self._checkpoint_spending()
+
+    def _checkpoint_spending(self):
+        '''
+        Store the outgoing totals changed since the previous checkpoint as of
+        the end of the change log, with None for accounts merged away
+
+        Every so often the checkpoint holds the totals of all live accounts
+        instead: once the changes stored since the last full checkpoint add
+        up to its size. Full checkpoints therefore never take more memory
+        than the changes between them.
+        '''
+        checkpoints = self.spending_checkpoints
+        position = len(self.outgoing_change_ts)
+        previous = checkpoints[-1][0] if checkpoints else 0
+        touched = set(self.outgoing_change_accounts[previous:position])
+        if self._snapshot is not None:
+            self._fault_in(*touched)
+        values = {acc: self.outgoing_history[acc][-1][1] for acc in touched}
+        full = len(checkpoints) - 1
+        since = len(values)
+        while full >= 0 and not checkpoints[full][2]:
+            since += len(checkpoints[full][1])
+            full -= 1
+        if full >= 0 and since < len(checkpoints[full][1]):
+            checkpoints.append((position, values, False))
+            return
+        state = self._spending_state(full, len(checkpoints) - 1)
+        state.update(values)
+        checkpoints.append((position, {acc: value for acc, value in state.items() if value is not None}, True))
+
+    def _spending_state(self, full: int, last: int) -> dict:
+        '''
+        Return the outgoing totals stored by the full checkpoint at index
+        `full` overridden by the changes stored up to index `last`, with None
+        for accounts merged away since the full checkpoint
+
+        :param full: Index of a full checkpoint, or -1 to start from nothing
+        :type full: int
+        :param last: Index of the last checkpoint to apply
+        :type last: int
+        :rtype: dict
+        '''
+        state = dict(self.spending_checkpoints[full][1]) if full >= 0 else {}
+        for index in range(full + 1, last + 1):
+            state.update(self.spending_checkpoints[index][1])
+        return state
+
+    def spender_rank(self, timestamp: int, account_id: str) -> int | None:
+        '''
+        Return the 1-based position of an account in the top_spenders ordering
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param account_id: Account being queried
+        :type account_id: str
+        :return: Rank of the account or None if it does not exist
+        :rtype: int | None
+        '''
+        self._process_cashbacks(timestamp)
+        self._await_indexes()
+        key = self.outgoing_key_map.get(account_id)
+        if key is None:
+            return None
+        return sorted_position(self.sorted_outgoing, key) + 1
+
+    def spenders_above(self, timestamp: int, threshold: int) -> int:
+        '''
+        Count the accounts whose total outgoing is strictly greater than `threshold`
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param threshold: Outgoing amount to compare against
+        :type threshold: int
+        :return: Number of accounts above the threshold
+        :rtype: int
+        '''
+        self._process_cashbacks(timestamp)
+        self._await_indexes()
+        # (-threshold, "") sorts before every key with outgoing == threshold
+        return sorted_position(self.sorted_outgoing, (-threshold, ""))
+
+    def top_spenders_page(self, timestamp: int, offset: int, limit: int) -> list[str]:
+        '''
+        Return one page of the top_spenders ordering
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param offset: Number of leading accounts to skip
+        :type offset: int
+        :param limit: Maximum number of accounts to return
+        :type limit: int
+        :return: A list of formatted strings that sorted by spending
+        :rtype: list[str]
+        '''
+        self._process_cashbacks(timestamp)
+        self._await_indexes()
+        return [f"{acc}({-neg_outgoing})" for neg_outgoing, acc in self.sorted_outgoing[offset:offset + limit]]
+
+    def top_spenders_at(self, timestamp: int, n: int, time_at: int) -> list[str]:
+        '''
+        Return the top-N spenders as they stood at a past timestamp
+
+        Starts from the latest full spending checkpoint at or before
+        `time_at`, applies the changes stored by the checkpoints after it and
+        then only the accounts changed between the last of those and `time_at`.
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param n: Number of accounts to return
+        :type n: int
+        :param time_at: Historical timestamp to rank at
+        :type time_at: int
+        :return: A list of formatted strings that sorted by spending
+        :rtype: list[str]
+        '''
+        self._process_cashbacks(timestamp)
+        self._await_indexes()
+        end = bisect.bisect_right(self.outgoing_change_ts, time_at)
+        checkpoints = self.spending_checkpoints
+        checkpoint = bisect.bisect_right(checkpoints, end, key=lambda cp: cp[0]) - 1
+        position = checkpoints[checkpoint][0] if checkpoint >= 0 else 0
+        full = checkpoint
+        while full >= 0 and not checkpoints[full][2]:
+            full -= 1
+        state = checkpoints[full][1] if full >= 0 else {}
+        changed = {}
+        for index in range(full + 1, checkpoint + 1):
+            changed.update(checkpoints[index][1])
+        touched = set(self.outgoing_change_accounts[position:end])
+        if self._snapshot is not None:
+            self._fault_in(*touched)
+        for acc in touched:
+            history = self.outgoing_history[acc]
+            idx = bisect.bisect_right(history, time_at, key=lambda entry: entry[0])
+            changed[acc] = history[idx - 1][1]
+        candidates = [(-value, acc) for acc, value in state.items() if acc not in changed]
+        candidates.extend((-value, acc) for acc, value in changed.items() if value is not None)
+        return [f"{acc}({-neg_outgoing})" for neg_outgoing, acc in heapq.nsmallest(n, candidates)]
+
+    @idempotent
     def create_account(self, timestamp: int, account_id: str) -> bool:
         '''
         Create a new account with zero initial balance
@@ -85,8 +1374,17 @@ class BankingSystemImpl(BankingSystem):
         :rtype: bool
         '''
         self._process_cashbacks(timestamp)
+        if self._snapshot is not None:
+            self._fault_in(account_id)
         if account_id in self.balances:
             return False
+        if self._dirty is not None:
+            self._mark_dirty(account_id)
+
+        if self._journal is not None:
+            for structure in (self.merged_time, self.balances, self.outgoing, self.payments, self.balance_history,
+                              self.transactions):
+                self._journal_item(structure, account_id)
 
         if account_id in self.merged_time:
             del self.merged_time[account_id]
@@ -94,11 +1392,29 @@ class BankingSystemImpl(BankingSystem):
         self.balances[account_id] = 0
         self.outgoing[account_id] = 0
         self.payments[account_id] = {}
-        self.balance_history[account_id] = [(timestamp, 0)]
+        if self.history_block_size is None:
+            self.balance_history[account_id] = [(timestamp, 0)]
+        else:
+            self.balance_history[account_id] = CompressedHistory([(timestamp, 0)], self.history_block_size)
+        if self.transaction_log:
+            self.transactions[account_id] = TransactionLog()
         self._insert_into_sorted(account_id)
+        self._index_account(account_id)
+        if account_id not in self.account_handles:
+            self.account_handles[account_id] = len(self.account_names)
+            self.account_names.append(account_id)
+            if self._journal is not None:
+                self._journal.append((_restore_item, self.account_handles, account_id, _MISSING))
+                self._journal.append((self.account_names.pop,))
+        self._record_outgoing(timestamp, account_id)
+        if self.change_feed is not None:
+            self.change_feed.emit(cdc.CREATE, timestamp, account_id, 0, 0)
+        if self.shared_balances is not None:
+            self._mirror(account_id)
         return True
 
 
+    @idempotent
     def deposit(self, timestamp: int, account_id: str, amount: int) -> int | None:
         '''
         Deposit an amount into an account
@@ -113,12 +1429,86 @@ class BankingSystemImpl(BankingSystem):
         :rtype: int | None
         '''
         self._process_cashbacks(timestamp)
+        if self._snapshot is not None:
+            self._fault_in(account_id)
         if account_id not in self.balances:
             return None
+        if self._dirty is not None:
+            self._mark_dirty(account_id)
+        if self._journal is not None:
+            self._journal_item(self.balances, account_id)
+            self._journal.append((self.balance_history[account_id].pop,))
+            if self.transaction_log:
+                self._journal.append((self.transactions[account_id].pop,))
         self.balances[account_id] += amount
         self.balance_history[account_id].append((timestamp, self.balances[account_id]))
+        if self.transaction_log:
+            self.transactions[account_id].append((timestamp, txlog.DEPOSIT, amount, NO_REF))
+        if self.total_history:
+            self._record_totals(timestamp, amount, 0)
+        if self.change_feed is not None:
+            self.change_feed.emit(cdc.DEPOSIT, timestamp, account_id, amount, self.balances[account_id])
+        if self.shared_balances is not None:
+            self._mirror(account_id)
         return self.balances[account_id]
 
+    @idempotent
+    def deposit_many(self, timestamp: int, items) -> list[int | None]:
+        '''
+        Deposit into many accounts at one timestamp, e.g. a payroll run
+
+        Cashbacks are processed once for the whole batch. Items are applied in
+        order, so repeated accounts accumulate exactly as with sequential
+        `deposit` calls.
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param items: Iterable of (account_id, amount) pairs
+        :return: Updated balance per item, None where the account was not found
+        :rtype: list[int | None]
+        '''
+        self._process_cashbacks(timestamp)
+        items = list(items)
+        if self._snapshot is not None:
+            self._fault_in(*(acc for acc, _ in items))
+        balances = self.balances
+        balance_history = self.balance_history
+        transactions = self.transactions if self.transaction_log else None
+        journal = self._journal
+        dirty = self._dirty
+        results = []
+        append = results.append
+        deposited = 0
+        for acc, amount in items:
+            balance = balances.get(acc)
+            if balance is None:
+                append(None)
+                continue
+            if dirty is not None and acc not in dirty:
+                self._mark_dirty(acc)
+            if journal is not None:
+                journal.append((_restore_item, balances, acc, balance))
+                journal.append((balance_history[acc].pop,))
+                if transactions is not None:
+                    journal.append((transactions[acc].pop,))
+            balance += amount
+            balances[acc] = balance
+            balance_history[acc].append((timestamp, balance))
+            if transactions is not None:
+                transactions[acc].append((timestamp, txlog.DEPOSIT, amount, NO_REF))
+            append(balance)
+            deposited += amount
+        if self.total_history:
+            self._record_totals(timestamp, deposited, 0)
+        if self.change_feed is not None:
+            for (acc, amount), balance in zip(items, results):
+                if balance is not None:
+                    self.change_feed.emit(cdc.DEPOSIT, timestamp, acc, amount, balance)
+        if self.shared_balances is not None:
+            self._mirror(*{acc for acc, _ in items if acc in balances})
+        return results
+
+    @idempotent
     def transfer(self, timestamp: int, source: str, target: str, amount: int) -> int | None:
         '''
         Transfer funds from one account to another
@@ -135,17 +1525,119 @@ class BankingSystemImpl(BankingSystem):
         :rtype: int | None
         '''
         self._process_cashbacks(timestamp)
+        if self._snapshot is not None:
+            self._fault_in(source, target)
         if (source not in self.balances or target not in self.balances or
                 source == target or self.balances[source] < amount):
             return None
+        if self.spend_window_ms is not None and not self._spend_allowed(timestamp, source, amount):
+            return None
+        if self._dirty is not None:
+            self._mark_dirty(source, target)
+        if self._journal is not None:
+            for acc in (source, target):
+                self._journal_item(self.balances, acc)
+                self._journal.append((self.balance_history[acc].pop,))
+                if self.transaction_log:
+                    self._journal.append((self.transactions[acc].pop,))
+            self._journal_item(self.outgoing, source)
         self.balances[source] -= amount
         self.balances[target] += amount
         self.outgoing[source] += amount
         self._update_sorted_outgoing(source)
+        self._record_outgoing(timestamp, source)
+        if self.total_history:
+            self._record_totals(timestamp, 0, amount)
+        if self.spend_window_ms is not None:
+            self._record_spend(timestamp, source, amount)
         self.balance_history[source].append((timestamp, self.balances[source]))
         self.balance_history[target].append((timestamp, self.balances[target]))
+        if self.transaction_log:
+            self.transactions[source].append((timestamp, txlog.TRANSFER_OUT, -amount, self.account_handles[target]))
+            self.transactions[target].append((timestamp, txlog.TRANSFER_IN, amount, self.account_handles[source]))
+        if self.change_feed is not None:
+            self.change_feed.emit(cdc.TRANSFER_OUT, timestamp, source, amount, self.balances[source], target)
+            self.change_feed.emit(cdc.TRANSFER_IN, timestamp, target, amount, self.balances[target], source)
+        if self.shared_balances is not None:
+            self._mirror(source, target)
         return self.balances[source]
 
+    @idempotent
+    def settle_transfers(self, timestamp: int, transfers) -> list[int | None]:
+        '''
+        Settle a clearing batch of transfers at one timestamp by netting
+
+        Funds are checked against each account's netted position rather than
+        transfer by transfer. Partial failure policy:
+          * A transfer with a missing account, or with the same source and
+          target, is rejected on its own.
+          * If an account's netted position would go negative, every transfer
+          out of that account is rejected; netting is then recomputed, since
+          the rejected transfers no longer credit their targets, until every
+          position is covered. The same applies to an account whose gross
+          amount sent would exceed its rolling-window spend limit.
+        Each touched account then gets one balance update and one history
+        entry, and each paying account one ranking update. `outgoing` is
+        credited with the gross amount sent, so `top_spenders` matches
+        applying the accepted transfers one by one.
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param transfers: Iterable of (source, target, amount) triples
+        :return: Per transfer, the source's balance after settlement or None if rejected
+        :rtype: list[int | None]
+        '''
+        self._process_cashbacks(timestamp)
+        transfers = list(transfers)
+        if self._snapshot is not None:
+            self._fault_in(*{acc for source, target, _ in transfers for acc in (source, target)})
+        balances = self.balances
+        valid = [source != target and source in balances and target in balances for source, target, _ in transfers]
+        blocked = set()
+        while True:
+            net, gross = {}, {}
+            for ok, (source, target, amount) in zip(valid, transfers):
+                if ok and source not in blocked:
+                    net[source] = net.get(source, 0) - amount
+                    net[target] = net.get(target, 0) + amount
+                    gross[source] = gross.get(source, 0) + amount
+            short = [acc for acc, delta in net.items() if balances[acc] + delta < 0]
+            if self.spend_window_ms is not None:
+                short.extend(acc for acc, amount in gross.items() if not self._spend_allowed(timestamp, acc, amount))
+            if not short:
+                break
+            blocked.update(short)
+
+        if self._dirty is not None:
+            self._mark_dirty(*net)
+        for acc, delta in net.items():
+            if self._journal is not None:
+                self._journal_item(balances, acc)
+                self._journal.append((self.balance_history[acc].pop,))
+                if self.transaction_log:
+                    self._journal.append((self.transactions[acc].pop,))
+            balances[acc] += delta
+            self.balance_history[acc].append((timestamp, balances[acc]))
+            if self.transaction_log:
+                self.transactions[acc].append((timestamp, txlog.SETTLE, delta, NO_REF))
+            if self.change_feed is not None:
+                self.change_feed.emit(cdc.SETTLE, timestamp, acc, delta, balances[acc])
+        for acc, amount in gross.items():
+            if self._journal is not None:
+                self._journal_item(self.outgoing, acc)
+            self.outgoing[acc] += amount
+            self._update_sorted_outgoing(acc)
+            self._record_outgoing(timestamp, acc)
+            if self.spend_window_ms is not None:
+                self._record_spend(timestamp, acc, amount)
+        if self.total_history:
+            self._record_totals(timestamp, 0, sum(gross.values()))
+        if self.shared_balances is not None:
+            self._mirror(*net)
+        return [balances[source] if ok and source not in blocked else None
+                for ok, (source, _, _) in zip(valid, transfers)]
+
+    @idempotent
     def pay(self, timestamp: int, account_id: str, amount: int) -> str | None:
         '''
         Docstring for pay
@@ -161,16 +1653,37 @@ class BankingSystemImpl(BankingSystem):
         '''
 
         self._process_cashbacks(timestamp)
+        if self._snapshot is not None:
+            self._fault_in(account_id)
         if account_id not in self.balances or self.balances[account_id] < amount:
             return None
+        if self.spend_window_ms is not None and not self._spend_allowed(timestamp, account_id, amount):
+            return None
 
+        if self._dirty is not None:
+            self._mark_dirty(account_id)
+        if self._journal is not None:
+            self._journal_item(self.balances, account_id)
+            self._journal_item(self.outgoing, account_id)
+            self._journal.append((self.balance_history[account_id].pop,))
+            if self.transaction_log:
+                self._journal.append((self.transactions[account_id].pop,))
         self.balances[account_id] -= amount
         self.outgoing[account_id] += amount
         self._update_sorted_outgoing(account_id)
+        self._record_outgoing(timestamp, account_id)
+        if self.total_history:
+            self._record_totals(timestamp, -amount, amount)
+        if self.spend_window_ms is not None:
+            self._record_spend(timestamp, account_id, amount)
         self.balance_history[account_id].append((timestamp, self.balances[account_id]))
 
         self.payment_counter += 1
         name = f"payment{self.payment_counter}"
+        if self.transaction_log:
+            self.transactions[account_id].append((timestamp, txlog.PAY, -amount, self.payment_counter))
+        if self._dirty is not None:
+            self._mark_paid(account_id, name)
         cashback = amount * 2 // 100
         refund_ts = timestamp + 86_400_000  # 24h in ms
         self.payments[account_id][name] = {
@@ -181,9 +1694,85 @@ class BankingSystemImpl(BankingSystem):
 
         # push tuple onto the deque (note that tuples are compared element-by-element from left to right)
         self.cashback.append((refund_ts, account_id, name))
+        if self._journal is not None:
+            self._journal.append((_restore_item, self.payments[account_id], name, _MISSING))
+            self._journal.append((self.cashback.pop,))
+        if self.change_feed is not None:
+            self.change_feed.emit(cdc.PAY, timestamp, account_id, amount, self.balances[account_id], name)
+        if self.shared_balances is not None:
+            self._mirror(account_id)
+
+        pending = self.pending_cashback.get(account_id)
+        if pending is None:
+            pending = self.pending_cashback[account_id] = {"total": 0, "count": 0, "refunds": deque()}
+            if self._journal is not None:
+                self._journal.append((_restore_item, self.pending_cashback, account_id, _MISSING))
+        elif self._journal is not None:
+            self._journal_item(pending, "total")
+            self._journal_item(pending, "count")
+            self._journal.append((pending["refunds"].pop,))
+        pending["total"] += cashback
+        pending["count"] += 1
+        pending["refunds"].append((refund_ts, cashback))
 
         return name
 
+    def get_pending_cashback(self, timestamp: int, account_id: str) -> tuple[int, int] | None:
+        '''
+        Return the cashback still on its way to an account
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param account_id: Account being queried
+        :type account_id: str
+        :return: (total pending cashback, number of pending refunds) or None if the account does not exist
+        :rtype: tuple[int, int] | None
+        '''
+        self._process_cashbacks(timestamp)
+        if self._snapshot is not None:
+            self._fault_in(account_id)
+        if account_id not in self.balances:
+            return None
+        pending = self.pending_cashback.get(account_id)
+        if pending is None:
+            return (0, 0)
+        return (pending["total"], pending["count"])
+
+    def projected_balance(self, timestamp: int, account_id: str, time_at_future: int) -> int | None:
+        '''
+        Project an account's balance at a future time, counting the cashback
+        refunds due by then
+
+        When every pending refund is due by `time_at_future` this is O(1);
+        otherwise only the refunds due by then are visited.
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param account_id: Account being queried
+        :type account_id: str
+        :param time_at_future: Time to project to
+        :type time_at_future: int
+        :return: Projected balance or None if the account does not exist
+        :rtype: int | None
+        '''
+        self._process_cashbacks(timestamp)
+        if self._snapshot is not None:
+            self._fault_in(account_id)
+        if account_id not in self.balances:
+            return None
+        balance = self.balances[account_id]
+        pending = self.pending_cashback.get(account_id)
+        if pending is None:
+            return balance
+        refunds = pending["refunds"]
+        if refunds[-1][0] <= time_at_future:
+            return balance + pending["total"]
+        for refund_ts, cashback in refunds:
+            if refund_ts > time_at_future:
+                break
+            balance += cashback
+        return balance
+
     def get_payment_status(self, timestamp: int, account_id: str, payment: str) -> str | None:
         '''
         Retrieve the status of a previously created payment
@@ -198,9 +1787,74 @@ class BankingSystemImpl(BankingSystem):
         :rtype: str | None
         '''
         self._process_cashbacks(timestamp)
-        if account_id not in self.payments or payment not in self.payments[account_id]:
+        if self._snapshot is not None:
+            self._fault_in(account_id)
+        acc_payments = self.payments.get(account_id)
+        if acc_payments is None:
             return None
-        return self.payments[account_id][payment]["status"]
+        info = acc_payments.get(payment)
+        if info is not None:
+            return info["status"]
+        settled = self.settled_payments.get(account_id)
+        ordinal = payment[len("payment"):]
+        if settled and payment.startswith("payment") and ordinal.isdigit():
+            ordinal = int(ordinal)
+            idx = bisect.bisect_left(settled, ordinal)
+            if idx < len(settled) and settled[idx] == ordinal:
+                return "CASHBACK_RECEIVED"
+        return None
+
+    def list_accounts(self, timestamp: int, prefix: str | None = None, start_after: str | None = None,
+                      limit: int = 100):
+        '''
+        Stream live account ids in id order, optionally restricted to a prefix
+
+        The first id is found by binary search on the sorted id index, so
+        listing k accounts costs O(log n + k). Pass the last id of a page as
+        `start_after` to get the next one. Ids are read a chunk at a time and
+        each chunk resumes after the last id returned, so accounts created or
+        merged while the listing is being consumed may be missed or still
+        listed, but no id is listed twice.
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param prefix: Only list ids starting with this prefix
+        :type prefix: str | None
+        :param start_after: Only list ids after this one
+        :type start_after: str | None
+        :param limit: Maximum number of ids to list
+        :type limit: int
+        :return: Iterator over account ids
+        :rtype: Iterator[str]
+        '''
+        self._process_cashbacks(timestamp)
+        self._await_indexes()
+        ids = self.sorted_accounts
+        lo = 0 if prefix is None else sorted_position(ids, prefix)
+        if start_after is not None:
+            lo = max(lo, sorted_position(ids, start_after, right=True))
+        listing = self._walk_accounts(lo, limit)
+        if prefix is None:
+            return listing
+        return itertools.takewhile(lambda acc: acc.startswith(prefix), listing)
+
+    def _walk_accounts(self, lo: int, limit: int):
+        '''
+        Yield up to `limit` ids of the sorted id index from position `lo`,
+        finding the position again after each chunk in case it changed
+
+        :param lo: Position of the first id
+        :type lo: int
+        :param limit: Maximum number of ids
+        :type limit: int
+        '''
+        while limit > 0:
+            chunk = list(sorted_range(self.sorted_accounts, lo, lo + min(limit, _LISTING_CHUNK)))
+            if not chunk:
+                return
+            yield from chunk
+            limit -= len(chunk)
+            lo = sorted_position(self.sorted_accounts, chunk[-1], right=True)
 
     def top_spenders(self, timestamp: int, n: int) -> list[str]:
         '''
@@ -214,13 +1868,14 @@ class BankingSystemImpl(BankingSystem):
         :rtype: list[str]
         '''
         self._process_cashbacks(timestamp)
+        self._await_indexes()
         result = []
-        for _, acc in self.sorted_outgoing[:n]:
-            if acc in self.outgoing:
-                result.append(f"{acc}({self.outgoing[acc]})")
+        for neg_outgoing, acc in self.sorted_outgoing[:n]:
+            result.append(f"{acc}({-neg_outgoing})")
         return result
 
  
+    @idempotent
     def merge_accounts(self, timestamp: int, a1: str, a2: str) -> bool:
         '''
         Merge account a2 into account a1
@@ -235,24 +1890,77 @@ class BankingSystemImpl(BankingSystem):
         :rtype: bool
         '''
         self._process_cashbacks(timestamp)
+        if self._snapshot is not None:
+            self._fault_in(a1, a2)
         
         if a1 == a2 or a1 not in self.balances or a2 not in self.balances:
             return False
+        if self._dirty is not None:
+            self._mark_dirty(a1, a2)
+            self._dirty[a1][2] = None  # a2's payments move in, so write a1's in full
         self._remove_from_sorted(a1)
         self._remove_from_sorted(a2)
+        self._unindex_account(a2)
 
-        self.balances[a1] += self.balances[a2]
+        if self._journal is not None:
+            for structure in (self.balances, self.outgoing, self.payments, self.merged_time, self.pending_cashback,
+                              self.settled_payments, self.spend_windows):
+                self._journal_item(structure, a1)
+                self._journal_item(structure, a2)
+            for name in self.payments[a2]:
+                self._journal.append((_restore_item, self.payments[a1], name, _MISSING))
+            target = self.pending_cashback.get(a1)
+            if target is not None:
+                for field in ("total", "count", "refunds"):
+                    self._journal_item(target, field)
+            self._journal.append((self.balance_history[a1].pop,))
+            if self.transaction_log:
+                self._journal.append((self.transactions[a1].pop,))
+                self._journal.append((self.transactions[a2].pop,))
+            self._journal.append((setattr, self, "cashback", self.cashback))
+
+        moved = self.balances[a2]
+        self.balances[a1] += moved
         self.outgoing[a1] += self.outgoing[a2]
 
         for name, info in self.payments.get(a2, {}).items():
             self.payments[a1][name] = info
+        moved_settled = self.settled_payments.pop(a2, None)
+        if moved_settled is not None:
+            target = self.settled_payments.get(a1)
+            if target is not None:
+                moved_settled = array("q", heapq.merge(target, moved_settled))
+            self.settled_payments[a1] = moved_settled
+        moved_window = self.spend_windows.pop(a2, None)
+        if moved_window is not None:
+            window = self.spend_windows.get(a1)
+            if window is None:
+                window = moved_window.copy()
+                window.limit = None
+            else:
+                window = window.copy()
+                window.absorb(moved_window, timestamp)
+            self.spend_windows[a1] = window
 
         self.balance_history[a1].append((timestamp, self.balances[a1]))
+        if self.transaction_log:
+            self.transactions[a1].append((timestamp, txlog.MERGE, moved, self.account_handles[a2]))
+            self.transactions[a2].append((timestamp, txlog.MERGE, -moved, self.account_handles[a1]))
 
         self.merged_time[a2] = timestamp
         del self.balances[a2]
         del self.outgoing[a2]
         del self.payments[a2]
+
+        pending = self.pending_cashback.pop(a2, None)
+        if pending is not None:
+            target = self.pending_cashback.get(a1)
+            if target is None:
+                self.pending_cashback[a1] = pending
+            else:
+                target["total"] += pending["total"]
+                target["count"] += pending["count"]
+                target["refunds"] = deque(heapq.merge(target["refunds"], pending["refunds"]))
         
         # update the deque such that cashback entries from a2 now go to a1 
         new_deque = deque()
@@ -262,10 +1970,123 @@ class BankingSystemImpl(BankingSystem):
             new_deque.append((refund_ts, acc, name))
         self.cashback = new_deque
         self._insert_into_sorted(a1)
+        self._record_outgoing(timestamp, a1)
+        self._record_outgoing(timestamp, a2)
+        if self.change_feed is not None:
+            self.change_feed.emit(cdc.MERGE, timestamp, a1, moved, self.balances[a1], a2)
+        if self.shared_balances is not None:
+            self._mirror(a1, a2)
 
         return True
 
 
+    def get_statement(self, timestamp: int, account_id: str, start: int, end: int, limit: int = 100,
+                      cursor: int | None = None) -> tuple[list, int | None] | None:
+        '''
+        Return one page of an account's transactions between `start` and `end`, oldest first
+
+        The first page is found by binary search on the account's transaction
+        log and later pages resume from the returned cursor, so each page costs
+        O(log n + limit). An account merged away keeps its statement up to the
+        merge.
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param account_id: Account being queried
+        :type account_id: str
+        :param start: Earliest transaction timestamp to include
+        :type start: int
+        :param end: Latest transaction timestamp to include
+        :type end: int
+        :param limit: Maximum number of transactions per page
+        :type limit: int
+        :param cursor: Cursor returned with the previous page, or None for the first page
+        :type cursor: int | None
+        :return: (transactions, cursor of the next page or None on the last page), or None
+            if the account does not exist or the system was built without
+            `transaction_log`. Each transaction is (timestamp, kind, amount, ref)
+            with a change_feed event kind, the signed balance change, and the
+            counterparty account or payment id, or None.
+        :rtype: tuple[list, int | None] | None
+        '''
+        self._process_cashbacks(timestamp)
+        if self._snapshot is not None:
+            self._fault_in(account_id)
+        log = self.transactions.get(account_id)
+        if log is None:
+            return None
+        self._await_indexes()
+        position = log.seek(start) if cursor is None else cursor
+        stop = bisect.bisect_right(log.timestamps, end, lo=position)
+        page_end = min(stop, position + limit)
+        page = []
+        for ts, kind, amount, ref in log[position:page_end]:
+            if ref == NO_REF:
+                ref = None
+            elif kind == txlog.PAY or kind == txlog.CASHBACK:
+                ref = f"payment{ref}"
+            else:
+                ref = self.account_names[ref]
+            page.append((ts, txlog.KINDS[kind], amount, ref))
+        return page, (page_end if page_end < stop else None)
+
+    def set_spend_limit(self, timestamp: int, account_id: str, limit: int | None) -> bool:
+        '''
+        Give one account its own rolling-window spend limit
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param account_id: Account to configure
+        :type account_id: str
+        :param limit: Most the account may spend per window, or None to use `spend_limit`
+        :type limit: int | None
+        :return: True if set, False if the account does not exist or spend windows are disabled
+        :rtype: bool
+        '''
+        self._process_cashbacks(timestamp)
+        if self._snapshot is not None:
+            self._fault_in(account_id)
+        if self.spend_window_ms is None or account_id not in self.balances:
+            return False
+        if self._dirty is not None:
+            self._mark_dirty(account_id)
+        if self._journal is not None:
+            self._journal_item(self.spend_windows, account_id)
+        window = self.spend_windows.get(account_id)
+        window = SpendWindow(self.spend_window_ms, self.spend_buckets) if window is None else window.copy()
+        window.limit = limit
+        self.spend_windows[account_id] = window
+        return True
+
+    def get_spend_window(self, timestamp: int, account_id: str) -> dict | None:
+        '''
+        Report how much an account spent through transfers and payments in the
+        rolling window ending at `timestamp`, and how much more it may spend
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param account_id: Account being queried
+        :type account_id: str
+        :return: {"spent", "limit", "remaining", "window_ms"}, with limit and
+            remaining None when the account is unlimited, or None if the account
+            does not exist or spend windows are disabled
+        :rtype: dict | None
+        '''
+        self._process_cashbacks(timestamp)
+        if self._snapshot is not None:
+            self._fault_in(account_id)
+        if self.spend_window_ms is None or account_id not in self.balances:
+            return None
+        window = self.spend_windows.get(account_id)
+        spent = 0 if window is None else window.spent(timestamp)
+        limit = self._spend_limit_of(window)
+        return {
+            "spent": spent,
+            "limit": limit,
+            "remaining": None if limit is None else max(0, limit - spent),
+            "window_ms": self.spend_window_ms,
+        }
+
     def get_balance(self, timestamp: int, account_id: str, time_at: int) -> int | None:
         '''
         Query the balance of an account at a specific historical timestamp
@@ -280,15 +2101,22 @@ class BankingSystemImpl(BankingSystem):
         :rtype: int | None
         '''
         self._process_cashbacks(timestamp)
+        if self._snapshot is not None:
+            self._fault_in(account_id)
 
         if account_id in self.merged_time:
             if time_at >= self.merged_time[account_id]:
                 return None
 
+        if self.history_tier is not None:
+            return self.history_tier.balance_at(account_id, time_at)
+
         if account_id not in self.balance_history:
             return None
 
         history = self.balance_history[account_id]
+        if type(history) is CompressedHistory:
+            return history.balance_at(time_at)
         if not history or time_at < history[0][0]:
             return None
 
@@ -301,9 +2129,8 @@ class BankingSystemImpl(BankingSystem):
             mid = (left+right) // 2
             ts, b = history[mid]
 
-            if ts == time_at:
-                return b 
-            elif ts < time_at:
+            # keep searching right on an exact match: several entries can share a timestamp
+            if ts <= time_at:
                 bal = b
                 left = mid+1
             else:
@@ -0,0 +1,287 @@
+from banking_system import BankingSystem
+import sqlite3
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS accounts (id TEXT PRIMARY KEY, balance INTEGER NOT NULL, outgoing INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS accounts_outgoing ON accounts (outgoing DESC, id)",
+    "CREATE TABLE IF NOT EXISTS history (account TEXT NOT NULL, ts INTEGER NOT NULL, balance INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS history_account_ts ON history (account, ts)",
+    "CREATE TABLE IF NOT EXISTS payments (name TEXT PRIMARY KEY, ordinal INTEGER NOT NULL, account TEXT NOT NULL, "
+    "refund_ts INTEGER NOT NULL, cashback INTEGER NOT NULL, status TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS payments_account ON payments (account)",
+    "CREATE INDEX IF NOT EXISTS payments_due ON payments (refund_ts, ordinal) WHERE status = 'IN_PROGRESS'",
+    "CREATE TABLE IF NOT EXISTS merged (account TEXT PRIMARY KEY, ts INTEGER NOT NULL)",
+)
+
+_SELECT_BALANCE = "SELECT balance FROM accounts WHERE id = ?"
+_UPDATE_BALANCE = "UPDATE accounts SET balance = ? WHERE id = ?"
+_UPDATE_SPENDING = "UPDATE accounts SET balance = ?, outgoing = outgoing + ? WHERE id = ?"
+_INSERT_HISTORY = "INSERT INTO history (account, ts, balance) VALUES (?, ?, ?)"
+_SELECT_DUE = ("SELECT name, account, refund_ts, cashback FROM payments "
+               "WHERE status = 'IN_PROGRESS' AND refund_ts <= ? ORDER BY refund_ts, ordinal")
+_NEXT_DUE = "SELECT MIN(refund_ts) FROM payments WHERE status = 'IN_PROGRESS'"
+_BALANCE_AT = "SELECT balance FROM history WHERE account = ? AND ts <= ? ORDER BY ts DESC, rowid DESC LIMIT 1"
+
+
+class SqliteBankingSystem(BankingSystem):
+    '''
+    Implementation of the BankingSystem interface that keeps accounts, balance
+    history, payments and the cashback schedule in SQLite, so the state can
+    grow beyond available RAM.
+
+    Writes are grouped into transactions of `batch_size` operations; call
+    `commit` or `close` to make the tail of a batch durable.
+    '''
+    def __init__(self, path: str = ":memory:", batch_size: int = 1_000):
+        self.db = sqlite3.connect(path, cached_statements=64)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self.db.execute(statement)
+        self.db.commit()
+        self.batch_size = batch_size
+        self._pending_writes = 0
+        row = self.db.execute("SELECT MAX(ordinal) FROM payments").fetchone()
+        self.payment_counter = row[0] or 0
+        self._next_refund_ts = self.db.execute(_NEXT_DUE).fetchone()[0]
+
+    def _wrote(self):
+        '''
+        Count a mutating operation and commit once a full batch has accumulated
+        '''
+        self._pending_writes += 1
+        if self._pending_writes >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        '''
+        Commit the current write batch
+        '''
+        self.db.commit()
+        self._pending_writes = 0
+
+    def close(self):
+        '''
+        Commit outstanding writes and close the database
+        '''
+        self.commit()
+        self.db.close()
+
+    def _balance(self, account_id: str) -> int | None:
+        row = self.db.execute(_SELECT_BALANCE, (account_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def _process_cashbacks(self, timestamp: int):
+        '''
+        Refund every in-progress payment with refund_ts <= timestamp
+
+        :param timestamp: The current timestamp
+        :type timestamp: int
+        '''
+        if self._next_refund_ts is None or self._next_refund_ts > timestamp:
+            return
+        db = self.db
+        for name, acc, refund_ts, cashback in db.execute(_SELECT_DUE, (timestamp,)).fetchall():
+            balance = self._balance(acc)
+            if balance is not None:
+                balance += cashback
+                db.execute(_UPDATE_BALANCE, (balance, acc))
+                db.execute(_INSERT_HISTORY, (acc, refund_ts, balance))
+            db.execute("UPDATE payments SET status = 'CASHBACK_RECEIVED' WHERE name = ?", (name,))
+        self._next_refund_ts = db.execute(_NEXT_DUE).fetchone()[0]
+        self._wrote()
+
+    def create_account(self, timestamp: int, account_id: str) -> bool:
+        '''
+        Create a new account with zero initial balance
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param account_id: Unique account identifier
+        :type account_id: str
+        :return: Return True if the account was successfully created, else return False
+        :rtype: bool
+        '''
+        self._process_cashbacks(timestamp)
+        if self._balance(account_id) is not None:
+            return False
+        db = self.db
+        db.execute("DELETE FROM merged WHERE account = ?", (account_id,))
+        db.execute("DELETE FROM history WHERE account = ?", (account_id,))
+        db.execute("INSERT INTO accounts (id, balance, outgoing) VALUES (?, 0, 0)", (account_id,))
+        db.execute(_INSERT_HISTORY, (account_id, timestamp, 0))
+        self._wrote()
+        return True
+
+    def deposit(self, timestamp: int, account_id: str, amount: int) -> int | None:
+        '''
+        Deposit an amount into an account
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param account_id: Target account
+        :type account_id: str
+        :param amount: Amount to deposit
+        :type amount: int
+        :return: Return updated balance or None for account not found
+        :rtype: int | None
+        '''
+        self._process_cashbacks(timestamp)
+        balance = self._balance(account_id)
+        if balance is None:
+            return None
+        balance += amount
+        self.db.execute(_UPDATE_BALANCE, (balance, account_id))
+        self.db.execute(_INSERT_HISTORY, (account_id, timestamp, balance))
+        self._wrote()
+        return balance
+
+    def transfer(self, timestamp: int, source: str, target: str, amount: int) -> int | None:
+        '''
+        Transfer funds from one account to another
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param source: Account to transfer from
+        :type source: str
+        :param target: Account to transfer to
+        :type target: str
+        :param amount: Amount to transfer
+        :type amount: int
+        :return: Return updated balance or None for transfer failed
+        :rtype: int | None
+        '''
+        self._process_cashbacks(timestamp)
+        if source == target:
+            return None
+        source_balance = self._balance(source)
+        target_balance = self._balance(target)
+        if source_balance is None or target_balance is None or source_balance < amount:
+            return None
+        source_balance -= amount
+        target_balance += amount
+        db = self.db
+        db.execute(_UPDATE_SPENDING, (source_balance, amount, source))
+        db.execute(_UPDATE_BALANCE, (target_balance, target))
+        db.executemany(_INSERT_HISTORY, ((source, timestamp, source_balance), (target, timestamp, target_balance)))
+        self._wrote()
+        return source_balance
+
+    def pay(self, timestamp: int, account_id: str, amount: int) -> str | None:
+        '''
+        Withdraw money from an account and schedule a 2% cashback 24h later
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param account_id: Account making the payment
+        :type account_id: str
+        :param amount: Amount to deduct
+        :type amount: int
+        :return: Return payment ID or None if the account does not exist or balance is insufficient
+        :rtype: str | None
+        '''
+        self._process_cashbacks(timestamp)
+        balance = self._balance(account_id)
+        if balance is None or balance < amount:
+            return None
+        balance -= amount
+        db = self.db
+        db.execute(_UPDATE_SPENDING, (balance, amount, account_id))
+        db.execute(_INSERT_HISTORY, (account_id, timestamp, balance))
+
+        self.payment_counter += 1
+        name = f"payment{self.payment_counter}"
+        refund_ts = timestamp + 86_400_000  # 24h in ms
+        db.execute(
+            "INSERT INTO payments (name, ordinal, account, refund_ts, cashback, status) "
+            "VALUES (?, ?, ?, ?, ?, 'IN_PROGRESS')",
+            (name, self.payment_counter, account_id, refund_ts, amount * 2 // 100),
+        )
+        if self._next_refund_ts is None or refund_ts < self._next_refund_ts:
+            self._next_refund_ts = refund_ts
+        self._wrote()
+        return name
+
+    def get_payment_status(self, timestamp: int, account_id: str, payment: str) -> str | None:
+        '''
+        Retrieve the status of a previously created payment
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param account_id: Account associated with the payment
+        :type account_id: str
+        :param payment: Payment identifier
+        :type payment: str
+        :return: Return the payment status or None if not found
+        :rtype: str | None
+        '''
+        self._process_cashbacks(timestamp)
+        row = self.db.execute(
+            "SELECT status FROM payments WHERE name = ? AND account = ?", (payment, account_id)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def top_spenders(self, timestamp: int, n: int) -> list[str]:
+        '''
+        Return the top-N accounts ranked by outgoing payment totals
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param n: Number of accounts to return
+        :type n: int
+        :return: A list of formatted strings that sorted by spending
+        :rtype: list[str]
+        '''
+        self._process_cashbacks(timestamp)
+        rows = self.db.execute("SELECT id, outgoing FROM accounts ORDER BY outgoing DESC, id LIMIT ?", (n,))
+        return [f"{acc}({outgoing})" for acc, outgoing in rows]
+
+    def merge_accounts(self, timestamp: int, a1: str, a2: str) -> bool:
+        '''
+        Merge account a2 into account a1
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param a1: Destination account
+        :type a1: str
+        :param a2: Account to be merged and deleted.
+        :type a2: str
+        :return: True if succeeded else False
+        :rtype: bool
+        '''
+        self._process_cashbacks(timestamp)
+        if a1 == a2:
+            return False
+        row1 = self.db.execute("SELECT balance, outgoing FROM accounts WHERE id = ?", (a1,)).fetchone()
+        row2 = self.db.execute("SELECT balance, outgoing FROM accounts WHERE id = ?", (a2,)).fetchone()
+        if row1 is None or row2 is None:
+            return False
+        balance = row1[0] + row2[0]
+        db = self.db
+        db.execute("UPDATE accounts SET balance = ?, outgoing = ? WHERE id = ?", (balance, row1[1] + row2[1], a1))
+        db.execute("DELETE FROM accounts WHERE id = ?", (a2,))
+        db.execute("UPDATE payments SET account = ? WHERE account = ?", (a1, a2))
+        db.execute(_INSERT_HISTORY, (a1, timestamp, balance))
+        db.execute("INSERT OR REPLACE INTO merged (account, ts) VALUES (?, ?)", (a2, timestamp))
+        self._wrote()
+        return True
+
+    def get_balance(self, timestamp: int, account_id: str, time_at: int) -> int | None:
+        '''
+        Query the balance of an account at a specific historical timestamp
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param account_id: Account being queried
+        :type account_id: str
+        :param time_at: Historical timestamp to check
+        :type time_at: int
+        :return: The balance at the given time or None
+        :rtype: int | None
+        '''
+        self._process_cashbacks(timestamp)
+        row = self.db.execute("SELECT ts FROM merged WHERE account = ?", (account_id,)).fetchone()
+        if row is not None and time_at >= row[0]:
+            return None
+        row = self.db.execute(_BALANCE_AT, (account_id, time_at)).fetchone()
+        return None if row is None else row[0]
@@ -0,0 +1,92 @@
+import argparse
+import functools
+import random
+import time
+
+from banking_system_impl import BankingSystemImpl
+from banking_system_sqlite import SqliteBankingSystem
+
+IMPLEMENTATIONS = {
+    "memory": BankingSystemImpl,
+    # rolling 24h spend limit high enough that the workload is unchanged, to
+    # show the cost of tracking it on every transfer and payment
+    "memory-limits": functools.partial(BankingSystemImpl, spend_window_ms=86_400_000, spend_limit=10**12),
+    # per-account transaction log kept for get_statement
+    "memory-statements": functools.partial(BankingSystemImpl, transaction_log=True),
+    "sqlite": SqliteBankingSystem,
+}
+
+
+def generate_workload(num_ops: int, num_accounts: int, seed: int = 0) -> list:
+    '''
+    Build a reproducible list of (method, args) calls with strictly increasing timestamps
+
+    :param num_ops: Number of operations after account creation
+    :type num_ops: int
+    :param num_accounts: Number of accounts to create up front
+    :type num_accounts: int
+    :param seed: Random seed
+    :type seed: int
+    :return: List of (method name, argument tuple) pairs
+    :rtype: list
+    '''
+    rng = random.Random(seed)
+    accounts = [f"account{i}" for i in range(num_accounts)]
+    ops = []
+    ts = 0
+    for acc in accounts:
+        ts += 1
+        ops.append(("create_account", (ts, acc)))
+    step = max(1, 3 * 86_400_000 // max(num_ops, 1))
+    for _ in range(num_ops):
+        ts += rng.randint(1, step)
+        roll = rng.random()
+        acc = rng.choice(accounts)
+        if roll < 0.35:
+            ops.append(("deposit", (ts, acc, rng.randint(1, 10_000))))
+        elif roll < 0.6:
+            ops.append(("transfer", (ts, acc, rng.choice(accounts), rng.randint(1, 5_000))))
+        elif roll < 0.8:
+            ops.append(("pay", (ts, acc, rng.randint(1, 5_000))))
+        elif roll < 0.9:
+            ops.append(("get_balance", (ts, acc, rng.randint(0, ts))))
+        else:
+            ops.append(("top_spenders", (ts, 10)))
+    return ops
+
+
+def run(impl: str, ops: list) -> float:
+    '''
+    Replay a workload against one implementation
+
+    :param impl: Key into IMPLEMENTATIONS
+    :type impl: str
+    :param ops: Workload produced by generate_workload
+    :type ops: list
+    :return: Elapsed wall-clock seconds
+    :rtype: float
+    '''
+    system = IMPLEMENTATIONS[impl]()
+    start = time.perf_counter()
+    for method, args in ops:
+        getattr(system, method)(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BankingSystem implementations")
+    parser.add_argument("--impl", choices=sorted(IMPLEMENTATIONS), action="append",
+                        help="implementation to run (repeatable, default: all)")
+    parser.add_argument("--ops", type=int, default=100_000)
+    parser.add_argument("--accounts", type=int, default=1_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ops = generate_workload(args.ops, args.accounts, args.seed)
+    for impl in args.impl or sorted(IMPLEMENTATIONS):
+        elapsed = run(impl, ops)
+        print(f"{impl:>17}: {len(ops)} ops in {elapsed:.3f}s ({len(ops) / elapsed:,.0f} ops/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+CREATE = "create"
+DEPOSIT = "deposit"
+TRANSFER_OUT = "transfer_out"
+TRANSFER_IN = "transfer_in"
+SETTLE = "settle"
+PAY = "pay"
+CASHBACK = "cashback"
+MERGE = "merge"
+
+
+class ConsumerLagged(Exception):
+    '''
+    Raised when a subscription asks for events that have already been
+    overwritten in the ring buffer; the consumer must resync from a snapshot
+    '''
+    def __init__(self, offset: int, oldest: int):
+        super().__init__(f"offset {offset} is older than the oldest buffered event {oldest}")
+        self.offset = offset
+        self.oldest = oldest
+
+
+class ChangeFeed:
+    '''
+    Bounded, globally ordered stream of balance-changing events
+
+    Events are tuples `(seq, kind, timestamp, account, amount, balance, ref)`
+    stored in a preallocated ring buffer of `capacity` slots. `ref` is the
+    counterparty for transfer legs and merges and the payment id for payments
+    and cashback.
+    '''
+    def __init__(self, capacity: int = 65_536):
+        self.capacity = capacity
+        self.next_seq = 0
+        self._buffer = [None] * capacity
+        self._subscriptions = set()
+
+    @property
+    def oldest_seq(self) -> int:
+        '''
+        Sequence number of the oldest event still in the buffer
+        '''
+        return max(0, self.next_seq - self.capacity)
+
+    def emit(self, kind: str, timestamp: int, account: str, amount: int, balance: int | None, ref: str | None = None):
+        '''
+        Append one event, overwriting the oldest slot once the buffer is full
+
+        :param kind: Event kind, one of the module-level constants
+        :type kind: str
+        :param timestamp: Operation timestamp
+        :type timestamp: int
+        :param account: Account whose balance changed
+        :type account: str
+        :param amount: Amount moved by the event
+        :type amount: int
+        :param balance: Account balance after the event
+        :type balance: int | None
+        :param ref: Counterparty account or payment id
+        :type ref: str | None
+        '''
+        seq = self.next_seq
+        self._buffer[seq % self.capacity] = (seq, kind, timestamp, account, amount, balance, ref)
+        self.next_seq = seq + 1
+
+    def read(self, offset: int, limit: int | None = None) -> list:
+        '''
+        Return buffered events starting at sequence number `offset`
+
+        :param offset: First sequence number wanted
+        :type offset: int
+        :param limit: Maximum number of events to return
+        :type limit: int | None
+        :return: Events in sequence order
+        :rtype: list
+        '''
+        oldest = self.oldest_seq
+        if offset < oldest:
+            raise ConsumerLagged(offset, oldest)
+        end = self.next_seq if limit is None else min(self.next_seq, offset + limit)
+        return [self._buffer[seq % self.capacity] for seq in range(offset, end)]
+
+    def subscribe(self, offset: int | None = None) -> "Subscription":
+        '''
+        Register a consumer starting at `offset`, or at the head of the feed
+
+        :param offset: First sequence number to deliver
+        :type offset: int | None
+        :rtype: Subscription
+        '''
+        subscription = Subscription(self, self.next_seq if offset is None else offset)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    @property
+    def subscriptions(self) -> set:
+        '''
+        Subscriptions that have not been dropped for lagging
+        '''
+        return set(self._subscriptions)
+
+    def _drop(self, subscription: "Subscription"):
+        self._subscriptions.discard(subscription)
+
+
+class Subscription:
+    '''
+    Consumer cursor over a ChangeFeed
+
+    A subscription that falls further behind than the buffer holds is dropped
+    from the feed and raises ConsumerLagged on every poll until `resync` is
+    called.
+    '''
+    def __init__(self, feed: ChangeFeed, offset: int):
+        self.feed = feed
+        self.offset = offset
+        self.dropped = False
+
+    @property
+    def lag(self) -> int:
+        '''
+        Number of events published but not yet consumed
+        '''
+        return self.feed.next_seq - self.offset
+
+    def poll(self, limit: int = 1_000) -> list:
+        '''
+        Return up to `limit` events after the last one consumed
+
+        :param limit: Maximum number of events to return
+        :type limit: int
+        :return: Events in sequence order
+        :rtype: list
+        '''
+        if self.dropped:
+            raise ConsumerLagged(self.offset, self.feed.oldest_seq)
+        try:
+            events = self.feed.read(self.offset, limit)
+        except ConsumerLagged:
+            self.dropped = True
+            self.feed._drop(self)
+            raise
+        self.offset += len(events)
+        return events
+
+    def resync(self, offset: int | None = None):
+        '''
+        Rejoin the feed after being dropped, by default at its head
+
+        :param offset: Sequence number to resume from, e.g. the one a snapshot was taken at
+        :type offset: int | None
+        '''
+        self.offset = self.feed.next_seq if offset is None else offset
+        self.dropped = False
+        self.feed._subscriptions.add(self)
@@ -0,0 +1,190 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import os
+import random
+import sys
+import time
+
+from benchmark import IMPLEMENTATIONS
+from reference_banking_system import ReferenceBankingSystem
+
+DAY = 86_400_000
+
+
+def generate_operations(count: int, num_accounts: int, seed: int = 0) -> list:
+    '''
+    Build a reproducible random sequence of BankingSystem calls
+
+    Timestamps never decrease, often repeat and sometimes jump by more than a
+    day so that cashbacks fall due between calls. Account ids are drawn from
+    a small pool, so calls on missing, merged and re-created accounts are
+    common.
+
+    :param count: Number of operations
+    :type count: int
+    :param num_accounts: Size of the account id pool
+    :type num_accounts: int
+    :param seed: Random seed
+    :type seed: int
+    :return: List of (method name, argument tuple) pairs
+    :rtype: list
+    '''
+    rng = random.Random(seed)
+    accounts = [f"account{i}" for i in range(num_accounts)]
+    ops = []
+    ts = 1
+    payments = 0
+    for _ in range(count):
+        jump = rng.random()
+        if jump < 0.02:
+            ts += rng.randint(DAY // 2, 2 * DAY)
+        elif jump < 0.9:
+            ts += rng.randint(1, DAY // 50)
+        acc, other = rng.choice(accounts), rng.choice(accounts)
+        roll = rng.random()
+        if roll < 0.1:
+            ops.append(("create_account", (ts, acc)))
+        elif roll < 0.3:
+            ops.append(("deposit", (ts, acc, rng.randint(1, 5_000))))
+        elif roll < 0.45:
+            ops.append(("transfer", (ts, acc, other, rng.randint(1, 3_000))))
+        elif roll < 0.6:
+            ops.append(("pay", (ts, acc, rng.randint(1, 3_000))))
+            payments += 1
+        elif roll < 0.7:
+            ops.append(("get_payment_status", (ts, acc, f"payment{rng.randint(1, payments + 1)}")))
+        elif roll < 0.75:
+            ops.append(("merge_accounts", (ts, acc, other)))
+        elif roll < 0.9:
+            ops.append(("get_balance", (ts, acc, rng.randint(max(0, ts - 3 * DAY), ts))))
+        else:
+            ops.append(("top_spenders", (ts, rng.randint(1, num_accounts))))
+    return ops
+
+
+def _factory(impl: str | type):
+    '''
+    Resolve an implementation given by name or as a BankingSystem class
+    '''
+    return IMPLEMENTATIONS[impl] if isinstance(impl, str) else impl
+
+
+def find_mismatch(impl: str | type, ops: list) -> tuple | None:
+    '''
+    Replay operations through an implementation and the reference model side by side
+
+    :param impl: Key into benchmark.IMPLEMENTATIONS, or a BankingSystem class
+    :type impl: str | type
+    :param ops: Operations as produced by generate_operations
+    :type ops: list
+    :return: (index, expected, actual) of the first differing result, or None
+    :rtype: tuple | None
+    '''
+    system = _factory(impl)()
+    reference = ReferenceBankingSystem()
+    for i, (method, args) in enumerate(ops):
+        expected = getattr(reference, method)(*args)
+        actual = getattr(system, method)(*args)
+        if actual != expected:
+            return i, expected, actual
+    return None
+
+
+def shrink(impl: str | type, ops: list) -> list:
+    '''
+    Reduce a failing operation sequence to a locally minimal one that still fails
+
+    The sequence is first cut after the first mismatch, then chunks of
+    halving size are removed while the result still shows a mismatch, in the
+    manner of delta debugging. Removing calls keeps timestamps in order.
+
+    :param impl: Key into benchmark.IMPLEMENTATIONS, or a BankingSystem class
+    :type impl: str | type
+    :param ops: Sequence for which find_mismatch reports a mismatch
+    :type ops: list
+    :return: The shrunk sequence
+    :rtype: list
+    '''
+    ops = ops[:find_mismatch(impl, ops)[0] + 1]
+    chunk = len(ops) // 2
+    while chunk >= 1:
+        i = 0
+        while i < len(ops):
+            candidate = ops[:i] + ops[i + chunk:]
+            mismatch = find_mismatch(impl, candidate) if candidate else None
+            if mismatch is not None:
+                ops = candidate[:mismatch[0] + 1]
+            else:
+                i += chunk
+        chunk //= 2
+    return ops
+
+
+def check_seed(impl: str | type, count: int, num_accounts: int, seed: int) -> list | None:
+    '''
+    Run one random sequence and return it shrunk if it exposes a mismatch
+
+    :return: The shrunk failing sequence, or None if every result matched
+    :rtype: list | None
+    '''
+    ops = generate_operations(count, num_accounts, seed)
+    if find_mismatch(impl, ops) is None:
+        return None
+    return shrink(impl, ops)
+
+
+def run(impl: str | type, total_ops: int, chunk_ops: int, num_accounts: int, seed: int = 0,
+        workers: int | None = None) -> list:
+    '''
+    Check `total_ops` random operations, split into independent sequences of
+    `chunk_ops` run across a process pool
+
+    A class given as `impl` is sent to the workers by reference, so it must be
+    defined at module level; unlike entries added to IMPLEMENTATIONS at run
+    time, it is then found under every process start method.
+
+    :param impl: Key into benchmark.IMPLEMENTATIONS, or a BankingSystem class
+    :type impl: str | type
+    :param total_ops: Total number of operations to check
+    :type total_ops: int
+    :param chunk_ops: Operations per sequence, each against fresh systems
+    :type chunk_ops: int
+    :param num_accounts: Size of the account id pool of each sequence
+    :type num_accounts: int
+    :param seed: Seed of the first sequence; sequence i uses seed + i
+    :type seed: int
+    :param workers: Number of processes, or None for one per CPU
+    :type workers: int | None
+    :return: (seed, shrunk failing sequence) for every sequence that failed
+    :rtype: list
+    '''
+    chunks = -(-total_ops // chunk_ops)
+    seeds = range(seed, seed + chunks)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(check_seed, [impl] * chunks, [chunk_ops] * chunks, [num_accounts] * chunks, seeds)
+        return [(s, ops) for s, ops in zip(seeds, results) if ops is not None]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a BankingSystem implementation against the reference model")
+    parser.add_argument("--impl", choices=sorted(IMPLEMENTATIONS), default="memory")
+    parser.add_argument("--ops", type=int, default=1_000_000)
+    parser.add_argument("--chunk", type=int, default=20_000, help="operations per independent sequence")
+    parser.add_argument("--accounts", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    failures = run(args.impl, args.ops, args.chunk, args.accounts, args.seed, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"{args.impl}: {args.ops} ops checked in {elapsed:.1f}s, {len(failures)} failing sequences")
+    for seed, ops in failures:
+        print(f"seed {seed}, shrunk to {len(ops)} ops:")
+        for method, call_args in ops:
+            print(f"  {method}{call_args}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
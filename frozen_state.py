@@ -0,0 +1,633 @@
+import bisect
+import itertools
+from collections import deque
+from collections.abc import MutableMapping, MutableSequence, Sequence
+
+from snapshot import encode_record
+
+# How to take a private copy of one account's value in each per-account
+# structure; values not listed (balances, outgoing totals, merge times) are
+# immutable and shared as they are
+_COPY_VALUE = {
+    "payments": lambda payments: {name: dict(info) for name, info in payments.items()},
+    "balance_history": lambda history: history.copy(),
+    "outgoing_history": lambda history: history.copy(),
+    "transactions": lambda log: log.copy(),
+    "settled_payments": lambda ordinals: ordinals[:],
+    "spend_windows": lambda window: window.copy(),
+    "pending_cashback": lambda pending: {**pending, "refunds": deque(pending["refunds"])},
+}
+
+# An overlay over a frozen structure is folded into a new private base once it
+# holds more than this fraction of the base (plus a floor), which bounds both
+# the cost of reading through it and what a later fork has to copy
+_FOLD_DIVISOR = 8
+_FOLD_FLOOR = 256
+_ABSENT = object()
+_DELETED = object()
+
+
+def _outgrown(overlay: int, base: int) -> bool:
+    return overlay > _FOLD_FLOOR + base // _FOLD_DIVISOR
+
+
+class SharedLog(MutableSequence):
+    '''
+    List whose first `length` entries are read from a list frozen at a fork
+
+    Appended entries go to a private tail, and rewriting or removing frozen
+    entries first moves them from the frozen part into the tail, so the
+    system-wide logs cost a fork nothing until they diverge. Copies share the
+    frozen list and copy only the tail. Pickles as a plain list.
+    '''
+    __slots__ = ("_base", "_length", "_tail")
+
+    def __init__(self, base: list, length: int | None = None, tail: list | None = None):
+        self._base = base
+        self._length = len(base) if length is None else length
+        self._tail = [] if tail is None else tail
+
+    @classmethod
+    def over(cls, log) -> "SharedLog":
+        '''
+        Return a private view of a frozen list or SharedLog
+        '''
+        if isinstance(log, SharedLog):
+            return SharedLog(log._base, log._length, log._tail[:])
+        return cls(log)
+
+    def _split(self, index: int):
+        '''
+        Move the frozen entries from `index` on into the private tail
+        '''
+        if index < self._length:
+            self._tail[:0] = self._base[index:self._length]
+            self._length = index
+
+    def _position(self, index: int) -> int:
+        size = self._length + len(self._tail)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("log index out of range")
+        return index
+
+    def __len__(self) -> int:
+        return self._length + len(self._tail)
+
+    def __getitem__(self, index):
+        length = self._length
+        if isinstance(index, slice):
+            start, stop, step = index.indices(length + len(self._tail))
+            if step != 1:
+                return list(self)[index]
+            if start >= length:
+                return self._tail[start - length:max(stop, start) - length]
+            return self._base[start:min(stop, length)] + self._tail[:max(stop - length, 0)]
+        index = self._position(index)
+        return self._base[index] if index < length else self._tail[index - length]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("extended slices are not supported")
+            self._split(start)
+            self._tail[start - self._length:max(stop, start) - self._length] = value
+        else:
+            index = self._position(index)
+            self._split(index)
+            self._tail[index - self._length] = value
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("extended slices are not supported")
+            self._split(start)
+            del self._tail[start - self._length:max(stop, start) - self._length]
+        else:
+            index = self._position(index)
+            self._split(index)
+            del self._tail[index - self._length]
+
+    def insert(self, index: int, value):
+        size = len(self)
+        index = min(max(index + size if index < 0 else index, 0), size)
+        self._split(index)
+        self._tail.insert(index - self._length, value)
+
+    def append(self, value):
+        tail = self._tail
+        tail.append(value)
+        if _outgrown(len(tail), self._length):
+            self._base, self._length, self._tail = self._base[:self._length] + tail, self._length + len(tail), []
+
+    def pop(self, index: int = -1):
+        if index == -1 and self._tail:
+            return self._tail.pop()
+        index = self._position(index)
+        self._split(index)
+        return self._tail.pop(index - self._length)
+
+    def __iter__(self):
+        return itertools.chain(itertools.islice(self._base, self._length), self._tail)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (list, SharedLog)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def __repr__(self) -> str:
+        return f"SharedLog({list(self)!r})"
+
+
+class SharedDict(MutableMapping):
+    '''
+    Dict read through to a dict frozen at a fork
+
+    Writes go to a private overlay, where deleted frozen keys are marked, so
+    the key maps cost a fork nothing until they diverge. Copies share the
+    frozen dict and copy only the overlay. Pickles as a plain dict.
+    '''
+    __slots__ = ("_base", "_own", "_len")
+
+    def __init__(self, base: dict, own: dict | None = None, length: int | None = None):
+        self._base = base
+        self._own = {} if own is None else own
+        self._len = len(base) if length is None else length
+
+    @classmethod
+    def over(cls, mapping) -> "SharedDict":
+        '''
+        Return a private view of a frozen dict or SharedDict
+        '''
+        if isinstance(mapping, SharedDict):
+            return SharedDict(mapping._base, dict(mapping._own), mapping._len)
+        return cls(mapping)
+
+    def __getitem__(self, key):
+        value = self._own.get(key, _ABSENT)
+        if value is _ABSENT:
+            return self._base[key]
+        if value is _DELETED:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._own.get(key, _ABSENT)
+        if value is _ABSENT:
+            return self._base.get(key, default)
+        return default if value is _DELETED else value
+
+    def __contains__(self, key) -> bool:
+        value = self._own.get(key, _ABSENT)
+        if value is _ABSENT:
+            return key in self._base
+        return value is not _DELETED
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._len += 1
+        own = self._own
+        own[key] = value
+        if _outgrown(len(own), len(self._base)):
+            self._fold()
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._len -= 1
+        if key in self._base:
+            self._own[key] = _DELETED
+        else:
+            del self._own[key]
+
+    def _fold(self):
+        '''
+        Merge the overlay into a new private base
+        '''
+        base = self._base.copy()
+        for key, value in self._own.items():
+            if value is _DELETED:
+                del base[key]
+            else:
+                base[key] = value
+        self._base, self._own = base, {}
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self):
+        own = self._own
+        for key, value in own.items():
+            if value is not _DELETED:
+                yield key
+        for key in self._base:
+            if key not in own:
+                yield key
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+    def __repr__(self) -> str:
+        return f"SharedDict({dict(self)!r})"
+
+
+class SharedSortedList(Sequence):
+    '''
+    Sorted list of distinct keys read through to a sorted list frozen at a fork
+
+    Keys added since the fork are kept in one private sorted list and frozen
+    keys removed since in another, so an update costs bisects into the frozen
+    list and an insert into a list no bigger than the overlay. Positions
+    are counted across all three. Copies share the frozen list and copy only
+    the overlay. Pickles as a plain list.
+
+    Plain sorted lists and SharedSortedList are updated through
+    `sorted_insert`, `sorted_remove` and `sorted_position`.
+    '''
+    __slots__ = ("_base", "_added", "_removed")
+
+    def __init__(self, base: list, added: list | None = None, removed: list | None = None):
+        self._base = base
+        self._added = [] if added is None else added
+        self._removed = [] if removed is None else removed
+
+    @classmethod
+    def over(cls, keys) -> "SharedSortedList":
+        '''
+        Return a private view of a frozen sorted list or SharedSortedList
+        '''
+        if isinstance(keys, SharedSortedList):
+            return SharedSortedList(keys._base, keys._added[:], keys._removed[:])
+        return cls(keys)
+
+    def add(self, key):
+        '''
+        Insert a key that is not in the list
+        '''
+        bisect.insort(self._added, key)
+        self._fold_if_outgrown()
+
+    def discard(self, key) -> bool:
+        '''
+        Remove a key if present
+
+        :return: Whether the key was present
+        :rtype: bool
+        '''
+        added = self._added
+        idx = bisect.bisect_left(added, key)
+        if idx < len(added) and added[idx] == key:
+            added.pop(idx)
+            return True
+        base, removed = self._base, self._removed
+        idx = bisect.bisect_left(base, key)
+        if idx == len(base) or base[idx] != key:
+            return False
+        idx = bisect.bisect_left(removed, key)
+        if idx < len(removed) and removed[idx] == key:
+            return False
+        removed.insert(idx, key)
+        self._fold_if_outgrown()
+        return True
+
+    def bisect_left(self, key) -> int:
+        return (bisect.bisect_left(self._base, key) - bisect.bisect_left(self._removed, key)
+                + bisect.bisect_left(self._added, key))
+
+    def bisect_right(self, key) -> int:
+        return (bisect.bisect_right(self._base, key) - bisect.bisect_right(self._removed, key)
+                + bisect.bisect_right(self._added, key))
+
+    def _fold_if_outgrown(self):
+        if _outgrown(len(self._added) + len(self._removed), len(self._base)):
+            removed = set(self._removed)
+            base = [key for key in self._base if key not in removed] if removed else self._base[:]
+            base += self._added
+            base.sort()
+            self._base, self._added, self._removed = base, [], []
+
+    def _start(self, position: int) -> tuple:
+        '''
+        Return the (frozen, added, removed) indexes at which the key at
+        `position` is found by merging the three lists
+        '''
+        base, added, removed = self._base, self._added, self._removed
+        # the key is an added one if exactly `position` keys sort before it
+        lo, hi = 0, len(added)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = added[mid]
+            if mid + bisect.bisect_left(base, key) - bisect.bisect_left(removed, key) < position:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(added):
+            key = added[lo]
+            i, k = bisect.bisect_left(base, key), bisect.bisect_left(removed, key)
+            if lo + i - k == position:
+                return i, lo, k
+        # otherwise it is the first frozen key not removed with `position` keys before it
+        lo, hi = 0, len(base)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = base[mid]
+            if mid - bisect.bisect_left(removed, key) + bisect.bisect_left(added, key) < position:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == len(base):
+            return lo, len(added), len(removed)
+        key = base[lo]
+        return lo, bisect.bisect_left(added, key), bisect.bisect_left(removed, key)
+
+    def iterate(self, start: int, stop: int):
+        '''
+        Iterate over self[start:stop] without building the slice, for 0 <= start
+        '''
+        base, added, removed = self._base, self._added, self._removed
+        i, j, k = self._start(start) if start else (0, 0, 0)
+        for _ in range(max(min(stop, len(self)) - start, 0)):
+            while k < len(removed) and base[i] == removed[k]:
+                i, k = i + 1, k + 1
+            if i < len(base) and (j == len(added) or base[i] < added[j]):
+                yield base[i]
+                i += 1
+            else:
+                yield added[j]
+                j += 1
+
+    def __len__(self) -> int:
+        return len(self._base) - len(self._removed) + len(self._added)
+
+    def __getitem__(self, index):
+        size = len(self)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(size)
+            if step != 1:
+                return list(self)[index]
+            return list(self.iterate(start, stop))
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("sorted list index out of range")
+        return next(self.iterate(index, index + 1))
+
+    def __iter__(self):
+        return self.iterate(0, len(self))
+
+    def __contains__(self, key) -> bool:
+        return self.bisect_right(key) > self.bisect_left(key)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (list, SharedSortedList)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def __repr__(self) -> str:
+        return f"SharedSortedList({list(self)!r})"
+
+
+class SharedQueue(Sequence):
+    '''
+    Deque read through to a queue frozen at a fork
+
+    Entries taken from the front of the frozen queue only advance an offset,
+    and entries appended since the fork go to a private deque, so the
+    cashback queue costs a fork nothing. Undoing a take from the front steps
+    the offset back; other writes to the frozen part first move what is left
+    of it into the private deque. Pickles as a deque.
+    '''
+    __slots__ = ("_base", "_start", "_tail")
+
+    def __init__(self, base, start: int = 0, tail: deque | None = None):
+        self._base = base
+        self._start = start
+        self._tail = deque() if tail is None else tail
+
+    @classmethod
+    def over(cls, queue) -> "SharedQueue":
+        '''
+        Return a private view of a frozen deque or SharedQueue
+        '''
+        if isinstance(queue, SharedQueue):
+            return SharedQueue(queue._base, queue._start, queue._tail.copy())
+        return cls(queue)
+
+    def _unshare(self):
+        '''
+        Move the rest of the frozen queue into the private deque
+        '''
+        self._tail.extendleft(reversed(list(itertools.islice(self._base, self._start, None))))
+        self._base, self._start = (), 0
+
+    def append(self, item):
+        self._tail.append(item)
+
+    def appendleft(self, item):
+        if self._start and self._base[self._start - 1] is item:
+            self._start -= 1
+        else:
+            self._unshare()
+            self._tail.appendleft(item)
+
+    def popleft(self):
+        if self._start < len(self._base):
+            self._start += 1
+            return self._base[self._start - 1]
+        return self._tail.popleft()
+
+    def pop(self):
+        if not self._tail:
+            self._unshare()
+        return self._tail.pop()
+
+    def __len__(self) -> int:
+        return len(self._base) - self._start + len(self._tail)
+
+    def __getitem__(self, index: int):
+        frozen = len(self._base) - self._start
+        if index < 0:
+            index += frozen + len(self._tail)
+        if 0 <= index < frozen:
+            return self._base[self._start + index]
+        if index < 0:
+            raise IndexError("queue index out of range")
+        return self._tail[index - frozen]
+
+    def __iter__(self):
+        return itertools.chain(itertools.islice(self._base, self._start, None), self._tail)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (deque, SharedQueue)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __reduce__(self):
+        return deque, (list(self),)
+
+    def __repr__(self) -> str:
+        return f"SharedQueue({list(self)!r})"
+
+
+def sorted_insert(keys, key):
+    '''
+    Insert a key into a plain sorted list or a SharedSortedList
+    '''
+    if type(keys) is list:
+        bisect.insort(keys, key)
+    else:
+        keys.add(key)
+
+
+def sorted_remove(keys, key) -> bool:
+    '''
+    Remove a key from a plain sorted list or a SharedSortedList
+
+    :return: Whether the key was present
+    :rtype: bool
+    '''
+    if type(keys) is not list:
+        return keys.discard(key)
+    idx = bisect.bisect_left(keys, key)
+    if idx < len(keys) and keys[idx] == key:
+        keys.pop(idx)
+        return True
+    return False
+
+
+def sorted_position(keys, key, right: bool = False) -> int:
+    '''
+    Return bisect_left (or bisect_right) of a key in a plain sorted list or a SharedSortedList
+    '''
+    if type(keys) is list:
+        return bisect.bisect_right(keys, key) if right else bisect.bisect_left(keys, key)
+    return keys.bisect_right(key) if right else keys.bisect_left(key)
+
+
+def sorted_range(keys, start: int, stop: int):
+    '''
+    Iterate over keys[start:stop] of a plain sorted list or a SharedSortedList without copying
+    '''
+    if type(keys) is list:
+        return map(keys.__getitem__, range(start, min(len(keys), stop)))
+    return keys.iterate(start, stop)
+
+
+# How each system gets its own view of a system-wide structure at a fork;
+# structures not listed are copied
+_SHARE_EXTRA = {
+    "cashback": SharedQueue.over,
+    "sorted_outgoing": SharedSortedList.over,
+    "sorted_accounts": SharedSortedList.over,
+    "outgoing_key_map": SharedDict.over,
+    "account_handles": SharedDict.over,
+    "outgoing_change_ts": SharedLog.over,
+    "outgoing_change_accounts": SharedLog.over,
+    "spending_checkpoints": SharedLog.over,
+    "total_balance_history": SharedLog.over,
+    "total_outgoing_history": SharedLog.over,
+    "account_names": SharedLog.over,
+}
+
+
+class FrozenState:
+    '''
+    Immutable state shared by a forked BankingSystemImpl and its parent
+
+    The per-account structures and system-wide structures of the parent are
+    handed over as they were at the fork and never written to again. Each
+    system copies an account's record out of them the first time it touches
+    the account, so accounts neither side changes stay shared. The cashback
+    queue, ranking, key maps and system-wide logs are read through
+    copy-on-write views (SharedQueue, SharedSortedList, SharedDict,
+    SharedLog), so they cost each side only what it changes. Accounts the parent never
+    materialized from its own lazy source are looked up there.
+
+    Exposes the same `get`/`raw_records`/`close` interface as SnapshotReader.
+    '''
+    def __init__(self, state: dict, extras: dict, faulted: set, source=None):
+        self._state = state
+        self._extras = extras
+        self._faulted = faulted
+        self._source = source
+        self._users = 0
+
+    def acquire(self) -> "FrozenState":
+        '''
+        Register one more system reading from this state
+        '''
+        self._users += 1
+        return self
+
+    @property
+    def next_refund_ts(self) -> int | None:
+        '''
+        Refund timestamp of the first pending cashback at the fork, if any
+        '''
+        cashback = self._extras["cashback"]
+        return cashback[0][0] if cashback else None
+
+    def get(self, acc: str) -> dict | None:
+        '''
+        Return a private copy of one account's record
+
+        :param acc: Account identifier
+        :type acc: str
+        :return: Values keyed by structure attribute name, or None
+        :rtype: dict | None
+        '''
+        if self._source is not None and acc not in self._faulted:
+            return self._source.get(acc)
+        record = {}
+        for name, structure in self._state.items():
+            value = structure.get(acc)
+            if value is not None:
+                copy = _COPY_VALUE.get(name)
+                record[name] = value if copy is None else copy(value)
+        return record or None
+
+    def raw_records(self):
+        '''
+        Yield (account, encoded record) for every account, as SnapshotReader does
+        '''
+        accounts = set()
+        for structure in self._state.values():
+            accounts.update(structure)
+        for acc in accounts:
+            yield acc, encode_record(acc, {
+                name: structure[acc] for name, structure in self._state.items() if acc in structure
+            })
+        if self._source is not None:
+            for acc, data in self._source.raw_records():
+                if acc not in self._faulted:
+                    yield acc, data
+
+    def extras(self) -> dict:
+        '''
+        Return private views or copies of the system-wide structures
+        '''
+        extras = dict(self._extras)
+        for name, value in self._extras.items():
+            share = _SHARE_EXTRA.get(name)
+            if share is not None:
+                extras[name] = share(value)
+            elif isinstance(value, (list, dict, deque)):
+                extras[name] = value.copy()
+        return extras
+
+    def close(self):
+        '''
+        Drop one reader; the underlying source is closed with the last one
+        '''
+        self._users -= 1
+        if self._users == 0 and self._source is not None:
+            self._source.close()
@@ -0,0 +1,295 @@
+import bisect
+import sys
+
+
+def _write_varint(out: bytearray, value: int):
+    '''
+    Append a signed integer to `out` as a zigzag-encoded LEB128 varint
+
+    :param out: Buffer to append to
+    :type out: bytearray
+    :param value: Signed integer
+    :type value: int
+    '''
+    value = (value << 1) if value >= 0 else ((-value << 1) - 1)
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> tuple:
+    '''
+    Decode one zigzag varint starting at `pos`
+
+    :param data: Encoded block
+    :type data: bytes
+    :param pos: Offset of the first byte
+    :type pos: int
+    :return: (value, offset of the next varint)
+    :rtype: tuple
+    '''
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+    return (result >> 1) if not result & 1 else -((result + 1) >> 1), pos
+
+
+def encode_block(entries: list) -> bytes:
+    '''
+    Encode (timestamp, balance) entries after the first one as delta-of-delta
+    timestamps interleaved with balance deltas; the first entry is kept in the
+    block index
+
+    :param entries: Sorted (timestamp, balance) tuples
+    :type entries: list
+    :rtype: bytes
+    '''
+    out = bytearray()
+    prev_ts, prev_bal = entries[0]
+    prev_delta = 0
+    for ts, bal in entries[1:]:
+        delta = ts - prev_ts
+        _write_varint(out, delta - prev_delta)
+        _write_varint(out, bal - prev_bal)
+        prev_ts, prev_bal, prev_delta = ts, bal, delta
+    return bytes(out)
+
+
+def decode_block(first_ts: int, first_bal: int, data: bytes) -> list:
+    '''
+    Decode a block produced by encode_block
+
+    :param first_ts: Timestamp of the first entry
+    :type first_ts: int
+    :param first_bal: Balance of the first entry
+    :type first_bal: int
+    :param data: Encoded remainder of the block
+    :type data: bytes
+    :return: (timestamp, balance) tuples
+    :rtype: list
+    '''
+    entries = [(first_ts, first_bal)]
+    ts, bal, delta = first_ts, first_bal, 0
+    pos = 0
+    end = len(data)
+    while pos < end:
+        dod, pos = _read_varint(data, pos)
+        diff, pos = _read_varint(data, pos)
+        delta += dod
+        ts += delta
+        bal += diff
+        entries.append((ts, bal))
+    return entries
+
+
+class CompressedHistory:
+    '''
+    Balance history made of sealed, varint-encoded blocks followed by an
+    uncompressed open tail
+
+    Appends go to the tail; once it holds `block_size` entries it is sealed
+    into a block. A sparse index of each block's first entry lets
+    `balance_at` binary-search to a single block and decode only that one.
+    Blocks rewritten by `replace` may hold fewer entries, so the index also
+    records where each block ends.
+    '''
+    __slots__ = ("block_size", "_first_ts", "_first_bal", "_blocks", "_ends", "_sealed", "_tail")
+
+    def __init__(self, entries=(), block_size: int = 256):
+        self.block_size = block_size
+        self._first_ts = []
+        self._first_bal = []
+        self._blocks = []
+        self._ends = []
+        self._sealed = 0
+        self._tail = []
+        for entry in entries:
+            self.append(entry)
+
+    def append(self, entry: tuple):
+        tail = self._tail
+        tail.append(entry)
+        if len(tail) >= self.block_size:
+            self.seal()
+
+    def seal(self):
+        '''
+        Encode the open tail as a block, shorter than `block_size` when the
+        history is not expected to grow any further
+        '''
+        tail = self._tail
+        if tail:
+            self._first_ts.append(tail[0][0])
+            self._first_bal.append(tail[0][1])
+            self._blocks.append(encode_block(tail))
+            self._sealed += len(tail)
+            self._ends.append(self._sealed)
+            self._tail = []
+
+    @property
+    def sealed(self) -> bool:
+        '''
+        True when every entry is held in an encoded block
+        '''
+        return not self._tail
+
+    def pop(self) -> tuple:
+        '''
+        Remove and return the newest entry, reopening the last sealed block
+        when the tail is empty
+        '''
+        if not self._tail:
+            if not self._blocks:
+                raise IndexError("pop from empty history")
+            self._tail = self._block(len(self._blocks) - 1)
+            self._first_ts.pop()
+            self._first_bal.pop()
+            self._blocks.pop()
+            self._ends.pop()
+            self._sealed -= len(self._tail)
+        return self._tail.pop()
+
+    def copy(self) -> "CompressedHistory":
+        '''
+        Return a copy that shares the sealed blocks with this history
+        '''
+        other = CompressedHistory.__new__(CompressedHistory)
+        other.block_size = self.block_size
+        other._first_ts = self._first_ts.copy()
+        other._first_bal = self._first_bal.copy()
+        other._blocks = self._blocks.copy()
+        other._ends = self._ends.copy()
+        other._sealed = self._sealed
+        other._tail = self._tail.copy()
+        return other
+
+    def replace(self, start: int, stop: int, entries: list):
+        '''
+        Replace the entries at positions [start, stop) with `entries`,
+        re-encoding only the blocks that overlap those positions
+
+        :param start: First position replaced
+        :type start: int
+        :param stop: Position after the last one replaced
+        :type stop: int
+        :param entries: Sorted (timestamp, balance) tuples to put in their place
+        :type entries: list
+        '''
+        if start >= self._sealed:
+            self._tail[start - self._sealed:stop - self._sealed] = entries
+            return
+        ends = self._ends
+        first = bisect.bisect_right(ends, start)
+        base = ends[first - 1] if first else 0
+        into_tail = stop > self._sealed
+        last = len(self._blocks) if into_tail else bisect.bisect_right(ends, stop - 1) + 1
+        decoded = [entry for i in range(first, last) for entry in self._block(i)]
+        if into_tail:
+            decoded.extend(self._tail)
+        rewritten = decoded[:start - base] + entries + decoded[stop - base:]
+        first_ts, first_bal, blocks, block_ends = [], [], [], []
+        tail = []
+        end = base
+        for i in range(0, len(rewritten), self.block_size):
+            chunk = rewritten[i:i + self.block_size]
+            if into_tail and len(chunk) < self.block_size:
+                tail = chunk
+                break
+            first_ts.append(chunk[0][0])
+            first_bal.append(chunk[0][1])
+            blocks.append(encode_block(chunk))
+            end += len(chunk)
+            block_ends.append(end)
+        shift = len(entries) - (stop - start)
+        self._first_ts[first:last] = first_ts
+        self._first_bal[first:last] = first_bal
+        self._blocks[first:last] = blocks
+        ends[first:last] = block_ends
+        for i in range(first + len(block_ends), len(ends)):
+            ends[i] += shift
+        self._sealed = ends[-1] if ends else 0
+        if into_tail:
+            self._tail = tail
+
+    def _block(self, i: int) -> list:
+        return decode_block(self._first_ts[i], self._first_bal[i], self._blocks[i])
+
+    def balance_at(self, time_at: int) -> int | None:
+        '''
+        Return the last balance recorded at or before `time_at`
+
+        :param time_at: Historical timestamp to check
+        :type time_at: int
+        :return: The balance at the given time or None
+        :rtype: int | None
+        '''
+        tail = self._tail
+        if tail and tail[0][0] <= time_at:
+            entries = tail
+        else:
+            block = bisect.bisect_right(self._first_ts, time_at) - 1
+            if block < 0:
+                return None
+            entries = self._block(block)
+        idx = bisect.bisect_right(entries, time_at, key=lambda entry: entry[0])
+        return entries[idx - 1][1]
+
+    def __len__(self) -> int:
+        return self._sealed + len(self._tail)
+
+    def __iter__(self):
+        for i in range(len(self._blocks)):
+            yield from self._block(i)
+        yield from self._tail
+
+    def __getitem__(self, i: int | slice) -> tuple | list:
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return list(self)[i]
+            entries = []
+            ends = self._ends
+            block = bisect.bisect_right(ends, start)
+            while block < len(ends) and start < stop:
+                base = ends[block - 1] if block else 0
+                entries.extend(self._block(block)[start - base:stop - base])
+                start = ends[block]
+                block += 1
+            if stop > self._sealed:
+                start = max(start, self._sealed)
+                entries.extend(self._tail[start - self._sealed:stop - self._sealed])
+            return entries
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("history index out of range")
+        if i >= self._sealed:
+            return self._tail[i - self._sealed]
+        block = bisect.bisect_right(self._ends, i)
+        return self._block(block)[i - (self._ends[block - 1] if block else 0)]
+
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+
+    def __setstate__(self, state):
+        _, slots = state
+        for name, value in slots.items():
+            setattr(self, name, value)
+        if "_ends" not in slots:  # written before blocks could be rewritten, so all full
+            self._ends = list(range(self.block_size, self._sealed + 1, self.block_size))
+
+    def __sizeof__(self) -> int:
+        size = object.__sizeof__(self)
+        size += sys.getsizeof(self._first_ts) + sys.getsizeof(self._first_bal) + sys.getsizeof(self._blocks)
+        size += sys.getsizeof(self._ends) + sum(sys.getsizeof(end) for end in self._ends)
+        size += sum(sys.getsizeof(block) for block in self._blocks)
+        size += sum(sys.getsizeof(ts) + sys.getsizeof(bal) for ts, bal in zip(self._first_ts, self._first_bal))
+        size += sys.getsizeof(self._tail) + sum(sys.getsizeof(entry) for entry in self._tail)
+        return size
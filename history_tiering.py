@@ -0,0 +1,225 @@
+from collections import OrderedDict
+from collections.abc import MutableMapping
+import bisect
+import sqlite3
+
+
+def _balance_at(history: list, time_at: int) -> int | None:
+    '''
+    Return the last balance recorded at or before `time_at` in a sorted history
+
+    :param history: List of (timestamp, balance) tuples sorted by timestamp
+    :type history: list
+    :param time_at: Historical timestamp to check
+    :type time_at: int
+    :return: The balance at the given time or None
+    :rtype: int | None
+    '''
+    idx = bisect.bisect_right(history, time_at, key=lambda entry: entry[0])
+    if idx == 0:
+        return None
+    return history[idx - 1][1]
+
+
+class TieredHistoryStore(MutableMapping):
+    '''
+    Balance history mapping that keeps recently touched accounts in memory and
+    spills the history of idle accounts to SQLite.
+
+    Indexing an account returns its hot tail, the list of entries not yet on
+    disk, so appends never load cold data. Full lookups go through
+    `balance_at`, which faults the on-disk part into a bounded LRU cache.
+    '''
+    def __init__(self, path: str = ":memory:", idle_ms: int = 7 * 86_400_000,
+                 max_hot: int = 100_000, max_cached: int = 1_000):
+        self.idle_ms = idle_ms
+        self.max_hot = max_hot
+        self.max_cached = max_cached
+        self.clock = 0
+        self._hot = OrderedDict()      # account -> tail list, least recently touched first
+        self._last_touch = {}
+        self._cached = OrderedDict()   # account -> on-disk history faulted in by balance_at
+        self._spilled = set()
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS history (account TEXT NOT NULL, ts INTEGER NOT NULL, balance INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS history_account_ts ON history (account, ts)")
+        self._spilled.update(row[0] for row in self._db.execute("SELECT DISTINCT account FROM history"))
+
+    def __getitem__(self, acc: str) -> list:
+        tail = self._hot.get(acc)
+        if tail is None:
+            if acc not in self._spilled:
+                raise KeyError(acc)
+            tail = []
+            self._hot[acc] = tail
+            self._evict_over_capacity()
+        else:
+            self._hot.move_to_end(acc)
+        self._last_touch[acc] = self.clock
+        return tail
+
+    def __setitem__(self, acc: str, history: list):
+        if acc in self._spilled:
+            with self._db:
+                self._db.execute("DELETE FROM history WHERE account = ?", (acc,))
+            self._spilled.discard(acc)
+            self._cached.pop(acc, None)
+        self._hot[acc] = history
+        self._hot.move_to_end(acc)
+        self._last_touch[acc] = self.clock
+        self._evict_over_capacity()
+
+    def __delitem__(self, acc: str):
+        if acc not in self:
+            raise KeyError(acc)
+        self._hot.pop(acc, None)
+        self._last_touch.pop(acc, None)
+        self._cached.pop(acc, None)
+        if acc in self._spilled:
+            with self._db:
+                self._db.execute("DELETE FROM history WHERE account = ?", (acc,))
+            self._spilled.discard(acc)
+
+    def __contains__(self, acc: object) -> bool:
+        return acc in self._hot or acc in self._spilled
+
+    def __iter__(self):
+        yield from self._hot
+        for acc in self._spilled:
+            if acc not in self._hot:
+                yield acc
+
+    def __len__(self) -> int:
+        return len(self._hot) + sum(1 for acc in self._spilled if acc not in self._hot)
+
+    @property
+    def hot_count(self) -> int:
+        '''
+        Number of accounts whose tail is currently held in memory
+        '''
+        return len(self._hot)
+
+    @property
+    def hot_tails(self) -> OrderedDict:
+        '''
+        In-memory tails keyed by account, least recently touched first
+        '''
+        return self._hot
+
+    def advance(self, timestamp: int):
+        '''
+        Move the store clock forward and spill every account idle for longer
+        than `idle_ms`
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        '''
+        self.clock = timestamp
+        cutoff = timestamp - self.idle_ms
+        idle = []
+        for acc in self._hot:
+            if self._last_touch[acc] >= cutoff:
+                break
+            idle.append(acc)
+        if idle:
+            self._spill(idle)
+
+    def _evict_over_capacity(self):
+        '''
+        Spill least recently touched accounts until at most `max_hot` remain
+        '''
+        excess = len(self._hot) - self.max_hot
+        if excess > 0:
+            victims = []
+            for acc in self._hot:
+                if excess == 0:
+                    break
+                victims.append(acc)
+                excess -= 1
+            self._spill(victims)
+
+    def _spill(self, accounts: list):
+        '''
+        Write the hot tails of `accounts` to disk in one transaction and drop
+        them from memory
+
+        :param accounts: Accounts to spill
+        :type accounts: list
+        '''
+        rows = []
+        for acc in accounts:
+            tail = self._hot.pop(acc)
+            del self._last_touch[acc]
+            if not tail:
+                continue
+            rows.extend((acc, ts, bal) for ts, bal in tail)
+            self._spilled.add(acc)
+            cached = self._cached.get(acc)
+            if cached is not None:
+                cached.extend(tail)
+        if rows:
+            with self._db:
+                self._db.executemany("INSERT INTO history (account, ts, balance) VALUES (?, ?, ?)", rows)
+
+    def _load(self, acc: str) -> list:
+        '''
+        Fault the on-disk history of an account into the LRU cache
+
+        :param acc: Account identifier
+        :type acc: str
+        :return: On-disk part of the history, oldest first
+        :rtype: list
+        '''
+        cached = self._cached.get(acc)
+        if cached is not None:
+            self._cached.move_to_end(acc)
+            return cached
+        cached = self._db.execute(
+            "SELECT ts, balance FROM history WHERE account = ? ORDER BY ts, rowid", (acc,)
+        ).fetchall()
+        self._cached[acc] = cached
+        if len(self._cached) > self.max_cached:
+            self._cached.popitem(last=False)
+        return cached
+
+    def balance_at(self, acc: str, time_at: int) -> int | None:
+        '''
+        Query the balance of an account at a historical timestamp, reading the
+        hot tail first and faulting in the on-disk history only when needed
+
+        :param acc: Account being queried
+        :type acc: str
+        :param time_at: Historical timestamp to check
+        :type time_at: int
+        :return: The balance at the given time or None
+        :rtype: int | None
+        '''
+        tail = self._hot.get(acc)
+        if tail and tail[0][0] <= time_at:
+            return _balance_at(tail, time_at)
+        if acc not in self._spilled:
+            return None
+        return _balance_at(self._load(acc), time_at)
+
+    def history(self, acc: str) -> list:
+        '''
+        Return the full history of an account, on-disk part followed by the
+        hot tail
+
+        :param acc: Account identifier
+        :type acc: str
+        :return: List of (timestamp, balance) tuples
+        :rtype: list
+        '''
+        cold = self._load(acc) if acc in self._spilled else []
+        return cold + self._hot.get(acc, [])
+
+    def close(self):
+        '''
+        Close the underlying SQLite connection
+        '''
+        self._db.close()
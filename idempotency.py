@@ -0,0 +1,161 @@
+from collections import OrderedDict
+import functools
+import inspect
+import types
+
+
+class IdempotencyCache:
+    '''
+    Bounded LRU/TTL cache of operation results keyed by (idempotency key, method)
+
+    Entries expire `ttl_ms` after they were stored, measured on the simulated
+    clock given by each operation's `timestamp`, and the least recently used
+    entries are evicted once more than `max_entries` are held.
+    '''
+    def __init__(self, max_entries: int = 100_000, ttl_ms: int = 86_400_000):
+        self.max_entries = max_entries
+        self.ttl_ms = ttl_ms
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()   # (key, method) -> (stored_at, result)
+        self._stored_at = OrderedDict()  # (key, method) in insertion order, for expiry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def expire(self, timestamp: int):
+        '''
+        Drop every entry stored more than `ttl_ms` before `timestamp`
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        '''
+        cutoff = timestamp - self.ttl_ms
+        stored_at = self._stored_at
+        while stored_at:
+            cache_key, ts = next(iter(stored_at.items()))
+            if ts > cutoff:
+                break
+            del stored_at[cache_key]
+            del self._entries[cache_key]
+            self.expirations += 1
+
+    def lookup(self, key: str, method: str, timestamp: int) -> tuple:
+        '''
+        Look up the remembered result of an earlier call
+
+        :param key: Idempotency key supplied by the caller
+        :type key: str
+        :param method: Name of the method being called
+        :type method: str
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :return: (True, result) on a hit, (False, None) on a miss
+        :rtype: tuple
+        '''
+        self.expire(timestamp)
+        entry = self._entries.get((key, method))
+        if entry is None:
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end((key, method))
+        self.hits += 1
+        return True, entry[1]
+
+    def store(self, key: str, method: str, timestamp: int, result):
+        '''
+        Remember the result of a call, evicting the least recently used entry
+        when the cache is full
+
+        :param key: Idempotency key supplied by the caller
+        :type key: str
+        :param method: Name of the method that was called
+        :type method: str
+        :param timestamp: Timestamp of the call
+        :type timestamp: int
+        :param result: Value returned by the call
+        '''
+        cache_key = (key, method)
+        self._entries[cache_key] = (timestamp, result)
+        self._stored_at[cache_key] = timestamp
+        while len(self._entries) > self.max_entries:
+            victim, _ = self._entries.popitem(last=False)
+            del self._stored_at[victim]
+            self.evictions += 1
+
+    def forget(self, key: str, method: str):
+        '''
+        Drop a remembered result, e.g. when the call that produced it is rolled back
+
+        :param key: Idempotency key supplied by the caller
+        :type key: str
+        :param method: Name of the method that was called
+        :type method: str
+        '''
+        if self._entries.pop((key, method), None) is not None:
+            del self._stored_at[(key, method)]
+
+    def metrics(self) -> dict:
+        '''
+        Return hit/miss/eviction counters and the current size
+        '''
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "size": len(self._entries),
+        }
+
+
+def idempotent(method):
+    '''
+    Let a mutating BankingSystemImpl method take an optional `idempotency_key`
+
+    When the system has an IdempotencyCache and a key is given, a repeated
+    call with the same key returns the first call's result without running
+    the operation again. Systems built without a cache call the undecorated
+    method directly (see `bypass_idempotency`).
+    '''
+    name = method.__name__
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, idempotency_key: str | None = None, **kwargs):
+        cache = self.idempotency
+        if idempotency_key is None or cache is None:
+            return method(self, *args, **kwargs)
+        timestamp = signature.bind(self, *args, **kwargs).arguments["timestamp"]
+        hit, result = cache.lookup(idempotency_key, name, timestamp)
+        if hit:
+            return result
+        result = method(self, *args, **kwargs)
+        cache.store(idempotency_key, name, timestamp, result)
+        if self._journal is not None:
+            self._journal.append((cache.forget, idempotency_key, name))
+        return result
+    wrapper.idempotent = True
+    IDEMPOTENT_METHODS.add(name)
+    return wrapper
+
+
+IDEMPOTENT_METHODS = set()
+
+
+def bypass_idempotency(system):
+    '''
+    Bind the undecorated idempotent methods of a system without a cache on
+    the system itself, so that calls skip the wrapper; the system then
+    rejects `idempotency_key` with a TypeError
+
+    Methods a subclass overrides without the decorator are left alone.
+
+    :param system: System built without an IdempotencyCache
+    '''
+    cls = type(system)
+    for name in IDEMPOTENT_METHODS:
+        method = getattr(cls, name, None)
+        if getattr(method, "idempotent", False):
+            setattr(system, name, types.MethodType(method.__wrapped__, system))
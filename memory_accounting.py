@@ -0,0 +1,71 @@
+from collections import deque
+from collections.abc import Mapping
+import itertools
+import random
+import sys
+
+_CONTAINERS = (list, tuple, set, frozenset, deque)
+
+
+def deep_sizeof(obj, seen: set | None = None) -> int:
+    '''
+    Recursively estimate the bytes held by an object graph of builtin containers
+
+    Objects reachable more than once are only counted the first time.
+
+    :param obj: Root object
+    :param seen: ids of objects already counted
+    :type seen: set | None
+    :return: Estimated size in bytes
+    :rtype: int
+    '''
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_sizeof(key, seen) + deep_sizeof(value, seen)
+    elif isinstance(obj, _CONTAINERS):
+        for item in obj:
+            size += deep_sizeof(item, seen)
+    return size
+
+
+def estimate_container(container, sample_size: int, rng: random.Random) -> dict:
+    '''
+    Estimate the size of a dict or sequence by deep-sizing a random sample of
+    its entries and extrapolating to the rest
+
+    :param container: dict or other mapping, list or other sequence to measure
+    :param sample_size: Maximum number of entries to deep-size
+    :type sample_size: int
+    :param rng: Source of randomness for sampling
+    :type rng: random.Random
+    :return: {"entries": count, "bytes": estimated bytes, "sampled": entries sized}
+    :rtype: dict
+    '''
+    count = len(container)
+    size = sys.getsizeof(container)
+    if count == 0:
+        return {"entries": 0, "bytes": size, "sampled": 0}
+    if count <= sample_size:
+        picks = list(range(count))
+    else:
+        picks = sorted(rng.sample(range(count), sample_size))
+    is_dict = isinstance(container, Mapping)
+    iterator = iter(container.items() if is_dict else container)
+    sampled = 0
+    seen = set()
+    position = 0
+    for pick in picks:
+        entry = next(itertools.islice(iterator, pick - position, None))
+        position = pick + 1
+        if is_dict:
+            key, value = entry
+            sampled += deep_sizeof(key, seen) + deep_sizeof(value, seen)
+        else:
+            sampled += deep_sizeof(entry, seen)
+    return {"entries": count, "bytes": size + sampled * count // len(picks), "sampled": len(picks)}
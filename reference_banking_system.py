@@ -0,0 +1,226 @@
+from banking_system import BankingSystem
+
+CASHBACK_DELAY_MS = 86_400_000  # 24h in ms
+
+
+class ReferenceBankingSystem(BankingSystem):
+    '''
+    Deliberately simple implementation of the BankingSystem interface, used
+    as the model that optimized implementations are checked against
+
+    Every query scans plain lists, with no indexes, caches or lazy work, so
+    each answer can be checked against the interface description by reading
+    the code. It is far too slow for real workloads.
+    '''
+    def __init__(self):
+        self.accounts = {}  # id -> {"balance", "outgoing", "history": [(timestamp, balance)]}
+        self.merged = {}  # id -> (merge timestamp, history before the merge)
+        self.payments = []  # {"name", "account", "refund_ts", "cashback", "status"} in payment order
+        self.pending = []  # payments still waiting for their cashback
+
+    def _process_cashbacks(self, timestamp: int):
+        '''
+        Refund every payment due at or before `timestamp`, oldest first
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        '''
+        due = [payment for payment in self.pending if payment["refund_ts"] <= timestamp]
+        if not due:
+            return
+        self.pending = [payment for payment in self.pending if payment["refund_ts"] > timestamp]
+        due.sort(key=lambda payment: payment["refund_ts"])
+        for payment in due:
+            account = self.accounts[payment["account"]]
+            account["balance"] += payment["cashback"]
+            account["history"].append((payment["refund_ts"], account["balance"]))
+            payment["status"] = "CASHBACK_RECEIVED"
+
+    def create_account(self, timestamp: int, account_id: str) -> bool:
+        '''
+        Create a new account with zero initial balance
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param account_id: Unique account identifier
+        :type account_id: str
+        :return: Return True if the account was successfully created, else return False
+        :rtype: bool
+        '''
+        self._process_cashbacks(timestamp)
+        if account_id in self.accounts:
+            return False
+        self.merged.pop(account_id, None)
+        self.accounts[account_id] = {"balance": 0, "outgoing": 0, "history": [(timestamp, 0)]}
+        return True
+
+    def deposit(self, timestamp: int, account_id: str, amount: int) -> int | None:
+        '''
+        Deposit an amount into an account
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param account_id: Target account
+        :type account_id: str
+        :param amount: Amount to deposit
+        :type amount: int
+        :return: Return updated balance or None for account not found
+        :rtype: int | None
+        '''
+        self._process_cashbacks(timestamp)
+        account = self.accounts.get(account_id)
+        if account is None:
+            return None
+        account["balance"] += amount
+        account["history"].append((timestamp, account["balance"]))
+        return account["balance"]
+
+    def _withdraw(self, timestamp: int, account: dict, amount: int):
+        account["balance"] -= amount
+        account["outgoing"] += amount
+        account["history"].append((timestamp, account["balance"]))
+
+    def transfer(self, timestamp: int, source: str, target: str, amount: int) -> int | None:
+        '''
+        Transfer funds from one account to another
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param source: Account to transfer from
+        :type source: str
+        :param target: Account to transfer to
+        :type target: str
+        :param amount: Amount to transfer
+        :type amount: int
+        :return: Return updated balance or None for transfer failed
+        :rtype: int | None
+        '''
+        self._process_cashbacks(timestamp)
+        if source == target or source not in self.accounts or target not in self.accounts:
+            return None
+        if self.accounts[source]["balance"] < amount:
+            return None
+        self._withdraw(timestamp, self.accounts[source], amount)
+        self.deposit(timestamp, target, amount)
+        return self.accounts[source]["balance"]
+
+    def top_spenders(self, timestamp: int, n: int) -> list[str]:
+        '''
+        Return the top-N accounts ranked by outgoing totals
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param n: Number of accounts to return
+        :type n: int
+        :return: A list of formatted strings that sorted by spending
+        :rtype: list[str]
+        '''
+        self._process_cashbacks(timestamp)
+        ranked = sorted(self.accounts.items(), key=lambda item: (-item[1]["outgoing"], item[0]))
+        return [f"{account_id}({account['outgoing']})" for account_id, account in ranked[:n]]
+
+    def pay(self, timestamp: int, account_id: str, amount: int) -> str | None:
+        '''
+        Withdraw money from an account and schedule a 2% cashback 24h later
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param account_id: Account making the payment
+        :type account_id: str
+        :param amount: Amount to deduct
+        :type amount: int
+        :return: Return payment ID or None if the account does not exist or balance is insufficient
+        :rtype: str | None
+        '''
+        self._process_cashbacks(timestamp)
+        account = self.accounts.get(account_id)
+        if account is None or account["balance"] < amount:
+            return None
+        self._withdraw(timestamp, account, amount)
+        name = f"payment{len(self.payments) + 1}"
+        payment = {
+            "name": name,
+            "account": account_id,
+            "refund_ts": timestamp + CASHBACK_DELAY_MS,
+            "cashback": amount * 2 // 100,
+            "status": "IN_PROGRESS",
+        }
+        self.payments.append(payment)
+        self.pending.append(payment)
+        return name
+
+    def get_payment_status(self, timestamp: int, account_id: str, payment: str) -> str | None:
+        '''
+        Return the status of a payment made by, or merged into, an account
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param account_id: Account that owns the payment
+        :type account_id: str
+        :param payment: Payment identifier
+        :type payment: str
+        :return: "IN_PROGRESS", "CASHBACK_RECEIVED", or None
+        :rtype: str | None
+        '''
+        self._process_cashbacks(timestamp)
+        if account_id not in self.accounts:
+            return None
+        for info in self.payments:
+            if info["name"] == payment and info["account"] == account_id:
+                return info["status"]
+        return None
+
+    def merge_accounts(self, timestamp: int, a1: str, a2: str) -> bool:
+        '''
+        Merge account a2 into account a1
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param a1: Destination account
+        :type a1: str
+        :param a2: Account to be merged and deleted.
+        :type a2: str
+        :return: True if succeeded else False
+        :rtype: bool
+        '''
+        self._process_cashbacks(timestamp)
+        if a1 == a2 or a1 not in self.accounts or a2 not in self.accounts:
+            return False
+        merged = self.accounts.pop(a2)
+        target = self.accounts[a1]
+        target["balance"] += merged["balance"]
+        target["outgoing"] += merged["outgoing"]
+        target["history"].append((timestamp, target["balance"]))
+        for info in self.payments:
+            if info["account"] == a2:
+                info["account"] = a1
+        self.merged[a2] = (timestamp, merged["history"])
+        return True
+
+    def get_balance(self, timestamp: int, account_id: str, time_at: int) -> int | None:
+        '''
+        Query the balance of an account at a specific historical timestamp
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param account_id: Account being queried
+        :type account_id: str
+        :param time_at: Historical timestamp to check
+        :type time_at: int
+        :return: The balance at the given time or None
+        :rtype: int | None
+        '''
+        self._process_cashbacks(timestamp)
+        if account_id in self.accounts:
+            history = self.accounts[account_id]["history"]
+        elif account_id in self.merged:
+            merged_at, history = self.merged[account_id]
+            if time_at >= merged_at:
+                return None
+        else:
+            return None
+        balance = None
+        for ts, bal in history:
+            if ts <= time_at:
+                balance = bal
+        return balance
@@ -0,0 +1,126 @@
+import heapq
+
+
+class ReorderBuffer:
+    '''
+    Ingest stage that accepts operations slightly out of timestamp order and
+    applies them to a BankingSystemImpl in order
+
+    Operations are held until the watermark, the newest timestamp seen minus
+    `max_lateness_ms`, passes them, and are then applied by timestamp and
+    arrival order. An operation older than one already applied can no longer
+    be put in order and is dropped. When more than `max_buffered` operations
+    are held, the oldest are applied early. Runs of plain deposits released
+    at the same timestamp are applied with a single `deposit_many` call.
+
+    Every submitted operation gets a ticket, its position in arrival order,
+    which identifies its result once applied.
+    '''
+    def __init__(self, system, max_lateness_ms: int = 10, max_buffered: int = 100_000):
+        self.system = system
+        self.max_lateness_ms = max_lateness_ms
+        self.max_buffered = max_buffered
+        self.received = 0
+        self.applied = 0
+        self.late = 0
+        self.dropped = 0
+        self.forced = 0
+        self.batches = 0
+        self._heap = []  # (timestamp, ticket, method, args, kwargs)
+        self._newest = None
+        self._applied_through = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    @property
+    def watermark(self) -> int | None:
+        '''
+        Operations at or before this timestamp are released
+        '''
+        return None if self._newest is None else self._newest - self.max_lateness_ms
+
+    def submit(self, method: str, timestamp: int, *args, **kwargs) -> list:
+        '''
+        Buffer one operation and apply every buffered operation the watermark
+        has passed
+
+        :param method: Name of the BankingSystemImpl method to call
+        :type method: str
+        :param timestamp: Operation timestamp
+        :type timestamp: int
+        :param args: Remaining positional arguments of the method
+        :param kwargs: Keyword arguments of the method, e.g. `idempotency_key`
+        :return: (ticket, result) pairs of the operations applied, in the order applied
+        :rtype: list
+        '''
+        ticket = self.received
+        self.received += 1
+        if self._applied_through is not None and timestamp < self._applied_through:
+            self.dropped += 1
+            return []
+        if self._newest is None or timestamp > self._newest:
+            self._newest = timestamp
+        elif timestamp < self._newest:
+            self.late += 1
+        heapq.heappush(self._heap, (timestamp, ticket, method, args, kwargs))
+        return self._release(self.watermark)
+
+    def flush(self) -> list:
+        '''
+        Apply every buffered operation, e.g. at shutdown
+
+        :return: (ticket, result) pairs of the operations applied, in the order applied
+        :rtype: list
+        '''
+        return self._release(None)
+
+    def metrics(self) -> dict:
+        '''
+        Return ingest counters and the number of operations still buffered
+        '''
+        return {
+            "received": self.received,
+            "applied": self.applied,
+            "late": self.late,
+            "dropped": self.dropped,
+            "forced": self.forced,
+            "batches": self.batches,
+            "buffered": len(self._heap),
+        }
+
+    def _release(self, watermark: int | None) -> list:
+        heap = self._heap
+        ready = []
+        while heap:
+            if watermark is not None and heap[0][0] > watermark:
+                if len(heap) <= self.max_buffered:
+                    break
+                self.forced += 1
+            ready.append(heapq.heappop(heap))
+        if not ready:
+            return []
+        self._applied_through = ready[-1][0]
+        self.applied += len(ready)
+        return self._apply(ready)
+
+    def _apply(self, ready: list) -> list:
+        system = self.system
+        results = []
+        i = 0
+        while i < len(ready):
+            timestamp, ticket, method, args, kwargs = ready[i]
+            end = i + 1
+            if method == "deposit" and not kwargs:
+                while (end < len(ready) and ready[end][0] == timestamp and ready[end][2] == "deposit"
+                       and not ready[end][4]):
+                    end += 1
+            if end - i > 1:
+                batch = ready[i:end]
+                balances = system.deposit_many(timestamp, [op[3] for op in batch])
+                results.extend(zip((op[1] for op in batch), balances))
+                self.batches += 1
+            else:
+                results.append((ticket, getattr(system, method)(timestamp, *args, **kwargs)))
+            i = end
+        return results
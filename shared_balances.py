@@ -0,0 +1,264 @@
+from multiprocessing import resource_tracker, shared_memory
+import secrets
+import struct
+import sys
+
+# Root segment: generation of the segment currently in use
+ROOT_SIZE = 8
+# Data segment header, in int64 words: capacity, name log capacity, name log bytes used
+HEADER_WORDS = 4
+CAPACITY, NAMES_CAPACITY, NAMES_USED = range(3)
+# Words per account slot: sequence number, balance, outgoing total, live flag
+SLOT_WORDS = 4
+SEQ, BALANCE, OUTGOING, LIVE = range(SLOT_WORDS)
+# Name log entry header: account handle and name length
+NAME_ENTRY = struct.Struct("<qH")
+
+
+# Segments created by a writer in this process
+_CREATED = set()
+
+
+def _segment_name(base: str, generation: int) -> str:
+    return f"{base}_{generation}"
+
+
+def _create(name: str, size: int) -> shared_memory.SharedMemory:
+    segment = shared_memory.SharedMemory(name, create=True, size=size)
+    _CREATED.add(name)
+    return segment
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    '''
+    Map an existing segment without letting this process's resource tracker
+    unlink it at exit, which would pull it from under the writer
+    '''
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    segment = shared_memory.SharedMemory(name)
+    if name not in _CREATED:
+        resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+
+def _segment_size(capacity: int, names_capacity: int) -> int:
+    return 8 * (HEADER_WORDS + SLOT_WORDS * capacity) + names_capacity
+
+
+class SharedBalances:
+    '''
+    Writer side of a shared-memory mirror of current balances and outgoing
+    totals, indexed by account handle
+
+    The mirror is a root segment holding the current generation and a data
+    segment per generation with a header, one int64 slot per account handle,
+    and an append-only log of (handle, name) entries that readers replay
+    from where they left off to keep their account id -> slot map current. A
+    handle given to a different name, e.g. after a rollback, gets a new entry.
+
+    Each slot is guarded by a seqlock: its sequence number is made odd
+    before the values change and even again after, and readers retry until
+    they see the same even number on both sides of their read. This relies on
+    aligned 8-byte stores being atomic, as they are on the platforms CPython
+    supports. When the slots or the name log fill up, everything is copied
+    to a segment twice the size and the root switches readers over to it.
+
+    There must be a single writer. Readers open the mirror by `name` with
+    SharedBalancesReader.
+    '''
+    def __init__(self, name: str | None = None, capacity: int = 1_024, names_capacity: int | None = None):
+        self.name = name or f"bank_{secrets.token_hex(6)}"
+        self._root = _create(self.name, ROOT_SIZE)
+        self._root_words = self._root.buf.cast("q")
+        self._generation = 0
+        self._segment = None
+        self._names = {}  # handle -> name last logged
+        self._high_water = 0
+        self._open(capacity, names_capacity if names_capacity is not None else 32 * capacity)
+
+    def _open(self, capacity: int, names_capacity: int):
+        '''
+        Create the data segment of the next generation, carry the current
+        contents over and switch the root to it
+        '''
+        old = self._segment
+        generation = self._generation + (old is not None)
+        segment = _create(_segment_name(self.name, generation), _segment_size(capacity, names_capacity))
+        words = segment.buf.cast("q")
+        words[CAPACITY] = capacity
+        words[NAMES_CAPACITY] = names_capacity
+        names_offset = 8 * (HEADER_WORDS + SLOT_WORDS * capacity)
+        if old is not None:
+            used_slots = HEADER_WORDS + SLOT_WORDS * self._words[CAPACITY]
+            words[HEADER_WORDS:used_slots] = self._words[HEADER_WORDS:used_slots]
+            used = self._words[NAMES_USED]
+            segment.buf[names_offset:names_offset + used] = self._segment.buf[self._names_offset:self._names_offset + used]
+            words[NAMES_USED] = used
+            self._words.release()
+        self._segment, self._words, self._names_offset = segment, words, names_offset
+        self._generation = generation
+        self._root_words[0] = generation
+        if old is not None:
+            self._release(old)
+
+    @staticmethod
+    def _release(segment):
+        segment.close()
+        segment.unlink()
+        _CREATED.discard(segment.name)
+
+    def _log_name(self, handle: int, name: str):
+        raw = name.encode()
+        words = self._words
+        used = words[NAMES_USED]
+        end = used + NAME_ENTRY.size + len(raw)
+        if end > words[NAMES_CAPACITY]:
+            self._open(words[CAPACITY], max(2 * words[NAMES_CAPACITY], end))
+            return self._log_name(handle, name)
+        start = self._names_offset + used
+        NAME_ENTRY.pack_into(self._segment.buf, start, handle, len(raw))
+        self._segment.buf[start + NAME_ENTRY.size:self._names_offset + end] = raw
+        words[NAMES_USED] = end
+        self._names[handle] = name
+
+    def _write(self, handle: int, balance: int, outgoing: int, live: int):
+        words = self._words
+        base = HEADER_WORDS + SLOT_WORDS * handle
+        words[base + SEQ] += 1
+        words[base + BALANCE] = balance
+        words[base + OUTGOING] = outgoing
+        words[base + LIVE] = live
+        words[base + SEQ] += 1
+        self._high_water = max(self._high_water, handle + 1)
+
+    def publish(self, handle: int, name: str, balance: int, outgoing: int):
+        '''
+        Publish an account's current balance and outgoing total
+
+        :param handle: Account handle, its slot
+        :type handle: int
+        :param name: Account identifier
+        :type name: str
+        :param balance: Current balance
+        :type balance: int
+        :param outgoing: Current outgoing total
+        :type outgoing: int
+        '''
+        words = self._words
+        if handle >= words[CAPACITY]:
+            self._open(max(2 * words[CAPACITY], handle + 1), words[NAMES_CAPACITY])
+        if self._names.get(handle) != name:
+            self._log_name(handle, name)
+        self._write(handle, balance, outgoing, 1)
+
+    def clear(self, handle: int):
+        '''
+        Mark a slot as holding no account, e.g. once its account is merged away
+
+        :param handle: Account handle, its slot
+        :type handle: int
+        '''
+        if handle < self._words[CAPACITY]:
+            self._write(handle, 0, 0, 0)
+
+    def truncate(self, count: int):
+        '''
+        Clear every slot from `count` on, e.g. after handles are rolled back
+
+        :param count: Number of handles still in use
+        :type count: int
+        '''
+        for handle in range(count, self._high_water):
+            self.clear(handle)
+        self._high_water = min(self._high_water, count)
+
+    def close(self):
+        '''
+        Remove the mirror; readers still attached keep their last view
+        '''
+        self._words.release()
+        self._release(self._segment)
+        self._root_words.release()
+        self._release(self._root)
+
+
+class SharedBalancesReader:
+    '''
+    Reader side of a SharedBalances mirror, usable from any process
+    '''
+    def __init__(self, name: str):
+        self.name = name
+        self._root = _attach(name)
+        self._root_words = self._root.buf.cast("q")
+        self._segment = None
+        self._generation = None
+
+    def _map_current(self):
+        '''
+        Map the data segment of the current generation and replay its name log from the start
+        '''
+        if self._segment is not None:
+            self._words.release()
+            self._segment.close()
+        while True:
+            self._generation = self._root_words[0]
+            try:
+                self._segment = _attach(_segment_name(self.name, self._generation))
+                break
+            except FileNotFoundError:
+                continue  # the writer moved on again before we got there
+        self._words = self._segment.buf.cast("q")
+        self._names_offset = 8 * (HEADER_WORDS + SLOT_WORDS * self._words[CAPACITY])
+        self._read = 0
+        self._slots = {}  # name -> handle
+        self._handles = {}  # handle -> name
+
+    def refresh(self):
+        '''
+        Follow the writer to a new segment and apply name log entries added since the last refresh
+        '''
+        if self._root_words[0] != self._generation:
+            self._map_current()
+        used = self._words[NAMES_USED]
+        buf = self._segment.buf
+        while self._read < used:
+            start = self._names_offset + self._read
+            handle, length = NAME_ENTRY.unpack_from(buf, start)
+            name = bytes(buf[start + NAME_ENTRY.size:start + NAME_ENTRY.size + length]).decode()
+            previous = self._handles.get(handle)
+            if previous is not None and self._slots.get(previous) == handle:
+                del self._slots[previous]
+            self._handles[handle] = name
+            self._slots[name] = handle
+            self._read += NAME_ENTRY.size + length
+
+    def get(self, account_id: str) -> tuple[int, int] | None:
+        '''
+        Return an account's current balance and outgoing total
+
+        :param account_id: Account being queried
+        :type account_id: str
+        :return: (balance, outgoing), or None if the account does not exist
+        :rtype: tuple[int, int] | None
+        '''
+        self.refresh()
+        handle = self._slots.get(account_id)
+        if handle is None:
+            return None
+        words = self._words
+        base = HEADER_WORDS + SLOT_WORDS * handle
+        while True:
+            seq = words[base + SEQ]
+            if seq & 1:
+                continue
+            balance, outgoing, live = words[base + BALANCE], words[base + OUTGOING], words[base + LIVE]
+            if words[base + SEQ] == seq:
+                return (balance, outgoing) if live else None
+
+    def close(self):
+        if self._segment is not None:
+            self._words.release()
+            self._segment.close()
+        self._root_words.release()
+        self._root.close()
@@ -0,0 +1,430 @@
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+from collections.abc import Mapping, Sequence
+from itertools import islice
+
+MAGIC = b"BANKSNP6"
+DELTA_MAGIC = b"BANKDLT4"
+# magic, payment_counter, index_offset, index_count, extras_offset, extras_length, next_refund_ts,
+# chain id, sequence number within the chain
+HEADER = struct.Struct("<8sQQQQQqQQ")
+# account id hash, record offset, record length
+INDEX_ENTRY = struct.Struct("<QQI")
+ID_LENGTH = struct.Struct("<I")
+# length of one pickled piece of the extras section
+PIECE_LENGTH = struct.Struct("<Q")
+# list entries or mapping items per piece, small enough that decoding one piece is a short pause
+PIECE_ENTRIES = 4096
+# Kinds of extras pieces
+WHOLE = 0            # the complete value
+ENTRIES = 1          # a run of list entries, appended to the pieces before it
+MORE_ITEMS = 2       # (field, items): more items for a mapping field of the last list entry
+NO_REFUND = -1
+
+# Patch operations stored in delta files, as (op, *args) tuples
+SET = "set"          # (SET, value): replace the value
+EXTEND = "extend"    # (EXTEND, start, entries): truncate a history to `start` entries, then append
+UPDATE = "update"    # (UPDATE, items): update a dict with `items`
+KEYED = "keyed"      # (KEYED, changes): replace items of a sorted list of (sort key, account) by account
+
+
+def account_hash(acc: str) -> int:
+    '''
+    Stable 64-bit hash of an account identifier used to key the snapshot index
+
+    :param acc: Account identifier
+    :type acc: str
+    :return: Unsigned 64-bit hash
+    :rtype: int
+    '''
+    return int.from_bytes(hashlib.blake2b(acc.encode(), digest_size=8).digest(), "little")
+
+
+def encode_record(acc: str, record: dict) -> bytes:
+    '''
+    Serialize one account record as id length, id bytes and a pickled payload
+
+    :param acc: Account identifier
+    :type acc: str
+    :param record: Per-account state keyed by the name of the structure it came from
+    :type record: dict
+    :rtype: bytes
+    '''
+    raw_id = acc.encode()
+    return ID_LENGTH.pack(len(raw_id)) + raw_id + pickle.dumps(record, protocol=5)
+
+
+def apply_patch(value, op: tuple):
+    '''
+    Apply one delta patch operation to a value from an earlier file in the chain
+
+    :param value: Current value, or None if there is none yet
+    :param op: Patch operation
+    :type op: tuple
+    :return: The patched value
+    '''
+    kind = op[0]
+    if kind == SET:
+        return op[1]
+    if kind == EXTEND:
+        _, start, entries = op
+        if value is None:
+            value = []
+        while len(value) > start:
+            value.pop()
+        for entry in entries:
+            value.append(entry)
+        return value
+    if kind == UPDATE:
+        if value is None:
+            value = {}
+        value.update(op[1])
+        return value
+    if kind == KEYED:
+        changes = op[1]
+        items = [item for item in value if item[1] not in changes]
+        items.extend(item for item in changes.values() if item is not None)
+        items.sort()
+        return items
+    raise ValueError(f"unknown patch operation {kind!r}")
+
+
+def _extras_pieces(extras: dict):
+    '''
+    Split the extras into (name, kind, value) pieces, cutting lists, deques
+    and other sequences except tuples (patch operations) into runs of about
+    `PIECE_ENTRIES` entries and items. A mapping held in a tuple entry, such
+    as the state of a spending checkpoint, counts its items towards the run;
+    past `PIECE_ENTRIES` items the rest follow as MORE_ITEMS pieces.
+    '''
+    for name, value in extras.items():
+        if isinstance(value, tuple) or not isinstance(value, Sequence):
+            yield name, WHOLE, value
+            continue
+        run, size, written = [], 0, False
+        for entry in value:
+            more = []
+            if type(entry) is tuple:
+                fields = list(entry)
+                for field, item in enumerate(entry):
+                    if isinstance(item, Mapping):
+                        if len(item) > PIECE_ENTRIES:
+                            items = iter(item.items())
+                            fields[field] = dict(islice(items, PIECE_ENTRIES))
+                            more.append((field, items))
+                        size += len(fields[field])
+                if more:
+                    entry = tuple(fields)
+            run.append(entry)
+            size += 1
+            if size >= PIECE_ENTRIES:
+                yield name, ENTRIES, run
+                run, size, written = [], 0, True
+            for field, items in more:
+                while chunk := dict(islice(items, PIECE_ENTRIES)):
+                    yield name, MORE_ITEMS, (field, chunk)
+        if run or not written:
+            yield name, ENTRIES, run
+
+
+def write_snapshot(path: str, records, extras: dict, payment_counter: int,
+                   next_refund_ts: int | None, raw_records=(), chain_id: int = 0, sequence: int = 0,
+                   magic: bytes = MAGIC, config: dict | None = None):
+    '''
+    Write a full snapshot or delta file
+
+    The configuration of the writing system comes right after the header,
+    then the records, followed by an index sorted by account hash and
+    an extras section holding system-wide structures such as the cashback
+    queue. Lists in the extras are written as pieces of `PIECE_ENTRIES`
+    entries so a reader can decode them a bit at a time. The file is
+    written next to `path` and renamed into place. A delta file has the
+    same layout, with records and extras holding patch operations against
+    the previous file in its chain.
+
+    :param path: Destination file
+    :type path: str
+    :param records: Iterable of (account, record dict) pairs
+    :param extras: System-wide structures keyed by attribute name
+    :type extras: dict
+    :param payment_counter: Number of payments issued so far
+    :type payment_counter: int
+    :param next_refund_ts: Earliest pending refund, or None
+    :type next_refund_ts: int | None
+    :param raw_records: Extra (account, encoded record) pairs copied verbatim,
+        used for records that were never materialized from a previous snapshot
+    :param chain_id: Identifier shared by a full snapshot and its deltas
+    :type chain_id: int
+    :param sequence: Position in the chain, 0 for a freshly taken full snapshot
+    :type sequence: int
+    :param magic: MAGIC for a full snapshot, DELTA_MAGIC for a delta
+    :type magic: bytes
+    :param config: Constructor arguments needed to rebuild an equivalent system
+    :type config: dict | None
+    '''
+    tmp_path = f"{path}.tmp"
+    index = []
+    with open(tmp_path, "wb") as f:
+        f.write(b"\0" * HEADER.size)
+        data = pickle.dumps(config or {}, protocol=5)
+        f.write(PIECE_LENGTH.pack(len(data)))
+        f.write(data)
+        offset = HEADER.size + PIECE_LENGTH.size + len(data)
+        encoded = ((acc, encode_record(acc, record)) for acc, record in records)
+        for source in (encoded, raw_records):
+            for acc, data in source:
+                f.write(data)
+                index.append((account_hash(acc), offset, len(data)))
+                offset += len(data)
+        index.sort()
+        index_offset = offset
+        f.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in index))
+        extras_offset = index_offset + len(index) * INDEX_ENTRY.size
+        extras_length = 0
+        for piece in _extras_pieces(extras):
+            data = pickle.dumps(piece, protocol=5)
+            f.write(PIECE_LENGTH.pack(len(data)))
+            f.write(data)
+            extras_length += PIECE_LENGTH.size + len(data)
+        f.seek(0)
+        f.write(HEADER.pack(magic, payment_counter, index_offset, len(index), extras_offset, extras_length,
+                            NO_REFUND if next_refund_ts is None else next_refund_ts, chain_id, sequence))
+    os.replace(tmp_path, path)
+
+
+class SnapshotReader:
+    '''
+    Read-only, memory-mapped view of a snapshot file
+
+    Opening a snapshot only parses the fixed-size header; account records are
+    located by binary search over the on-disk index and decoded on demand.
+    '''
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.payment_counter, self._index_offset, self.count,
+         self._extras_offset, self._extras_length, next_refund_ts,
+         self.chain_id, self.sequence) = HEADER.unpack_from(self._map, 0)
+        if magic not in (MAGIC, DELTA_MAGIC):
+            self.close()
+            raise ValueError(f"{path} is not a banking snapshot")
+        self.delta = magic == DELTA_MAGIC
+        (length,) = PIECE_LENGTH.unpack_from(self._map, HEADER.size)
+        start = HEADER.size + PIECE_LENGTH.size
+        self.config = pickle.loads(self._map[start:start + length])
+        self.next_refund_ts = None if next_refund_ts == NO_REFUND else next_refund_ts
+
+    def _entry(self, i: int) -> tuple:
+        return INDEX_ENTRY.unpack_from(self._map, self._index_offset + i * INDEX_ENTRY.size)
+
+    def _record_id(self, offset: int) -> tuple:
+        (length,) = ID_LENGTH.unpack_from(self._map, offset)
+        start = offset + ID_LENGTH.size
+        return self._map[start:start + length].decode(), start + length
+
+    def raw(self, acc: str) -> bytes | None:
+        '''
+        Return the encoded record for an account without decoding it
+
+        :param acc: Account identifier
+        :type acc: str
+        :rtype: bytes | None
+        '''
+        target = account_hash(acc)
+        left, right = 0, self.count
+        while left < right:
+            mid = (left + right) // 2
+            if self._entry(mid)[0] < target:
+                left = mid + 1
+            else:
+                right = mid
+        while left < self.count:
+            h, offset, length = self._entry(left)
+            if h != target:
+                break
+            if self._record_id(offset)[0] == acc:
+                return self._map[offset:offset + length]
+            left += 1
+        return None
+
+    def get(self, acc: str) -> dict | None:
+        '''
+        Look up and decode the record of one account
+
+        :param acc: Account identifier
+        :type acc: str
+        :return: Record dict or None
+        :rtype: dict | None
+        '''
+        data = self.raw(acc)
+        if data is None:
+            return None
+        (length,) = ID_LENGTH.unpack_from(data, 0)
+        return pickle.loads(data[ID_LENGTH.size + length:])
+
+    def records(self):
+        '''
+        Iterate over every (account, record) pair in index order
+        '''
+        for i in range(self.count):
+            _, offset, length = self._entry(i)
+            acc, payload_start = self._record_id(offset)
+            yield acc, pickle.loads(self._map[payload_start:offset + length])
+
+    def raw_records(self):
+        '''
+        Iterate over every (account, encoded record) pair without decoding payloads
+        '''
+        for i in range(self.count):
+            _, offset, length = self._entry(i)
+            yield self._record_id(offset)[0], self._map[offset:offset + length]
+
+    def accounts(self):
+        '''
+        Iterate over the account identifiers without decoding payloads
+        '''
+        for i in range(self.count):
+            yield self._record_id(self._entry(i)[1])[0]
+
+    def load_extras(self, pause=None) -> dict:
+        '''
+        Decode the system-wide structures stored after the index
+
+        Lists come back as lists whatever type they were written from.
+
+        :param pause: Called after each decoded piece, e.g. to let other
+            threads run while the extras load in the background
+        :return: Structures keyed by attribute name
+        :rtype: dict
+        '''
+        extras = {}
+        offset = self._extras_offset
+        end = offset + self._extras_length
+        while offset < end:
+            (length,) = PIECE_LENGTH.unpack_from(self._map, offset)
+            offset += PIECE_LENGTH.size
+            name, kind, value = pickle.loads(self._map[offset:offset + length])
+            offset += length
+            if kind == MORE_ITEMS:
+                field, items = value
+                extras[name][-1][field].update(items)
+            elif kind == ENTRIES and name in extras:
+                extras[name].extend(value)
+            else:
+                extras[name] = value
+            if pause is not None:
+                pause()
+        return extras
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class SnapshotChain:
+    '''
+    Read-only view of a full snapshot followed by the deltas written after it
+
+    Exposes the same interface as SnapshotReader. A record is decoded from the
+    full snapshot and then patched by every delta that touched the account,
+    so untouched accounts cost the same as with a single file.
+    '''
+    def __init__(self, path: str, delta_paths):
+        self._base = SnapshotReader(path)
+        self._deltas = []
+        try:
+            if self._base.delta:
+                raise ValueError(f"{path} is a delta, not a full snapshot")
+            previous = self._base
+            for delta_path in delta_paths:
+                delta = SnapshotReader(delta_path)
+                self._deltas.append(delta)
+                if not delta.delta:
+                    raise ValueError(f"{delta_path} is a full snapshot, not a delta")
+                if delta.chain_id != previous.chain_id or delta.sequence != previous.sequence + 1:
+                    raise ValueError(f"{delta_path} does not follow sequence {previous.sequence} of the chain")
+                previous = delta
+        except ValueError:
+            self.close()
+            raise
+        self.payment_counter = previous.payment_counter
+        self.config = previous.config
+        self.next_refund_ts = previous.next_refund_ts
+        self.chain_id = previous.chain_id
+        self.sequence = previous.sequence
+        self._changed = None
+
+    def _changed_accounts(self) -> set:
+        if self._changed is None:
+            self._changed = set()
+            for delta in self._deltas:
+                self._changed.update(delta.accounts())
+        return self._changed
+
+    def _patch(self, record: dict | None, patch: dict) -> dict | None:
+        record = record or {}
+        return {name: apply_patch(record.get(name), op) for name, op in patch.items()} or None
+
+    def get(self, acc: str) -> dict | None:
+        '''
+        Look up one account and apply the deltas that touched it
+
+        :param acc: Account identifier
+        :type acc: str
+        :return: Record dict or None
+        :rtype: dict | None
+        '''
+        record = self._base.get(acc)
+        for delta in self._deltas:
+            patch = delta.get(acc)
+            if patch is not None:
+                record = self._patch(record, patch)
+        return record
+
+    def records(self):
+        '''
+        Iterate over every (account, record) pair of the patched state
+        '''
+        changed = self._changed_accounts()
+        for acc, record in self._base.records():
+            if acc not in changed:
+                yield acc, record
+        for acc in changed:
+            record = self.get(acc)
+            if record is not None:
+                yield acc, record
+
+    def raw_records(self):
+        '''
+        Iterate over every (account, encoded record) pair, re-encoding only the
+        accounts touched by a delta
+        '''
+        changed = self._changed_accounts()
+        for acc, data in self._base.raw_records():
+            if acc not in changed:
+                yield acc, data
+        for acc in changed:
+            record = self.get(acc)
+            if record is not None:
+                yield acc, encode_record(acc, record)
+
+    def load_extras(self, pause=None) -> dict:
+        '''
+        Decode the system-wide structures and apply every delta to them
+
+        :param pause: Called after each decoded piece, as for SnapshotReader
+        :return: Structures keyed by attribute name
+        :rtype: dict
+        '''
+        extras = self._base.load_extras(pause)
+        for delta in self._deltas:
+            for name, op in delta.load_extras(pause).items():
+                extras[name] = apply_patch(extras.get(name), op)
+        return extras
+
+    def close(self):
+        for reader in (self._base, *self._deltas):
+            reader.close()
@@ -0,0 +1,119 @@
+from array import array
+
+
+class SpendWindow:
+    '''
+    Amount one account spent over a rolling window, kept in a ring of
+    fixed-width time buckets
+
+    Spending is added to the bucket of its timestamp and buckets are cleared
+    as time moves past them, so updates and queries cost O(1) amortized and
+    never more than one pass over the ring. The ring holds one bucket more
+    than the window spans, so the partly elapsed oldest bucket is still
+    counted: the reported amount covers at least the whole window and at most
+    one bucket more, which errs on the side of rejecting.
+
+    `limit` overrides the system-wide limit for this account when not None.
+    '''
+    __slots__ = ("bucket_ms", "head", "total", "counts", "limit")
+
+    def __init__(self, window_ms: int, buckets: int = 24, limit: int | None = None):
+        self.bucket_ms = -(-window_ms // buckets)
+        self.head = 0
+        self.total = 0
+        self.counts = array("q", bytes(8 * (buckets + 1)))
+        self.limit = limit
+
+    def copy(self) -> "SpendWindow":
+        other = SpendWindow.__new__(SpendWindow)
+        other.bucket_ms = self.bucket_ms
+        other.head = self.head
+        other.total = self.total
+        other.counts = array("q", self.counts)
+        other.limit = self.limit
+        return other
+
+    def _expired(self, bucket: int) -> int:
+        '''
+        Return how much of the total falls out of the window by `bucket`
+        '''
+        counts = self.counts
+        steps = bucket - self.head
+        if steps <= 0:
+            return 0
+        if steps >= len(counts):
+            return self.total
+        return sum(counts[(self.head + k) % len(counts)] for k in range(1, steps + 1))
+
+    def spent(self, timestamp: int) -> int:
+        '''
+        Return the amount spent in the window ending at `timestamp`
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :rtype: int
+        '''
+        return self.total - self._expired(timestamp // self.bucket_ms)
+
+    def advance(self, timestamp: int):
+        '''
+        Clear the buckets that `timestamp` has moved past
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        '''
+        bucket = timestamp // self.bucket_ms
+        if bucket <= self.head:
+            return
+        counts = self.counts
+        if bucket - self.head >= len(counts):
+            counts[:] = array("q", bytes(8 * len(counts)))
+            self.total = 0
+        else:
+            for k in range(self.head + 1, bucket + 1):
+                self.total -= counts[k % len(counts)]
+                counts[k % len(counts)] = 0
+        self.head = bucket
+
+    def add(self, timestamp: int, amount: int):
+        '''
+        Record spending at `timestamp`
+
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        :param amount: Amount spent
+        :type amount: int
+        '''
+        self.advance(timestamp)
+        self.counts[self.head % len(self.counts)] += amount
+        self.total += amount
+
+    def absorb(self, other: "SpendWindow", timestamp: int):
+        '''
+        Add the spending another window still holds at `timestamp`, e.g. when
+        its account is merged into this one; `other` is left unchanged
+
+        :param other: Window of the same geometry
+        :type other: SpendWindow
+        :param timestamp: Current timestamp
+        :type timestamp: int
+        '''
+        self.advance(timestamp)
+        counts = self.counts
+        size = len(counts)
+        for bucket in range(other.head, other.head - size, -1):
+            if bucket <= self.head - size:
+                break
+            amount = other.counts[bucket % size]
+            counts[min(bucket, self.head) % size] += amount
+            self.total += amount
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, SpendWindow) and self.bucket_ms == other.bucket_ms and self.head == other.head
+                and self.total == other.total and self.counts == other.counts and self.limit == other.limit)
+
+    def __getstate__(self):
+        return self.bucket_ms, self.head, self.total, self.counts, self.limit
+
+    def __setstate__(self, state):
+        self.bucket_ms, self.head, self.total, self.counts, self.limit = state
@@ -0,0 +1,148 @@
+import os
+import tempfile
+import unittest
+from banking_system_impl import BankingSystemImpl
+from history_codec import CompressedHistory
+
+DAY = 86_400_000
+ACCOUNTS = [f'account{i}' for i in range(10)]
+
+
+def build(system):
+    for acc in ACCOUNTS:
+        system.create_account(1, acc)
+        system.deposit(2, acc, 10_000)
+    ts = 3
+    for day in range(4):
+        for i, acc in enumerate(ACCOUNTS):
+            ts = day * DAY + 10 + i
+            system.pay(ts, acc, 100 + i)
+            system.transfer(ts, acc, ACCOUNTS[(i + 1) % len(ACCOUNTS)], 5)
+    return ts
+
+
+def statuses(system):
+    return {(acc, f'payment{n}'): system.get_payment_status(4 * DAY, acc, f'payment{n}')
+            for acc in ACCOUNTS for n in range(1, system.payment_counter + 2)}
+
+
+class AccountCompactionTests(unittest.TestCase):
+    """
+    Tests for compacting settled payments and folding merged accounts.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.system = BankingSystemImpl(history_retention_ms=DAY, transaction_log=True)
+        cls.reference = BankingSystemImpl(transaction_log=True)
+        cls.now = build(cls.system)
+        build(cls.reference)
+
+    def test_settled_payments_still_answer(self):
+        expected = statuses(self.reference)
+        self.assertTrue(self.system.compact_accounts(self.now, max_accounts=None))
+        self.assertEqual(statuses(self.system), expected)
+        self.assertEqual(self.system.get_payment_status(self.now, 'account0', 'payment'), None)
+        self.assertEqual(self.system.get_payment_status(self.now, 'account0', 'paymentx'), None)
+        for acc in ACCOUNTS:
+            self.assertEqual(len(self.system.payments[acc]), 1)
+            self.assertEqual(len(self.system.settled_payments[acc]), 3)
+        metrics = self.system.compaction_metrics()
+        self.assertEqual(metrics['payments_compacted'], 30)
+        self.assertGreater(metrics['bytes_reclaimed'], 0)
+
+    def test_incremental_passes(self):
+        self.assertFalse(self.system.compact_accounts(self.now, max_accounts=4))
+        self.assertFalse(self.system.compact_accounts(self.now, max_accounts=4))
+        self.assertTrue(self.system.compact_accounts(self.now, max_accounts=4))
+        self.assertEqual(self.system.compaction_metrics()['payments_compacted'], 30)
+        later = self.now + 2 * DAY
+        self.system.get_balance(later, 'account0', later)
+        self.reference.get_balance(later, 'account0', later)
+        self.assertTrue(self.system.compact_accounts(later, max_accounts=None))
+        self.assertEqual(self.system.compaction_metrics()['payments_compacted'], 40)
+        self.assertEqual(len(self.system.settled_payments['account0']), 4)
+        self.assertEqual(statuses(self.system), statuses(self.reference))
+
+    def test_merge_moves_settled_payments(self):
+        self.system.compact_accounts(self.now, max_accounts=None)
+        self.system.merge_accounts(self.now + 1, 'account1', 'account2')
+        self.reference.merge_accounts(self.now + 1, 'account1', 'account2')
+        self.assertNotIn('account2', self.system.settled_payments)
+        self.assertEqual(list(self.system.settled_payments['account1']),
+                         sorted(self.system.settled_payments['account1']))
+        self.assertEqual(statuses(self.system), statuses(self.reference))
+
+    def test_fold_merged_accounts(self):
+        for system in (self.system, self.reference):
+            for day in range(4, 24):
+                system.deposit(day * DAY, 'account2', day)
+            system.merge_accounts(24 * DAY + 1, 'account1', 'account2')
+        later = 26 * DAY
+        self.assertTrue(self.system.compact_accounts(25 * DAY, max_accounts=None))
+        self.assertIs(type(self.system.balance_history['account2']), list)
+        self.assertTrue(self.system.compact_accounts(later, max_accounts=None))
+        folded = self.system.balance_history['account2']
+        self.assertIsInstance(folded, CompressedHistory)
+        self.assertTrue(folded.sealed)
+        self.assertEqual(len(folded), 25)
+        for day in range(24):
+            end = (day + 1) * DAY - 1
+            self.assertEqual(self.system.get_balance(later, 'account2', end),
+                             self.reference.get_balance(later, 'account2', end))
+        self.assertIsNone(self.system.get_balance(later, 'account2', 24 * DAY + 1))
+        self.assertEqual(self.system.get_statement(later, 'account2', 0, later),
+                         self.reference.get_statement(later, 'account2', 0, later))
+        self.assertEqual(self.system.top_spenders_at(later, 10, self.now),
+                         self.reference.top_spenders_at(later, 10, self.now))
+        self.assertEqual(self.system.get_balance(later, 'account1', later),
+                         self.reference.get_balance(later, 'account1', later))
+        metrics = self.system.compaction_metrics()
+        self.assertEqual(metrics['histories_folded'], 1)
+        self.assertTrue(self.system.compact_accounts(later + DAY, max_accounts=None))
+        self.assertEqual(self.system.compaction_metrics(), metrics)
+        self.assertTrue(self.system.create_account(later, 'account2'))
+        self.assertEqual(self.system.get_balance(later, 'account2', later), 0)
+
+    def test_fold_without_retention(self):
+        self.reference.merge_accounts(self.now + 1, 'account1', 'account2')
+        history = list(self.reference.balance_history['account2'])
+        self.assertTrue(self.reference.compact_accounts(self.now + 1, max_accounts=None))
+        self.assertIsInstance(self.reference.balance_history['account2'], CompressedHistory)
+        self.assertEqual(list(self.reference.balance_history['account2']), history)
+        self.assertEqual(self.reference.compaction_metrics()['histories_folded'], 1)
+        for ts, balance in dict(history).items():
+            self.assertEqual(self.reference.get_balance(self.now + 1, 'account2', ts), balance)
+        self.assertIsNone(self.reference.get_balance(self.now + 1, 'account2', self.now + 1))
+
+    def test_savepoint_defers_compaction(self):
+        savepoint = self.system.savepoint()
+        self.assertTrue(self.system.compact_accounts(self.now, max_accounts=None))
+        self.assertEqual(self.system.compaction_metrics()['payments_compacted'], 0)
+        self.system.release(savepoint)
+        self.system.compact_accounts(self.now, max_accounts=None)
+        savepoint = self.system.savepoint()
+        self.system.merge_accounts(self.now + 1, 'account1', 'account2')
+        self.system.rollback(savepoint)
+        self.system.release(savepoint)
+        self.assertEqual(len(self.system.settled_payments['account2']), 3)
+        self.assertEqual(statuses(self.system), statuses(self.reference))
+
+    def test_tick_compacts(self):
+        self.system.advance_time(self.now + 2 * DAY, limit=None)
+        while not self.system.tick(limit=3):
+            pass
+        self.assertEqual(self.system.compaction_metrics()['payments_compacted'], 40)
+
+    def test_checkpoint_after_compaction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.system.snapshot(os.path.join(tmp, 'full'))
+            self.system.merge_accounts(self.now + 1, 'account1', 'account2')
+            self.system.compact_accounts(self.now + 2 * DAY, max_accounts=None)
+            self.system.checkpoint(os.path.join(tmp, 'delta'))
+            restored = BankingSystemImpl.restore(os.path.join(tmp, 'full'), deltas=[os.path.join(tmp, 'delta')])
+            for name in ('payments', 'settled_payments', 'balance_history', 'merged_time', 'transactions'):
+                self.assertEqual(getattr(restored, name), getattr(self.system, name))
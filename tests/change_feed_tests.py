@@ -0,0 +1,62 @@
+import unittest
+from banking_system_impl import BankingSystemImpl
+from change_feed import ChangeFeed, ConsumerLagged
+
+
+class ChangeFeedTests(unittest.TestCase):
+    """
+    Tests for the change-data-capture ring buffer.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.feed = ChangeFeed(capacity=8)
+        cls.system = BankingSystemImpl(change_feed=cls.feed)
+
+    def test_every_mutation_emits_an_event(self):
+        subscription = self.feed.subscribe(0)
+        self.system.create_account(1, 'account1')
+        self.system.create_account(2, 'account2')
+        self.system.deposit(3, 'account1', 1000)
+        self.system.transfer(4, 'account1', 'account2', 400)
+        self.system.pay(5, 'account1', 100)
+        self.assertIsNone(self.system.deposit(6, 'missing', 5))
+        self.system.merge_accounts(7, 'account2', 'account1')
+        self.system.get_balance(86400005, 'account2', 0)
+        events = subscription.poll()
+        self.assertEqual([e[0] for e in events], list(range(8)))
+        self.assertEqual(events, [
+            (0, 'create', 1, 'account1', 0, 0, None),
+            (1, 'create', 2, 'account2', 0, 0, None),
+            (2, 'deposit', 3, 'account1', 1000, 1000, None),
+            (3, 'transfer_out', 4, 'account1', 400, 600, 'account2'),
+            (4, 'transfer_in', 4, 'account2', 400, 400, 'account1'),
+            (5, 'pay', 5, 'account1', 100, 500, 'payment1'),
+            (6, 'merge', 7, 'account2', 500, 900, 'account1'),
+            (7, 'cashback', 86400005, 'account2', 2, 902, 'payment1'),
+        ])
+        self.assertEqual(subscription.lag, 0)
+
+    def test_resume_with_offset(self):
+        subscription = self.feed.subscribe()
+        self.system.create_account(1, 'account1')
+        self.system.deposit(2, 'account1', 10)
+        self.assertEqual(len(subscription.poll(limit=1)), 1)
+        self.system.deposit(3, 'account1', 10)
+        self.assertEqual([e[0] for e in subscription.poll()], [1, 2])
+        self.assertEqual(subscription.poll(), [])
+
+    def test_lagging_consumer_is_dropped(self):
+        subscription = self.feed.subscribe()
+        self.system.create_account(1, 'account1')
+        self.system.deposit_many(2, [('account1', 1)] * 10)
+        with self.assertRaises(ConsumerLagged):
+            subscription.poll()
+        self.assertNotIn(subscription, self.feed.subscriptions)
+        with self.assertRaises(ConsumerLagged):
+            subscription.poll()
+        subscription.resync(self.feed.oldest_seq)
+        self.assertEqual([e[0] for e in subscription.poll()], list(range(3, 11)))
@@ -0,0 +1,148 @@
+import os
+import random
+import tempfile
+import unittest
+from banking_system_impl import BankingSystemImpl
+
+ACCOUNTS = [f'account{i}' for i in range(8)]
+STATE = (
+    'balances', 'outgoing', 'payments', 'payment_counter', 'merged_time', 'balance_history', 'cashback',
+    'sorted_outgoing', 'outgoing_key_map', 'outgoing_history', 'outgoing_change_ts', 'outgoing_change_accounts',
+    'spending_checkpoints', 'pending_cashback', 'total_balance', 'total_outgoing', 'total_balance_history',
+    'total_outgoing_history', 'transactions', 'account_names', 'account_handles', 'sorted_accounts',
+    'settled_payments', 'spend_windows',
+)
+
+
+def run_operations(system, seed, start, count, step=1):
+    rng = random.Random(seed)
+    for ts in range(start, start + count * step, step):
+        acc, other = rng.choice(ACCOUNTS), rng.choice(ACCOUNTS)
+        roll, amount = rng.random(), rng.randint(1, 300)
+        if roll < 0.1:
+            system.create_account(ts, acc)
+        elif roll < 0.35:
+            system.deposit(ts, acc, amount)
+        elif roll < 0.4:
+            system.deposit_many(ts, [(acc, amount), (other, amount)])
+        elif roll < 0.55:
+            system.transfer(ts, acc, other, amount)
+        elif roll < 0.6:
+            system.settle_transfers(ts, [(acc, other, amount), (other, acc, amount // 2)])
+        elif roll < 0.95:
+            system.pay(ts, acc, amount)
+        else:
+            system.merge_accounts(ts, acc, other)
+
+
+class CheckpointTests(unittest.TestCase):
+    """
+    Tests for incremental checkpoints on top of a full snapshot.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.system = BankingSystemImpl(spending_checkpoint_interval=7, transaction_log=True, total_history=True)
+        run_operations(cls.system, 1, 1, 300)
+        cls.system.snapshot(cls.path('full'))
+
+    @classmethod
+    def path(cls, name):
+        return os.path.join(cls.tmp.name, name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def state(self, system):
+        system._await_indexes()
+        return {name: getattr(system, name) for name in STATE}
+
+    def write_deltas(self, count):
+        deltas = []
+        for i in range(count):
+            # every other interval crosses a day so that cashbacks settle
+            run_operations(self.system, i + 2, 1_000 + i * 50_000_000, 100, step=500_000)
+            deltas.append(self.path(f'delta{i}'))
+            self.system.checkpoint(deltas[-1])
+        return deltas
+
+    def test_restore_chain_matches_live_state(self):
+        deltas = self.write_deltas(3)
+        restored = BankingSystemImpl.restore(self.path('full'), deltas=deltas)
+        self.assertEqual(self.state(restored), self.state(self.system))
+
+    def test_lazy_restore_chain(self):
+        deltas = self.write_deltas(3)
+        restored = BankingSystemImpl.restore(self.path('full'), lazy=True, deltas=deltas)
+        for acc in ACCOUNTS:
+            for time_at in (150, 50_000_000, 120_000_000):
+                self.assertEqual(restored.get_balance(200_000_000, acc, time_at),
+                                 self.system.get_balance(200_000_000, acc, time_at))
+            for payment in range(1, self.system.payment_counter + 1):
+                self.assertEqual(restored.get_payment_status(200_000_000, acc, f'payment{payment}'),
+                                 self.system.get_payment_status(200_000_000, acc, f'payment{payment}'))
+        self.assertEqual(restored.top_spenders(200_000_000, 8), self.system.top_spenders(200_000_000, 8))
+        self.assertEqual(self.state(restored), self.state(self.system))
+        restored.close()
+
+    def test_delta_holds_only_changes(self):
+        self.system.deposit(1_000, 'account1', 5)
+        self.system.checkpoint(self.path('small'))
+        self.assertLess(os.path.getsize(self.path('small')), os.path.getsize(self.path('full')) // 4)
+        restored = BankingSystemImpl.restore(self.path('full'), deltas=[self.path('small')])
+        self.assertEqual(self.state(restored), self.state(self.system))
+
+    def test_compact_then_continue_chain(self):
+        deltas = self.write_deltas(2)
+        BankingSystemImpl.compact(self.path('full'), deltas, self.path('compacted'))
+        restored = BankingSystemImpl.restore(self.path('compacted'))
+        self.assertEqual(self.state(restored), self.state(self.system))
+        run_operations(self.system, 9, 200_000_000, 50)
+        self.system.checkpoint(self.path('after'))
+        restored = BankingSystemImpl.restore(self.path('compacted'), deltas=[self.path('after')])
+        self.assertEqual(self.state(restored), self.state(self.system))
+
+    def test_restored_system_continues_chain(self):
+        deltas = self.write_deltas(1)
+        restored = BankingSystemImpl.restore(self.path('full'), lazy=True, deltas=deltas)
+        # the checkpoint interval is configuration, not part of the snapshot
+        restored.spending_checkpoint_interval = 7
+        run_operations(restored, 10, 200_000_000, 50)
+        restored.checkpoint(self.path('next'))
+        restored.close()
+        again = BankingSystemImpl.restore(self.path('full'), deltas=deltas + [self.path('next')])
+        run_operations(self.system, 10, 200_000_000, 50)
+        self.assertEqual(self.state(again), self.state(self.system))
+
+    def test_rollback_before_checkpoint(self):
+        savepoint = self.system.savepoint()
+        run_operations(self.system, 11, 1_000, 50)
+        with self.assertRaises(ValueError):
+            self.system.checkpoint(self.path('refused'))
+        self.system.rollback(savepoint)
+        self.system.release(savepoint)
+        self.system.checkpoint(self.path('delta'))
+        restored = BankingSystemImpl.restore(self.path('full'), deltas=[self.path('delta')])
+        self.assertEqual(self.state(restored), self.state(self.system))
+
+    def test_compressed_histories(self):
+        system = BankingSystemImpl(history_block_size=4)
+        run_operations(system, 12, 1, 200)
+        system.snapshot(self.path('compressed'))
+        run_operations(system, 13, 1_000, 200)
+        system.checkpoint(self.path('compressed_delta'))
+        restored = BankingSystemImpl.restore(self.path('compressed'), deltas=[self.path('compressed_delta')])
+        self.assertEqual(self.state(restored), self.state(system))
+
+    def test_broken_chains_are_rejected(self):
+        deltas = self.write_deltas(2)
+        with self.assertRaises(ValueError):
+            BankingSystemImpl.restore(self.path('full'), deltas=deltas[1:])
+        with self.assertRaises(ValueError):
+            BankingSystemImpl.restore(deltas[0])
+        with self.assertRaises(ValueError):
+            BankingSystemImpl().checkpoint(self.path('nothing'))
@@ -0,0 +1,39 @@
+import unittest
+from banking_system_impl import BankingSystemImpl
+
+
+class DepositManyTests(unittest.TestCase):
+    """
+    Tests for bulk deposits at a single timestamp.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.system = BankingSystemImpl()
+        for i in range(5):
+            cls.system.create_account(i + 1, f'account{i}')
+
+    def test_returns_balances_in_input_order(self):
+        self.assertEqual(self.system.deposit(10, 'account1', 100), 100)
+        result = self.system.deposit_many(11, [('account1', 50), ('missing', 10), ('account0', 5), ('account1', 1)])
+        self.assertEqual(result, [150, None, 5, 151])
+        self.assertEqual(self.system.get_balance(12, 'account1', 11), 151)
+        self.assertEqual(self.system.get_balance(13, 'account0', 11), 5)
+
+    def test_matches_sequential_deposits(self):
+        other = BankingSystemImpl()
+        for i in range(5):
+            other.create_account(i + 1, f'account{i}')
+        items = [(f'account{i % 5}', i * 10) for i in range(20)]
+        expected = [other.deposit(20, acc, amount) for acc, amount in items]
+        self.assertEqual(self.system.deposit_many(20, items), expected)
+        self.assertEqual(self.system.balance_history, other.balance_history)
+
+    def test_cashback_settles_before_batch(self):
+        self.assertEqual(self.system.deposit(10, 'account2', 1000), 1000)
+        self.assertEqual(self.system.pay(11, 'account2', 500), 'payment1')
+        self.assertEqual(self.system.deposit_many(86400011, [('account2', 100)]), [610])
+        self.assertEqual(self.system.get_payment_status(86400012, 'account2', 'payment1'), 'CASHBACK_RECEIVED')
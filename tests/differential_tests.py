@@ -0,0 +1,54 @@
+import unittest
+import differential
+from banking_system_impl import BankingSystemImpl
+
+
+class OffByOneDeposits(BankingSystemImpl):
+    """
+    Implementation with a planted bug for the harness to find.
+    """
+
+    def deposit(self, timestamp, account_id, amount, **kwargs):
+        if amount % 97 == 0:
+            amount += 1
+        return super().deposit(timestamp, account_id, amount, **kwargs)
+
+
+class DifferentialTests(unittest.TestCase):
+    """
+    Tests for the differential harness against the reference model.
+    """
+
+    failureException = Exception
+
+
+    def test_operations_are_reproducible(self):
+        ops = differential.generate_operations(500, 10, seed=3)
+        self.assertEqual(ops, differential.generate_operations(500, 10, seed=3))
+        self.assertEqual({method for method, _ in ops}, {
+            'create_account', 'deposit', 'transfer', 'pay', 'get_payment_status', 'merge_accounts',
+            'get_balance', 'top_spenders',
+        })
+        timestamps = [args[0] for _, args in ops]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_implementations_match_reference(self):
+        for impl in ('memory', 'memory-limits', 'sqlite'):
+            for seed in range(3):
+                ops = differential.generate_operations(3_000, 12, seed)
+                self.assertIsNone(differential.find_mismatch(impl, ops))
+
+    def test_mismatch_is_shrunk(self):
+        ops = differential.generate_operations(3_000, 12, seed=1)
+        index, expected, actual = differential.find_mismatch(OffByOneDeposits, ops)
+        self.assertEqual(actual, expected + 1)
+        shrunk = differential.shrink(OffByOneDeposits, ops)
+        self.assertEqual([method for method, _ in shrunk], ['create_account', 'deposit'])
+        self.assertEqual(shrunk[1][1][2] % 97, 0)
+
+    def test_process_pool_run(self):
+        self.assertEqual(differential.run('memory', 4_000, 1_000, 12, workers=2), [])
+        failures = differential.run(OffByOneDeposits, 20_000, 2_000, 12, workers=2)
+        self.assertTrue(failures)
+        for seed, shrunk in failures:
+            self.assertEqual(len(shrunk), 2)
@@ -0,0 +1,190 @@
+import bisect
+import gc
+import os
+import random
+import tracemalloc
+import unittest
+from collections import deque
+from unittest import mock
+import frozen_state
+from banking_system_impl import BankingSystemImpl
+from frozen_state import SharedDict, SharedLog, SharedQueue, SharedSortedList
+
+ACCOUNTS = [f'account{i}' for i in range(6)]
+
+
+def run_operations(systems, seed, start, count):
+    rng = random.Random(seed)
+    for ts in range(start, start + count):
+        acc, other = rng.choice(ACCOUNTS), rng.choice(ACCOUNTS)
+        roll, amount = rng.random(), rng.randint(1, 300)
+        for system in systems:
+            if roll < 0.1:
+                system.create_account(ts, acc)
+            elif roll < 0.4:
+                system.deposit(ts, acc, amount)
+            elif roll < 0.6:
+                system.transfer(ts, acc, other, amount)
+            elif roll < 0.95:
+                system.pay(ts, acc, amount)
+            else:
+                system.merge_accounts(ts, acc, other)
+
+
+def observe(system, timestamp, times):
+    return (
+        [system.get_balance(timestamp, acc, t) for acc in ACCOUNTS for t in times],
+        [system.get_payment_status(timestamp, acc, f'payment{i}') for acc in ACCOUNTS for i in range(1, 40)],
+        [system.get_pending_cashback(timestamp, acc) for acc in ACCOUNTS],
+        system.top_spenders(timestamp, len(ACCOUNTS)),
+        [system.top_spenders_at(timestamp, len(ACCOUNTS), t) for t in times],
+        [system.total_balance_at(timestamp, t) for t in times],
+    )
+
+
+class ForkTests(unittest.TestCase):
+    """
+    Tests for copy-on-write forks of a system.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.system = BankingSystemImpl(spending_checkpoint_interval=5, total_history=True)
+        run_operations([cls.system], 1, 1, 150)
+
+    def check_diverged(self, parent, child, parent_seed, child_seed):
+        parent_reference = BankingSystemImpl(spending_checkpoint_interval=5, total_history=True)
+        child_reference = BankingSystemImpl(spending_checkpoint_interval=5, total_history=True)
+        run_operations([parent_reference, child_reference], 1, 1, 150)
+        run_operations([parent, parent_reference], parent_seed, 200, 100)
+        run_operations([child, child_reference], child_seed, 200, 100)
+        times = [50, 150, 250, 86_400_300]
+        self.assertEqual(observe(parent, 86_400_400, times), observe(parent_reference, 86_400_400, times))
+        self.assertEqual(observe(child, 86_400_400, times), observe(child_reference, 86_400_400, times))
+
+    def test_fork_and_parent_diverge_independently(self):
+        child = self.system.fork()
+        self.check_diverged(self.system, child, 2, 3)
+
+    def test_fork_of_fork(self):
+        child = self.system.fork()
+        run_operations([child], 4, 160, 20)
+        grandchild = child.fork()
+        reference = BankingSystemImpl(spending_checkpoint_interval=5, total_history=True)
+        run_operations([reference], 1, 1, 150)
+        run_operations([reference], 4, 160, 20)
+        times = [100, 170]
+        self.assertEqual(observe(grandchild, 180, times), observe(reference, 180, times))
+        self.assertEqual(observe(child, 180, times), observe(reference, 180, times))
+
+    def test_repeated_forks_share_frozen_state(self):
+        first = self.system.fork()
+        second = self.system.fork()
+        self.assertIs(first._snapshot, second._snapshot)
+        self.assertIs(self.system._snapshot, first._snapshot)
+        self.check_diverged(first, second, 5, 6)
+
+    def test_untouched_accounts_are_not_copied(self):
+        system = BankingSystemImpl()
+        for ts, acc in enumerate(ACCOUNTS, 1):
+            system.create_account(ts, acc)
+        for ts in range(10, 30):
+            system.deposit(ts, 'account1', 10)
+        system.compress_histories(block_size=4)
+        child = system.fork()
+        self.assertEqual(child.deposit(30, 'account1', 10), 210)
+        self.assertEqual(set(child.balance_history), {'account1'})
+        self.assertEqual(set(system.balance_history), set())
+        shared = system._snapshot._state['balance_history']['account1']
+        copied = child.balance_history['account1']
+        self.assertTrue(copied._blocks and all(a is b for a, b in zip(shared._blocks, copied._blocks)))
+        self.assertEqual(system.get_balance(31, 'account1', 30), 200)
+
+    def test_system_wide_structures_are_shared(self):
+        system = BankingSystemImpl(total_history=True)
+        for i in range(10_000):
+            system.create_account(1, f'account{i}')
+            system.deposit(2, f'account{i}', 1_000)
+            system.pay(3 + i, f'account{i}', 10)
+        system.top_spenders(20_000, 1)
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            forks = []
+            for i in range(20):
+                forks.append(system.fork())
+                self.assertEqual(forks[-1].transfer(20_000 + i, f'account{i}', f'account{i + 1}', 5), 985)
+            grown = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+        # less than one pointer per account per fork
+        self.assertLess(grown, 20 * 8 * 10_000)
+        frozen = system._snapshot._extras
+        for name in ('sorted_outgoing', 'sorted_accounts', 'outgoing_key_map', 'account_handles', 'cashback',
+                     'outgoing_change_ts', 'account_names', 'total_balance_history'):
+            self.assertIs(getattr(forks[5], name)._base, frozen[name])
+        self.assertEqual(forks[5].top_spenders(30_000, 2), ['account5(15)', 'account0(10)'])
+        self.assertEqual(system.top_spenders(30_000, 1), ['account0(10)'])
+
+    @mock.patch.object(frozen_state, '_FOLD_FLOOR', 2)
+    def test_shared_views_match_plain_structures(self):
+        rng = random.Random(3)
+        for _ in range(100):
+            keys, log, mapping = sorted(rng.sample(range(500), 20)), list(range(20)), dict.fromkeys(range(20), 0)
+            queue = deque(range(20))
+            views = [(SharedSortedList(keys[:]), SharedLog(log[:]), SharedDict(dict(mapping)), SharedQueue(deque(queue)))]
+            plains = [(keys, log, mapping, queue)]
+            for _ in range(100):
+                which = rng.randrange(len(views))
+                (ranking, history, handles, pending), (keys, log, mapping, queue) = views[which], plains[which]
+                key, roll = rng.randrange(500), rng.random()
+                if roll < 0.1:
+                    views[which] = tuple(type(view).over(view) for view in views[which])
+                    views.append(tuple(type(view).over(view) for view in views[which]))
+                    plains.append((keys[:], log[:], dict(mapping), deque(queue)))
+                    continue
+                if roll < 0.4 and key not in keys:
+                    bisect.insort(keys, key)
+                    frozen_state.sorted_insert(ranking, key)
+                elif roll < 0.7:
+                    self.assertEqual(frozen_state.sorted_remove(ranking, key), key in keys)
+                    if key in keys:
+                        keys.remove(key)
+                log.append(key)
+                history.append(key)
+                dropped = rng.randint(1, 3)
+                del log[-dropped:]
+                del history[-dropped:]
+                mapping[key % 30] = key
+                handles[key % 30] = key
+                self.assertEqual(handles.pop(key % 7, None), mapping.pop(key % 7, None))
+                queue.append(key)
+                pending.append(key)
+                self.assertEqual(pending.popleft(), queue.popleft())
+                self.assertEqual((ranking, history, dict(handles), pending), (keys, log, mapping, queue))
+                start = rng.randrange(len(keys) + 2)
+                self.assertEqual(ranking[start:start + 5], keys[start:start + 5])
+                self.assertEqual(frozen_state.sorted_position(ranking, key), bisect.bisect_left(keys, key))
+
+    def test_fork_refuses_open_savepoint(self):
+        self.system.savepoint()
+        with self.assertRaises(ValueError):
+            self.system.fork()
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs os.fork')
+    def test_os_fork_fan_out(self):
+        expected = BankingSystemImpl(spending_checkpoint_interval=5, total_history=True)
+        run_operations([expected], 1, 1, 150)
+        run_operations([expected], 7, 200, 50)
+        self.system.prepare_process_fork(block_size=4)
+        self.addCleanup(gc.unfreeze)
+        pid = os.fork()
+        if pid == 0:
+            simulation = self.system.fork()
+            run_operations([simulation], 7, 200, 50)
+            os._exit(0 if observe(simulation, 300, [100, 250]) == observe(expected, 300, [100, 250]) else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
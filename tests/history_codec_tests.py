@@ -0,0 +1,88 @@
+import random
+import sys
+import unittest
+from banking_system_impl import BankingSystemImpl
+from history_codec import CompressedHistory, decode_block, encode_block
+from history_tiering import _balance_at
+
+
+class HistoryCodecTests(unittest.TestCase):
+    """
+    Tests for block-compressed balance histories.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        rng = random.Random(7)
+        ts, bal = 1, 0
+        cls.entries = []
+        for _ in range(1000):
+            cls.entries.append((ts, bal))
+            ts += rng.choice((0, 1, 5, 1000, 86400000))
+            bal += rng.randint(-500, 500)
+
+    def test_block_round_trip(self):
+        data = encode_block(self.entries)
+        self.assertEqual(decode_block(1, 0, data), self.entries)
+
+    def test_balance_at_matches_plain_list(self):
+        history = CompressedHistory(self.entries, block_size=16)
+        self.assertEqual(len(history), 1000)
+        self.assertEqual(list(history), self.entries)
+        self.assertEqual(history[-1], self.entries[-1])
+        self.assertEqual(history[17], self.entries[17])
+        for time_at in [0, 1, 2] + [ts for ts, _ in self.entries[::37]] + [self.entries[-1][0] + 1]:
+            self.assertEqual(history.balance_at(time_at), _balance_at(self.entries, time_at))
+
+    def test_slices_match_plain_list(self):
+        entries = [(i, i * 10) for i in range(11)]
+        history = CompressedHistory(entries, 4)
+        self.assertEqual(history[0:6], entries[0:6])
+        for a in range(-12, 13):
+            for b in range(-12, 13):
+                self.assertEqual(history[a:b], list(history)[a:b])
+
+    def test_seal_encodes_the_tail(self):
+        history = CompressedHistory(self.entries[:40], block_size=16)
+        self.assertFalse(history.sealed)
+        history.seal()
+        self.assertTrue(history.sealed)
+        self.assertEqual(list(history), self.entries[:40])
+        self.assertEqual(history[30:40], self.entries[30:40])
+        history.append(self.entries[40])
+        self.assertEqual(history.pop(), self.entries[40])
+        self.assertEqual(history.pop(), self.entries[39])
+        for time_at in [ts for ts, _ in self.entries[:40]]:
+            self.assertEqual(history.balance_at(time_at), _balance_at(self.entries[:39], time_at))
+
+    def test_compressed_is_smaller(self):
+        history = CompressedHistory(self.entries)
+        plain = sys.getsizeof(self.entries) + sum(sys.getsizeof(e) + sys.getsizeof(e[0]) + sys.getsizeof(e[1])
+                                                  for e in self.entries)
+        self.assertLess(sys.getsizeof(history) * 5, plain)
+
+    def test_system_with_compressed_histories(self):
+        system = BankingSystemImpl(history_block_size=2)
+        self.assertTrue(system.create_account(1, 'account1'))
+        self.assertEqual(system.deposit(2, 'account1', 1000), 1000)
+        self.assertEqual(system.pay(3, 'account1', 300), 'payment1')
+        self.assertEqual(system.pay(4, 'account1', 200), 'payment2')
+        self.assertEqual(system.pay(5, 'account1', 100), 'payment3')
+        self.assertIsNone(system.get_balance(6, 'account1', 0))
+        self.assertEqual(system.get_balance(7, 'account1', 3), 700)
+        self.assertEqual(system.get_balance(86400008, 'account1', 86400003), 406)
+        self.assertEqual(system.get_balance(86400009, 'account1', 86400005), 412)
+
+    def test_compress_existing_histories(self):
+        system = BankingSystemImpl()
+        system.create_account(1, 'account1')
+        system.create_account(2, 'account2')
+        for ts in range(3, 40):
+            system.deposit(ts, 'account1', ts)
+        self.assertEqual(system.compress_histories(block_size=8), 1)
+        self.assertIs(type(system.balance_history['account2']), list)
+        self.assertEqual(system.get_balance(50, 'account1', 10), sum(range(3, 11)))
+        self.assertEqual(system.deposit(51, 'account1', 1), sum(range(3, 40)) + 1)
@@ -0,0 +1,118 @@
+import os
+import random
+import tempfile
+import unittest
+from banking_system_impl import BankingSystemImpl
+
+DAY = 86_400_000
+HOUR = 3_600_000
+
+
+def build(system, days):
+    for acc in ('account1', 'account2', 'account3'):
+        system.create_account(1, acc)
+    ts = 2
+    for day in range(days):
+        for hour in range(0, 24, 3):
+            ts = day * DAY + hour * HOUR + 5
+            system.deposit(ts, 'account1', 10)
+            system.deposit(ts, 'account2', 1)
+            system.transfer(ts + 1, 'account1', 'account3', 3)
+    return ts
+
+
+class HistoryRetentionTests(unittest.TestCase):
+    """
+    Tests for downsampling balance history older than the retention horizon.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.system = BankingSystemImpl(history_retention_ms=30 * DAY)
+        cls.reference = BankingSystemImpl()
+        cls.now = build(cls.system, 60)
+        build(cls.reference, 60)
+
+    def check_retention(self, system):
+        horizon = self.now - 30 * DAY
+        for acc in ('account1', 'account2', 'account3'):
+            for time_at in range(horizon, self.now + 1, HOUR // 2):
+                self.assertEqual(system.get_balance(self.now, acc, time_at),
+                                 self.reference.get_balance(self.now, acc, time_at))
+            for day in range(0, 29):
+                end_of_day = (day + 1) * DAY - 1
+                self.assertEqual(system.get_balance(self.now, acc, end_of_day),
+                                 self.reference.get_balance(self.now, acc, end_of_day))
+            self.assertEqual(system.get_balance(self.now, acc, 1), 0)
+            self.assertIsNone(system.get_balance(self.now, acc, 0))
+            self.assertLess(len(system.balance_history[acc]), len(self.reference.balance_history[acc]) * 2 // 3)
+
+    def test_apply_retention_keeps_exact_window(self):
+        self.assertTrue(self.system.apply_retention(self.now, max_accounts=None))
+        self.check_retention(self.system)
+
+    def test_incremental_passes(self):
+        self.assertFalse(self.system.apply_retention(self.now, max_accounts=2))
+        self.assertTrue(self.system.apply_retention(self.now, max_accounts=2))
+        length = len(self.system.balance_history['account1'])
+        self.assertTrue(self.system.apply_retention(self.now, max_accounts=None))
+        self.assertEqual(len(self.system.balance_history['account1']), length)
+        self.check_retention(self.system)
+
+    def test_tick_drives_retention(self):
+        self.system.advance_time(self.now, limit=None)
+        self.assertFalse(self.system.tick(limit=1))
+        self.assertFalse(self.system.tick(limit=1))
+        self.assertTrue(self.system.tick(limit=1))
+        self.check_retention(self.system)
+
+    def test_compressed_histories(self):
+        system = BankingSystemImpl(history_block_size=16, history_retention_ms=30 * DAY)
+        build(system, 60)
+        system.apply_retention(self.now, max_accounts=None)
+        self.check_retention(system)
+
+    def test_incremental_passes_on_compressed_histories(self):
+        system = BankingSystemImpl(history_block_size=4, history_retention_ms=10 * DAY)
+        reference = BankingSystemImpl()
+        for s in (system, reference):
+            s.create_account(1, 'account1')
+            s.create_account(1, 'account2')
+        rng = random.Random(5)
+        ts = 2
+        first_block = None
+        for day in range(40):
+            for _ in range(rng.randint(1, 12)):
+                ts = max(ts + 1, day * DAY + rng.randint(0, DAY - 1))
+                amount = rng.randint(1, 100)
+                for s in (system, reference):
+                    s.deposit(ts, 'account1', amount)
+                    s.transfer(ts, 'account1', 'account2', amount // 2)
+            while not system.apply_retention(ts, max_accounts=1):
+                pass
+            horizon = ts - 10 * DAY
+            for acc in ('account1', 'account2'):
+                for time_at in range(max(0, horizon), ts + 1, HOUR):
+                    self.assertEqual(system.get_balance(ts, acc, time_at), reference.get_balance(ts, acc, time_at))
+            if day == 30:
+                first_block = system.balance_history['account1']._blocks[0]
+        # blocks already downsampled are left alone by later passes
+        self.assertIs(system.balance_history['account1']._blocks[0], first_block)
+        self.assertLess(len(system.balance_history['account1']), len(reference.balance_history['account1']) // 2)
+
+    def test_skipped_while_savepoint_open(self):
+        self.system.savepoint()
+        length = len(self.system.balance_history['account1'])
+        self.assertTrue(self.system.apply_retention(self.now, max_accounts=None))
+        self.assertEqual(len(self.system.balance_history['account1']), length)
+
+    def test_checkpoint_after_retention(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.system.snapshot(os.path.join(tmp, 'full'))
+            self.system.apply_retention(self.now, max_accounts=None)
+            self.system.checkpoint(os.path.join(tmp, 'delta'))
+            restored = BankingSystemImpl.restore(os.path.join(tmp, 'full'), deltas=[os.path.join(tmp, 'delta')])
+            self.assertEqual(restored.balance_history, self.system.balance_history)
@@ -0,0 +1,57 @@
+import unittest
+from banking_system_impl import BankingSystemImpl
+from history_tiering import TieredHistoryStore
+
+
+class HistoryTieringTests(unittest.TestCase):
+    """
+    Tests for spilling idle account histories to SQLite.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.tier = TieredHistoryStore(idle_ms=100, max_hot=2, max_cached=1)
+        cls.system = BankingSystemImpl(history_tier=cls.tier)
+
+    def tearDown(self):
+        self.tier.close()
+
+    def test_idle_accounts_are_spilled(self):
+        self.assertTrue(self.system.create_account(1, 'account1'))
+        self.assertEqual(self.system.deposit(2, 'account1', 500), 500)
+        self.assertEqual(self.tier.hot_count, 1)
+        self.assertTrue(self.system.create_account(200, 'account2'))
+        self.assertEqual(self.tier.hot_count, 1)
+        self.assertEqual(self.system.get_balance(201, 'account1', 1), 0)
+        self.assertEqual(self.system.get_balance(202, 'account1', 150), 500)
+        self.assertEqual(self.tier.hot_count, 1)
+
+    def test_writes_go_to_hot_tail(self):
+        self.assertTrue(self.system.create_account(1, 'account1'))
+        self.assertEqual(self.system.deposit(2, 'account1', 500), 500)
+        self.assertTrue(self.system.create_account(300, 'account2'))
+        self.assertEqual(self.system.deposit(301, 'account1', 100), 600)
+        self.assertEqual(self.tier['account1'], [(301, 600)])
+        self.assertEqual(self.tier.history('account1'), [(1, 0), (2, 500), (301, 600)])
+        self.assertEqual(self.system.get_balance(302, 'account1', 300), 500)
+        self.assertEqual(self.system.get_balance(303, 'account1', 301), 600)
+        self.assertIsNone(self.system.get_balance(304, 'account1', 0))
+
+    def test_capacity_bound_and_merge(self):
+        self.assertTrue(self.system.create_account(1, 'account1'))
+        self.assertTrue(self.system.create_account(2, 'account2'))
+        self.assertTrue(self.system.create_account(3, 'account3'))
+        self.assertEqual(self.tier.hot_count, 2)
+        self.assertEqual(self.system.deposit(4, 'account1', 1000), 1000)
+        self.assertEqual(self.system.deposit(5, 'account2', 300), 300)
+        self.assertEqual(self.system.pay(6, 'account2', 100), 'payment1')
+        self.assertTrue(self.system.merge_accounts(7, 'account1', 'account2'))
+        self.assertEqual(self.system.get_balance(8, 'account2', 6), 200)
+        self.assertIsNone(self.system.get_balance(9, 'account2', 7))
+        self.assertEqual(self.system.get_balance(86400006, 'account1', 86400006), 1202)
+        self.assertTrue(self.system.create_account(86400007, 'account2'))
+        self.assertIsNone(self.system.get_balance(86400008, 'account2', 5))
+        self.assertEqual(self.system.get_balance(86400009, 'account2', 86400007), 0)
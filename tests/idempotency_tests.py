@@ -0,0 +1,64 @@
+import unittest
+from banking_system_impl import BankingSystemImpl
+from idempotency import IdempotencyCache
+
+
+class IdempotencyTests(unittest.TestCase):
+    """
+    Tests for idempotency keys on mutating operations.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.cache = IdempotencyCache(max_entries=3, ttl_ms=100)
+        cls.system = BankingSystemImpl(idempotency=cls.cache)
+        cls.system.create_account(1, 'account1')
+        cls.system.create_account(2, 'account2')
+        cls.system.deposit(3, 'account1', 1000)
+
+    def test_retry_returns_original_result(self):
+        self.assertEqual(self.system.pay(10, 'account1', 100, idempotency_key='k1'), 'payment1')
+        self.assertEqual(self.system.pay(11, 'account1', 100, idempotency_key='k1'), 'payment1')
+        self.assertEqual(self.system.transfer(12, 'account1', 'account2', 100, idempotency_key='k1'), 800)
+        self.assertEqual(self.system.transfer(13, 'account1', 'account2', 100, idempotency_key='k1'), 800)
+        self.assertEqual(self.system.top_spenders(14, 1), ['account1(200)'])
+        self.assertEqual(self.cache.metrics()['hits'], 2)
+        self.assertEqual(self.cache.metrics()['misses'], 2)
+
+    def test_keyword_arguments(self):
+        self.assertEqual(self.system.deposit(4, account_id='account1', amount=5), 1005)
+        self.assertTrue(self.system.create_account(timestamp=5, account_id='account3'))
+        self.assertEqual(self.system.deposit(timestamp=6, account_id='account3', amount=7, idempotency_key='k1'), 7)
+        self.assertEqual(self.system.deposit(7, 'account3', amount=7, idempotency_key='k1'), 7)
+        self.assertEqual(self.system.transfer(8, 'account1', target='account3', amount=3,
+                                              idempotency_key='k2'), 1002)
+        self.assertEqual(self.system.get_balance(9, 'account3', 9), 10)
+        self.assertEqual(self.cache.metrics()['hits'], 1)
+
+    def test_calls_without_key_are_not_deduplicated(self):
+        self.assertEqual(self.system.deposit(10, 'account2', 5), 5)
+        self.assertEqual(self.system.deposit(11, 'account2', 5), 10)
+        self.assertEqual(self.cache.metrics()['size'], 0)
+
+    def test_eviction_by_time_and_count(self):
+        self.assertEqual(self.system.deposit(10, 'account2', 5, idempotency_key='a'), 5)
+        self.assertEqual(self.system.deposit(110, 'account2', 5, idempotency_key='a'), 10)
+        self.assertEqual(self.cache.metrics()['expirations'], 1)
+        for i, key in enumerate('bcd'):
+            self.system.deposit(120 + i, 'account2', 1, idempotency_key=key)
+        self.assertEqual(self.cache.metrics()['evictions'], 1)
+        self.assertEqual(self.system.deposit(130, 'account2', 1, idempotency_key='d'), 13)
+        self.assertEqual(self.system.deposit(131, 'account2', 1, idempotency_key='a'), 14)
+        self.assertEqual(len(self.cache), 3)
+
+    def test_systems_without_cache_skip_the_wrapper(self):
+        system = BankingSystemImpl()
+        self.assertEqual(system.deposit.__func__, BankingSystemImpl.deposit.__wrapped__)
+        system.create_account(1, 'account1')
+        self.assertEqual(system.deposit(2, 'account1', 10), 10)
+        with self.assertRaises(TypeError):
+            system.deposit(3, 'account1', 10, idempotency_key='k1')
+        self.assertIs(self.system.deposit.__func__, BankingSystemImpl.deposit)
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+from banking_system_impl import BankingSystemImpl
+
+
+class ListAccountsTests(unittest.TestCase):
+    """
+    Tests for listing accounts through the sorted account-id index.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.system = BankingSystemImpl()
+        ids = ['corp-eu-3', 'retail-1', 'corp-us-1', 'corp-eu-1', 'corp-eu-2', 'corp-eu', 'corp-euro']
+        for ts, acc in enumerate(ids, 1):
+            cls.system.create_account(ts, acc)
+
+    def test_prefix(self):
+        self.assertEqual(list(self.system.list_accounts(10, prefix='corp-eu-')), ['corp-eu-1', 'corp-eu-2', 'corp-eu-3'])
+        self.assertEqual(list(self.system.list_accounts(10, prefix='corp-eu')),
+                         ['corp-eu', 'corp-eu-1', 'corp-eu-2', 'corp-eu-3', 'corp-euro'])
+        self.assertEqual(list(self.system.list_accounts(10, prefix='none')), [])
+
+    def test_pages_with_start_after(self):
+        first = list(self.system.list_accounts(10, limit=3))
+        self.assertEqual(first, ['corp-eu', 'corp-eu-1', 'corp-eu-2'])
+        second = list(self.system.list_accounts(10, start_after=first[-1], limit=3))
+        self.assertEqual(second, ['corp-eu-3', 'corp-euro', 'corp-us-1'])
+        self.assertEqual(list(self.system.list_accounts(10, prefix='corp-eu-', start_after='corp-eu-1')),
+                         ['corp-eu-2', 'corp-eu-3'])
+
+    def test_merge_and_rollback_update_the_index(self):
+        self.assertTrue(self.system.merge_accounts(10, 'corp-eu-1', 'corp-eu-2'))
+        self.assertEqual(list(self.system.list_accounts(11, prefix='corp-eu-')), ['corp-eu-1', 'corp-eu-3'])
+        savepoint = self.system.savepoint()
+        self.system.create_account(12, 'corp-eu-4')
+        self.system.merge_accounts(13, 'corp-eu-4', 'corp-eu-3')
+        self.system.rollback(savepoint)
+        self.assertEqual(list(self.system.list_accounts(14, prefix='corp-eu-')), ['corp-eu-1', 'corp-eu-3'])
+
+    def test_index_rebuilt_after_restore(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'state.snap')
+            self.system.snapshot(path)
+            restored = BankingSystemImpl.restore(path, lazy=True)
+            self.assertEqual(list(restored.list_accounts(10, prefix='corp-us')), ['corp-us-1'])
+            restored.close()
+
+    def test_changes_while_listing(self):
+        ids = [f'account{i:03}' for i in range(200)]
+        for acc in ids:
+            self.system.create_account(20, acc)
+        for system in (self.system.fork(), self.system):
+            listing = system.list_accounts(21, limit=1_000)
+            listed = [next(listing)]
+            for i in range(1, 40):
+                listed.append(next(listing))
+                system.merge_accounts(21, 'account000', ids[200 - 2 * i])
+                system.merge_accounts(21, 'account000', ids[201 - 2 * i])
+                system.create_account(21, f'account{i:03}x')
+            listed.extend(listing)
+            self.assertEqual(listed, sorted(set(listed)))
+            self.assertTrue(set(ids[:122]) <= set(listed))
@@ -0,0 +1,45 @@
+import unittest
+from banking_system_impl import BankingSystemImpl
+
+
+class MemoryReportTests(unittest.TestCase):
+    """
+    Tests for the sampled memory accounting report.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.system = BankingSystemImpl()
+        for i in range(50):
+            cls.system.create_account(i, f'account{i}')
+        for i in range(50):
+            cls.system.deposit(100 + i, f'account{i}', 1000)
+            for j in range(i % 5):
+                cls.system.pay(200 + 10 * i + j, f'account{i}', 10)
+
+    def test_report_covers_every_structure(self):
+        report = self.system.memory_report(seed=1)
+        self.assertEqual(set(report['structures']), {
+            'balances', 'outgoing', 'balance_history', 'payments', 'merged_time',
+            'cashback', 'sorted_outgoing', 'outgoing_key_map', 'sorted_accounts', 'outgoing_history',
+            'pending_cashback', 'transactions', 'settled_payments', 'spend_windows',
+        })
+        self.assertEqual(report['structures']['balance_history']['entries'], 50)
+        self.assertEqual(report['structures']['cashback']['entries'], 100)
+        self.assertEqual(report['total_bytes'], sum(s['bytes'] for s in report['structures'].values()))
+
+    def test_sampling_extrapolates(self):
+        full = self.system.memory_report(sample_size=1_000, top_n=0)
+        sampled = self.system.memory_report(sample_size=10, top_n=0, seed=3)
+        self.assertEqual(sampled['structures']['payments']['sampled'], 10)
+        exact = full['structures']['payments']['bytes']
+        estimate = sampled['structures']['payments']['bytes']
+        self.assertTrue(exact / 3 < estimate < exact * 3)
+        self.assertEqual(full['top_history'], [])
+
+    def test_top_history(self):
+        report = self.system.memory_report(top_n=2)
+        self.assertEqual(report['top_history'], [('account9', 6), ('account49', 6)])
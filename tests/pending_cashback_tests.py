@@ -0,0 +1,48 @@
+import unittest
+from banking_system_impl import BankingSystemImpl
+
+
+class PendingCashbackTests(unittest.TestCase):
+    """
+    Tests for per-account pending cashback totals and projections.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.system = BankingSystemImpl()
+        cls.system.create_account(1, 'account1')
+        cls.system.create_account(2, 'account2')
+        cls.system.deposit(3, 'account1', 10000)
+        cls.system.deposit(4, 'account2', 10000)
+
+    def test_pending_total_and_count(self):
+        self.assertIsNone(self.system.get_pending_cashback(5, 'account3'))
+        self.assertEqual(self.system.get_pending_cashback(6, 'account1'), (0, 0))
+        self.assertEqual(self.system.pay(7, 'account1', 1000), 'payment1')
+        self.assertEqual(self.system.pay(8, 'account1', 500), 'payment2')
+        self.assertEqual(self.system.get_pending_cashback(9, 'account1'), (30, 2))
+        self.assertEqual(self.system.get_pending_cashback(86400007, 'account1'), (10, 1))
+        self.assertEqual(self.system.get_pending_cashback(86400008, 'account1'), (0, 0))
+
+    def test_projected_balance(self):
+        self.assertEqual(self.system.pay(10, 'account1', 1000), 'payment1')
+        self.assertEqual(self.system.pay(20, 'account1', 500), 'payment2')
+        self.assertEqual(self.system.projected_balance(30, 'account1', 40), 8500)
+        self.assertEqual(self.system.projected_balance(31, 'account1', 86400010), 8520)
+        self.assertEqual(self.system.projected_balance(32, 'account1', 86400020), 8530)
+        self.assertEqual(self.system.projected_balance(86400015, 'account1', 86400015), 8520)
+        self.assertIsNone(self.system.projected_balance(86400016, 'account3', 0))
+
+    def test_merge_moves_pending_cashback(self):
+        self.assertEqual(self.system.pay(10, 'account1', 1000), 'payment1')
+        self.assertEqual(self.system.pay(11, 'account2', 2000), 'payment2')
+        self.assertEqual(self.system.pay(12, 'account1', 100), 'payment3')
+        self.assertTrue(self.system.merge_accounts(13, 'account1', 'account2'))
+        self.assertEqual(self.system.get_pending_cashback(14, 'account1'), (62, 3))
+        self.assertIsNone(self.system.get_pending_cashback(15, 'account2'))
+        self.assertEqual(self.system.projected_balance(16, 'account1', 86400011), 16960)
+        self.assertEqual(self.system.get_pending_cashback(86400011, 'account1'), (2, 1))
+        self.assertEqual(self.system.get_pending_cashback(86400012, 'account1'), (0, 0))
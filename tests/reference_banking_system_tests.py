@@ -0,0 +1,45 @@
+import level_1_tests
+import level_2_tests
+import level_3_tests
+import level_4_tests
+from reference_banking_system import ReferenceBankingSystem
+
+
+class ReferenceLevel1Tests(level_1_tests.Level1Tests):
+    """
+    Level 1 suite run against the reference model.
+    """
+
+    @classmethod
+    def setUp(cls):
+        cls.system = ReferenceBankingSystem()
+
+
+class ReferenceLevel2Tests(level_2_tests.Level2Tests):
+    """
+    Level 2 suite run against the reference model.
+    """
+
+    @classmethod
+    def setUp(cls):
+        cls.system = ReferenceBankingSystem()
+
+
+class ReferenceLevel3Tests(level_3_tests.Level3Tests):
+    """
+    Level 3 suite run against the reference model.
+    """
+
+    @classmethod
+    def setUp(cls):
+        cls.system = ReferenceBankingSystem()
+
+
+class ReferenceLevel4Tests(level_4_tests.Level4Tests):
+    """
+    Level 4 suite run against the reference model.
+    """
+
+    @classmethod
+    def setUp(cls):
+        cls.system = ReferenceBankingSystem()
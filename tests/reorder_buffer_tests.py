@@ -0,0 +1,85 @@
+import random
+import unittest
+from banking_system_impl import BankingSystemImpl
+from reorder_buffer import ReorderBuffer
+
+
+def make_operations(seed, count):
+    rng = random.Random(seed)
+    accounts = [f'account{i}' for i in range(5)]
+    operations = [('create_account', ts, (acc,)) for ts, acc in enumerate(accounts, 1)]
+    ts = 10
+    for _ in range(count):
+        ts += rng.randint(1, 3)
+        acc, other, amount = rng.choice(accounts), rng.choice(accounts), rng.randint(1, 500)
+        operations.append(rng.choice([
+            ('deposit', ts, (acc, amount)),
+            ('transfer', ts, (acc, other, amount)),
+            ('pay', ts, (acc, amount)),
+            ('get_balance', ts, (acc, ts - 5)),
+        ]))
+    return operations
+
+
+class ReorderBufferTests(unittest.TestCase):
+    """
+    Tests for the out-of-order ingest stage.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.system = BankingSystemImpl()
+        cls.buffer = ReorderBuffer(cls.system, max_lateness_ms=10)
+
+    def test_jitter_within_window_is_reordered(self):
+        operations = make_operations(1, 400)
+        rng = random.Random(2)
+        arrival = sorted(range(len(operations)), key=lambda i: operations[i][1] + rng.randrange(10))
+        results = {}
+        for i in arrival:
+            method, ts, args = operations[i]
+            for ticket, result in self.buffer.submit(method, ts, *args):
+                results[arrival[ticket]] = result
+        for ticket, result in self.buffer.flush():
+            results[arrival[ticket]] = result
+
+        reference = BankingSystemImpl()
+        expected = {i: getattr(reference, method)(ts, *args) for i, (method, ts, args) in enumerate(operations)}
+        self.assertEqual(results, expected)
+        self.assertEqual(self.system.balances, reference.balances)
+        self.assertEqual(self.system.balance_history, reference.balance_history)
+        metrics = self.buffer.metrics()
+        self.assertEqual(metrics['dropped'], 0)
+        self.assertGreater(metrics['late'], 0)
+        self.assertEqual(metrics['applied'], len(operations))
+        self.assertEqual(metrics['buffered'], 0)
+
+    def test_too_late_is_dropped(self):
+        self.buffer.submit('create_account', 1, 'account1')
+        self.assertEqual(self.buffer.submit('deposit', 30, 'account1', 100), [(0, True)])
+        self.assertEqual(self.buffer.submit('deposit', 25, 'account1', 10), [])
+        self.assertEqual(self.buffer.submit('deposit', 0, 'account1', 10), [])
+        self.assertEqual(self.buffer.flush(), [(2, 10), (1, 110)])
+        self.assertEqual(self.buffer.metrics()['dropped'], 1)
+        self.assertEqual(self.buffer.metrics()['late'], 1)
+
+    def test_same_timestamp_deposits_are_batched(self):
+        for acc in ('account1', 'account2'):
+            self.buffer.submit('create_account', 1, acc)
+        self.buffer.submit('deposit', 5, 'account1', 100)
+        self.buffer.submit('deposit', 5, 'account2', 50)
+        self.buffer.submit('deposit', 5, 'account1', 7)
+        self.buffer.submit('deposit', 5, 'account3', 7)
+        self.assertEqual(self.buffer.flush(), [(0, True), (1, True), (2, 100), (3, 50), (4, 107), (5, None)])
+        self.assertEqual(self.buffer.metrics()['batches'], 1)
+
+    def test_bounded_buffer_forces_release(self):
+        buffer = ReorderBuffer(self.system, max_lateness_ms=1_000, max_buffered=2)
+        buffer.submit('create_account', 1, 'account1')
+        buffer.submit('deposit', 2, 'account1', 10)
+        self.assertEqual(buffer.submit('deposit', 3, 'account1', 10), [(0, True)])
+        self.assertEqual(len(buffer), 2)
+        self.assertEqual(buffer.metrics()['forced'], 1)
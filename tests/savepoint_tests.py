@@ -0,0 +1,96 @@
+import copy
+import random
+import unittest
+from banking_system_impl import BankingSystemImpl
+from idempotency import IdempotencyCache
+
+STATE = (
+    'balances', 'outgoing', 'payments', 'payment_counter', 'merged_time', 'balance_history', 'cashback',
+    'sorted_outgoing', 'outgoing_key_map', 'outgoing_history', 'outgoing_change_ts', 'outgoing_change_accounts',
+    'spending_checkpoints', 'pending_cashback', 'total_balance', 'total_outgoing', 'total_balance_history',
+    'total_outgoing_history', 'transactions', 'account_names', 'account_handles', 'sorted_accounts',
+    'settled_payments', 'spend_windows',
+)
+
+
+def random_operations(system, rng, start, count):
+    accounts = [f'account{i}' for i in range(6)]
+    for ts in range(start, start + count):
+        acc = rng.choice(accounts)
+        roll = rng.random()
+        if roll < 0.1:
+            system.create_account(ts, acc)
+        elif roll < 0.3:
+            system.deposit(ts, acc, rng.randint(1, 500))
+        elif roll < 0.35:
+            system.deposit_many(ts, [(rng.choice(accounts), rng.randint(1, 50)) for _ in range(3)])
+        elif roll < 0.5:
+            system.transfer(ts, acc, rng.choice(accounts), rng.randint(1, 300))
+        elif roll < 0.55:
+            system.settle_transfers(ts, [(acc, rng.choice(accounts), rng.randint(1, 300)) for _ in range(3)])
+        elif roll < 0.9:
+            system.pay(ts, acc, rng.randint(1, 300))
+        else:
+            system.merge_accounts(ts, acc, rng.choice(accounts))
+
+
+class SavepointTests(unittest.TestCase):
+    """
+    Tests for undo-journal savepoints.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.system = BankingSystemImpl(spending_checkpoint_interval=5, history_block_size=4, transaction_log=True,
+                                       total_history=True)
+
+    def state(self):
+        return copy.deepcopy({name: getattr(self.system, name) for name in STATE})
+
+    def test_rollback_restores_every_structure(self):
+        rng = random.Random(5)
+        random_operations(self.system, rng, 1, 200)
+        before = self.state()
+        savepoint = self.system.savepoint()
+        # jump a day ahead so pending cashbacks settle inside the savepoint
+        random_operations(self.system, rng, 86_400_100, 200)
+        self.assertNotEqual(self.state(), before)
+        self.system.rollback(savepoint)
+        self.assertEqual(self.state(), before)
+        self.system.release(savepoint)
+        self.assertIsNone(self.system._journal)
+
+    def test_nested_savepoints(self):
+        self.assertTrue(self.system.create_account(1, 'account1'))
+        outer = self.system.savepoint()
+        self.assertEqual(self.system.deposit(2, 'account1', 100), 100)
+        inner = self.system.savepoint()
+        self.assertEqual(self.system.pay(3, 'account1', 50), 'payment1')
+        self.system.rollback(inner)
+        self.assertEqual(self.system.get_balance(4, 'account1', 4), 100)
+        self.assertEqual(self.system.pay(5, 'account1', 10), 'payment1')
+        self.system.rollback(outer)
+        self.assertEqual(self.system.get_balance(6, 'account1', 6), 0)
+        self.assertEqual(self.system.top_spenders(7, 1), ['account1(0)'])
+        with self.assertRaises(ValueError):
+            self.system.rollback(inner)
+
+    def test_release_keeps_changes(self):
+        self.assertTrue(self.system.create_account(1, 'account1'))
+        savepoint = self.system.savepoint()
+        self.assertEqual(self.system.deposit(2, 'account1', 100), 100)
+        self.system.release(savepoint)
+        self.assertEqual(self.system.get_balance(3, 'account1', 3), 100)
+
+    def test_rolled_back_idempotent_call_runs_again(self):
+        system = BankingSystemImpl(idempotency=IdempotencyCache())
+        system.create_account(1, 'account1')
+        system.deposit(2, 'account1', 100)
+        savepoint = system.savepoint()
+        self.assertEqual(system.pay(3, 'account1', 10, idempotency_key='k'), 'payment1')
+        system.rollback(savepoint)
+        self.assertEqual(system.pay(4, 'account1', 20, idempotency_key='k'), 'payment1')
+        self.assertEqual(system.get_balance(5, 'account1', 5), 80)
@@ -0,0 +1,54 @@
+import unittest
+from banking_system_impl import BankingSystemImpl
+
+
+class SettleTransfersTests(unittest.TestCase):
+    """
+    Tests for netted batch settlement of transfers.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.system = BankingSystemImpl()
+        cls.system.create_account(1, 'account1')
+        cls.system.create_account(2, 'account2')
+        cls.system.create_account(3, 'account3')
+        cls.system.deposit(4, 'account1', 100)
+
+    def test_netting_allows_back_and_forth(self):
+        result = self.system.settle_transfers(10, [
+            ('account1', 'account2', 500),
+            ('account2', 'account1', 450),
+            ('account2', 'account3', 50),
+        ])
+        self.assertEqual(result, [50, 0, 0])
+        self.assertEqual(self.system.top_spenders(11, 3), ['account1(500)', 'account2(500)', 'account3(0)'])
+        self.assertEqual(self.system.get_balance(12, 'account3', 10), 50)
+        self.assertEqual(len(self.system.balance_history['account1']), 3)
+
+    def test_invalid_transfers_rejected_individually(self):
+        result = self.system.settle_transfers(10, [
+            ('account1', 'account1', 10),
+            ('account1', 'missing', 10),
+            ('account1', 'account2', 60),
+        ])
+        self.assertEqual(result, [None, None, 40])
+
+    def test_short_accounts_cascade(self):
+        result = self.system.settle_transfers(10, [
+            ('account1', 'account2', 150),
+            ('account2', 'account3', 100),
+            ('account1', 'account3', 10),
+        ])
+        self.assertEqual(result, [None, None, None])
+        self.assertEqual(self.system.top_spenders(11, 1), ['account1(0)'])
+        result = self.system.settle_transfers(12, [
+            ('account1', 'account2', 100),
+            ('account2', 'account3', 100),
+            ('account3', 'account1', 500),
+        ])
+        self.assertEqual(result, [0, 0, None])
+        self.assertEqual(self.system.get_balance(13, 'account3', 12), 100)
@@ -0,0 +1,153 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import unittest
+from banking_system_impl import BankingSystemImpl
+from shared_balances import SharedBalances, SharedBalancesReader
+
+
+def check_invariant(name, total, rounds, conn):
+    reader = SharedBalancesReader(name)
+    seen = set()
+    try:
+        for _ in range(rounds):
+            balance, outgoing = reader.get('source')
+            if balance + outgoing != total:
+                conn.send(('torn', balance, outgoing))
+                return
+            seen.add(outgoing)
+        conn.send(('ok', len(seen)))
+    finally:
+        reader.close()
+
+
+class SharedBalancesTests(unittest.TestCase):
+    """
+    Tests for the shared-memory balance mirror.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.mirror = SharedBalances(capacity=4, names_capacity=64)
+        cls.system = BankingSystemImpl(shared_balances=cls.mirror)
+        cls.reader = SharedBalancesReader(cls.mirror.name)
+
+    def tearDown(self):
+        self.reader.close()
+        self.mirror.close()
+
+    def check_mirror(self):
+        for acc in self.system.account_handles:
+            expected = None
+            if acc in self.system.balances:
+                expected = (self.system.balances[acc], self.system.outgoing[acc])
+            self.assertEqual(self.reader.get(acc), expected)
+
+    def test_mirror_follows_operations(self):
+        rng = random.Random(2)
+        accounts = [f'account{i}' for i in range(40)]
+        for ts in range(100_000, 300_000_000, 100_000):
+            acc, other = rng.choice(accounts), rng.choice(accounts)
+            roll = rng.random()
+            if roll < 0.15:
+                self.system.create_account(ts, acc)
+            elif roll < 0.4:
+                self.system.deposit(ts, acc, rng.randint(1, 500))
+            elif roll < 0.45:
+                self.system.deposit_many(ts, [(acc, 10), (other, 20)])
+            elif roll < 0.65:
+                self.system.transfer(ts, acc, other, rng.randint(1, 300))
+            elif roll < 0.7:
+                self.system.settle_transfers(ts, [(acc, other, 50), (other, acc, 20)])
+            elif roll < 0.95:
+                self.system.pay(ts, acc, rng.randint(1, 300))
+            else:
+                self.system.merge_accounts(ts, acc, other)
+            if ts % 10_000_000 == 0:
+                self.check_mirror()
+        self.check_mirror()
+        self.assertIsNone(self.reader.get('account99'))
+
+    def test_reader_follows_growth(self):
+        self.assertIsNone(self.reader.get('account0'))
+        for i in range(100):
+            self.system.create_account(1, f'account{i}')
+            self.system.deposit(2, f'account{i}', i)
+        self.assertGreaterEqual(self.mirror._words[0], 100)
+        self.assertEqual(self.reader.get('account57'), (57, 0))
+        late = SharedBalancesReader(self.mirror.name)
+        self.assertEqual(late.get('account99'), (99, 0))
+        late.close()
+
+    def test_merge_and_recreate(self):
+        for acc in ('account1', 'account2'):
+            self.system.create_account(1, acc)
+            self.system.deposit(2, acc, 100)
+        self.system.transfer(3, 'account2', 'account1', 30)
+        self.system.merge_accounts(4, 'account1', 'account2')
+        self.assertEqual(self.reader.get('account1'), (200, 30))
+        self.assertIsNone(self.reader.get('account2'))
+        self.system.create_account(5, 'account2')
+        self.assertEqual(self.reader.get('account2'), (0, 0))
+
+    def test_rollback_republishes(self):
+        self.system.create_account(1, 'account1')
+        self.system.deposit(2, 'account1', 100)
+        savepoint = self.system.savepoint()
+        self.system.pay(3, 'account1', 40)
+        self.system.create_account(4, 'account2')
+        self.assertEqual(self.reader.get('account2'), (0, 0))
+        self.system.rollback(savepoint)
+        self.system.release(savepoint)
+        self.assertEqual(self.reader.get('account1'), (100, 0))
+        self.assertIsNone(self.reader.get('account2'))
+        self.system.create_account(5, 'account3')
+        self.system.deposit(6, 'account3', 7)
+        self.assertEqual(self.system.account_handles['account3'], 1)
+        self.assertIsNone(self.reader.get('account2'))
+        self.assertEqual(self.reader.get('account3'), (7, 0))
+
+    def test_restore_publishes_every_account(self):
+        for i in range(20):
+            self.system.create_account(1, f'account{i}')
+            self.system.deposit(2, f'account{i}', 100 + i)
+        self.system.transfer(3, 'account1', 'account2', 30)
+        self.system.merge_accounts(4, 'account3', 'account4')
+        with tempfile.TemporaryDirectory() as tmp:
+            self.system.snapshot(os.path.join(tmp, 'full'))
+            for lazy in (False, True):
+                mirror = SharedBalances(capacity=4, names_capacity=64)
+                reader = SharedBalancesReader(mirror.name)
+                restored = BankingSystemImpl.restore(os.path.join(tmp, 'full'), lazy=lazy, shared_balances=mirror)
+                try:
+                    for i in range(20):
+                        self.assertEqual(reader.get(f'account{i}'), self.reader.get(f'account{i}'))
+                    self.assertEqual(reader.get('account1'), (71, 30))
+                    self.assertIsNone(reader.get('account4'))
+                    self.assertEqual(restored.deposit(5, 'account5', 10), 115)
+                    self.assertEqual(reader.get('account5'), (115, 0))
+                finally:
+                    restored.close()
+                    reader.close()
+                    mirror.close()
+
+    def test_reader_in_other_process_sees_consistent_slots(self):
+        self.system.create_account(1, 'source')
+        self.system.create_account(1, 'target')
+        self.system.deposit(2, 'source', 1_000_000)
+        context = multiprocessing.get_context('fork')
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=check_invariant, args=(self.mirror.name, 1_000_000, 20_000, sender))
+        process.start()
+        ts = 3
+        while process.is_alive() and not receiver.poll():
+            self.system.transfer(ts, 'source', 'target', 1)
+            ts += 1
+        result = receiver.recv()
+        process.join()
+        self.assertEqual(result[0], 'ok')
+        self.assertEqual(self.reader.get('source'), (1_000_000 - (ts - 3), ts - 3))
@@ -0,0 +1,110 @@
+import gc
+import os
+import tempfile
+import time
+import unittest
+from banking_system_impl import BankingSystemImpl
+from snapshot import SnapshotReader
+
+
+class SnapshotTests(unittest.TestCase):
+    """
+    Tests for eager and lazy restore from a snapshot file.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmp.name, 'state.snap')
+        cls.system = BankingSystemImpl()
+        cls.system.create_account(1, 'account1')
+        cls.system.create_account(2, 'account2')
+        cls.system.create_account(3, 'account3')
+        cls.system.deposit(4, 'account1', 2000)
+        cls.system.deposit(5, 'account2', 1000)
+        cls.system.transfer(6, 'account1', 'account3', 500)
+        cls.system.pay(7, 'account2', 300)
+        cls.system.merge_accounts(8, 'account1', 'account2')
+        cls.system.snapshot(cls.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def check_restored(self, restored):
+        self.assertEqual(restored.get_balance(9, 'account1', 8), 2200)
+        self.assertEqual(restored.get_balance(10, 'account2', 7), 700)
+        self.assertIsNone(restored.get_balance(11, 'account2', 8))
+        self.assertEqual(restored.top_spenders(12, 3), ['account1(800)', 'account3(0)'])
+        self.assertEqual(restored.get_payment_status(13, 'account1', 'payment1'), 'IN_PROGRESS')
+        self.assertEqual(restored.pay(14, 'account3', 100), 'payment2')
+        self.assertEqual(restored.deposit(86400007, 'account1', 0), 2206)
+        self.assertEqual(restored.get_payment_status(86400008, 'account1', 'payment1'), 'CASHBACK_RECEIVED')
+
+    def test_eager_restore(self):
+        restored = BankingSystemImpl.restore(self.path)
+        self.assertEqual(len(restored.balances), 2)
+        self.check_restored(restored)
+        restored.close()
+
+    def test_lazy_restore(self):
+        restored = BankingSystemImpl.restore(self.path, lazy=True)
+        self.assertEqual(len(restored.balances), 0)
+        self.assertEqual(restored.deposit(9, 'account3', 50), 550)
+        self.assertEqual(list(restored.balances), ['account3'])
+        self.assertTrue(restored.create_account(10, 'account4'))
+        self.assertFalse(restored.create_account(11, 'account1'))
+        self.assertEqual(restored.get_balance(12, 'account1', 8), 2200)
+        restored.close()
+
+    def test_lazy_restore_answers_like_eager(self):
+        restored = BankingSystemImpl.restore(self.path, lazy=True)
+        self.check_restored(restored)
+        restored.close()
+
+    def test_snapshot_of_lazy_system_keeps_untouched_accounts(self):
+        restored = BankingSystemImpl.restore(self.path, lazy=True)
+        self.assertEqual(restored.deposit(9, 'account3', 50), 550)
+        second = os.path.join(self.tmp.name, 'second.snap')
+        restored.snapshot(second)
+        again = BankingSystemImpl.restore(second)
+        self.assertEqual(again.get_balance(10, 'account3', 9), 550)
+        self.assertEqual(again.get_balance(11, 'account1', 8), 2200)
+        self.assertEqual(again.get_balance(12, 'account2', 5), 1000)
+        restored.close()
+        again.close()
+
+    def test_lazy_restore_does_not_hold_up_operations(self):
+        system = BankingSystemImpl()
+        for i in range(20_000):
+            system.create_account(1, f'account{i}')
+            system.deposit(2, f'account{i}', 1_000)
+            system.pay(3 + i, f'account{i}', 10)
+        path = os.path.join(self.tmp.name, 'large.snap')
+        system.snapshot(path)
+        reader = SnapshotReader(path)
+        start = time.perf_counter()
+        reader.load_extras()
+        full_load = time.perf_counter() - start
+        reader.close()
+        # full collections triggered by the decoded objects would pause both threads alike
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            restored = BankingSystemImpl.restore(path, lazy=True)
+            last = time.perf_counter()
+            self.assertLess(last - start, full_load / 4)
+            loading = restored._index_loader.__self__
+            worst, served = 0, 0
+            while not loading.done():
+                self.assertEqual(restored.get_balance(40_000, f'account{served % 20_000}', 40_000), 990)
+                now = time.perf_counter()
+                worst, last, served = max(worst, now - last), now, served + 1
+        finally:
+            gc.enable()
+        self.assertGreater(served, 0)
+        self.assertLess(worst, full_load / 4)
+        self.assertEqual(restored.top_spenders(40_000, 1), system.top_spenders(40_000, 1))
+        restored.close()
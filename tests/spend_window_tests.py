@@ -0,0 +1,160 @@
+import copy
+import os
+import random
+import tempfile
+import unittest
+from banking_system_impl import BankingSystemImpl
+from spend_window import SpendWindow
+
+DAY = 86_400_000
+HOUR = 3_600_000
+
+
+class SpendWindowTests(unittest.TestCase):
+    """
+    Tests for rolling-window spend limits on transfer and pay.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.system = BankingSystemImpl(spend_window_ms=DAY, spend_limit=10_000)
+        for acc in ('account1', 'account2', 'account3'):
+            cls.system.create_account(1, acc)
+            cls.system.deposit(2, acc, 100_000)
+
+    def test_limit_rejects_transfer_and_pay(self):
+        self.assertEqual(self.system.transfer(HOUR, 'account1', 'account2', 6_000), 94_000)
+        self.assertEqual(self.system.pay(2 * HOUR, 'account1', 4_000), 'payment1')
+        self.assertIsNone(self.system.transfer(3 * HOUR, 'account1', 'account2', 1))
+        self.assertIsNone(self.system.pay(3 * HOUR, 'account1', 1))
+        self.assertEqual(self.system.get_balance(3 * HOUR, 'account1', 3 * HOUR), 90_000)
+        self.assertEqual(self.system.get_spend_window(3 * HOUR, 'account1'),
+                         {'spent': 10_000, 'limit': 10_000, 'remaining': 0, 'window_ms': DAY})
+        self.assertEqual(self.system.get_spend_window(3 * HOUR, 'account2')['spent'], 0)
+
+    def test_window_rolls(self):
+        self.system.transfer(HOUR, 'account1', 'account2', 6_000)
+        self.system.pay(10 * HOUR, 'account1', 4_000)
+        # the bucket of the first transfer is still partly inside the window
+        self.assertIsNone(self.system.pay(DAY + HOUR, 'account1', 1))
+        self.assertEqual(self.system.get_spend_window(DAY + 2 * HOUR, 'account1')['spent'], 4_000)
+        self.assertEqual(self.system.pay(DAY + 2 * HOUR, 'account1', 6_000), 'payment2')
+        self.assertEqual(self.system.get_spend_window(3 * DAY, 'account1')['spent'], 0)
+        self.assertEqual(self.system.transfer(3 * DAY, 'account1', 'account2', 10_000), 74_200)
+
+    def test_settle_transfers_checks_and_records_windows(self):
+        self.system.pay(HOUR, 'account2', 7_000)
+        results = self.system.settle_transfers(2 * HOUR, [
+            ('account1', 'account3', 6_000),
+            ('account1', 'account2', 3_000),
+            ('account2', 'account3', 4_000),
+            ('account3', 'account1', 500),
+        ])
+        self.assertEqual(results, [91_500, 91_500, None, 105_500])
+        self.assertEqual(self.system.get_spend_window(2 * HOUR, 'account1')['spent'], 9_000)
+        self.assertEqual(self.system.get_spend_window(2 * HOUR, 'account2')['spent'], 7_000)
+        self.assertEqual(self.system.get_spend_window(2 * HOUR, 'account3')['spent'], 500)
+        self.assertIsNone(self.system.transfer(3 * HOUR, 'account1', 'account3', 1_001))
+        self.assertEqual(self.system.settle_transfers(3 * HOUR, [('account1', 'account3', 1_000)]), [90_500])
+
+    def test_matches_scan_of_history(self):
+        rng = random.Random(4)
+        spends = []
+        ts = 10
+        for _ in range(2_000):
+            ts += rng.randint(1, HOUR // 2)
+            amount = rng.randint(1, 1_000)
+            if self.system.transfer(ts, 'account3', 'account2', amount) is not None:
+                spends.append((ts, amount))
+            self.system.deposit(ts, 'account3', amount)
+            spent = self.system.get_spend_window(ts, 'account3')['spent']
+            exact = sum(a for t, a in spends if t > ts - DAY)
+            loose = sum(a for t, a in spends if t > ts - DAY - HOUR)
+            self.assertTrue(exact <= spent <= loose)
+            self.assertLessEqual(spent, 10_000)
+
+    def test_per_account_limit(self):
+        self.assertTrue(self.system.set_spend_limit(3, 'account2', 50_000))
+        self.assertFalse(self.system.set_spend_limit(3, 'account9', 50_000))
+        self.assertEqual(self.system.transfer(4, 'account2', 'account1', 40_000), 60_000)
+        self.assertEqual(self.system.get_spend_window(5, 'account2')['remaining'], 10_000)
+        self.assertTrue(self.system.set_spend_limit(6, 'account2', None))
+        self.assertIsNone(self.system.pay(7, 'account2', 1))
+
+    def test_merge_combines_windows(self):
+        self.system.transfer(HOUR, 'account1', 'account3', 3_000)
+        self.system.transfer(2 * HOUR, 'account2', 'account3', 5_000)
+        self.system.set_spend_limit(2 * HOUR, 'account2', 1_000_000)
+        self.assertTrue(self.system.merge_accounts(3 * HOUR, 'account1', 'account2'))
+        self.assertEqual(self.system.get_spend_window(3 * HOUR, 'account1'),
+                         {'spent': 8_000, 'limit': 10_000, 'remaining': 2_000, 'window_ms': DAY})
+        self.assertIsNone(self.system.get_spend_window(3 * HOUR, 'account2'))
+        self.assertTrue(self.system.merge_accounts(4 * HOUR, 'account3', 'account1'))
+        self.assertEqual(self.system.get_spend_window(4 * HOUR, 'account3')['spent'], 8_000)
+
+    def test_disabled_by_default(self):
+        system = BankingSystemImpl()
+        system.create_account(1, 'account1')
+        system.deposit(2, 'account1', 100_000)
+        self.assertEqual(system.pay(3, 'account1', 50_000), 'payment1')
+        self.assertIsNone(system.get_spend_window(4, 'account1'))
+        self.assertFalse(system.set_spend_limit(4, 'account1', 10))
+        self.assertEqual(system.spend_windows, {})
+
+    def test_rollback_restores_windows(self):
+        self.system.transfer(HOUR, 'account1', 'account2', 2_000)
+        before = copy.deepcopy(self.system.spend_windows)
+        savepoint = self.system.savepoint()
+        self.system.transfer(2 * HOUR, 'account1', 'account2', 2_000)
+        self.system.pay(2 * DAY, 'account2', 3_000)
+        self.system.set_spend_limit(2 * DAY, 'account3', 5)
+        self.system.merge_accounts(2 * DAY, 'account1', 'account2')
+        self.system.rollback(savepoint)
+        self.system.release(savepoint)
+        self.assertEqual(self.system.spend_windows, before)
+
+    def test_checkpoint_and_fork_keep_windows(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.system.snapshot(os.path.join(tmp, 'full'))
+            self.system.transfer(HOUR, 'account1', 'account2', 9_000)
+            self.system.set_spend_limit(HOUR, 'account3', 100)
+            self.system.checkpoint(os.path.join(tmp, 'delta'))
+            restored = BankingSystemImpl.restore(os.path.join(tmp, 'full'), deltas=[os.path.join(tmp, 'delta')])
+        self.assertEqual(restored.spend_windows, self.system.spend_windows)
+        child = self.system.fork()
+        self.assertIsNone(child.pay(2 * HOUR, 'account1', 1_001))
+        self.assertEqual(child.pay(2 * HOUR, 'account1', 1_000), 'payment1')
+        self.assertEqual(self.system.get_spend_window(2 * HOUR, 'account1')['spent'], 9_000)
+
+    def test_restore_and_fork_keep_configuration(self):
+        system = BankingSystemImpl(spend_window_ms=DAY, spend_limit=100, history_retention_ms=7 * DAY,
+                                   history_bucket_ms=HOUR)
+        system.create_account(1, 'account1')
+        system.create_account(1, 'account2')
+        system.deposit(2, 'account1', 1_000)
+        with tempfile.TemporaryDirectory() as tmp:
+            system.snapshot(os.path.join(tmp, 'full'))
+            for lazy in (False, True):
+                restored = BankingSystemImpl.restore(os.path.join(tmp, 'full'), lazy=lazy)
+                self.assertIsNone(restored.transfer(3, 'account1', 'account2', 500))
+                self.assertEqual(restored.transfer(3, 'account1', 'account2', 100), 900)
+                self.assertEqual(restored._config(), system._config())
+                restored.close()
+            restored = BankingSystemImpl.restore(os.path.join(tmp, 'full'), spend_limit=1_000)
+            self.assertEqual(restored.transfer(3, 'account1', 'account2', 500), 500)
+            restored.close()
+        child = system.fork()
+        self.assertEqual(child._config(), system._config())
+        self.assertIsNone(child.pay(3, 'account1', 500))
+
+    def test_absorb_drops_expired_buckets(self):
+        window, other = SpendWindow(DAY, 4), SpendWindow(DAY, 4)
+        other.add(0, 5)
+        other.add(DAY, 7)
+        window.add(DAY + DAY // 4, 1)
+        window.absorb(other, 2 * DAY)
+        self.assertEqual(window.spent(2 * DAY), 8)
+        self.assertEqual(other.spent(DAY), 12)
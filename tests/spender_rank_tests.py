@@ -0,0 +1,47 @@
+import unittest
+from banking_system_impl import BankingSystemImpl
+
+
+class SpenderRankTests(unittest.TestCase):
+    """
+    Tests for rank, threshold and paginated queries over the spending index.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.system = BankingSystemImpl()
+        for i, acc in enumerate(['acc_a', 'acc_b', 'acc_c', 'acc_d', 'acc_e']):
+            cls.system.create_account(i + 1, acc)
+            cls.system.deposit(i + 10, acc, 1000)
+        cls.system.pay(20, 'acc_c', 300)
+        cls.system.pay(21, 'acc_a', 100)
+        cls.system.transfer(22, 'acc_e', 'acc_a', 300)
+        cls.system.pay(23, 'acc_b', 100)
+
+    def test_spender_rank(self):
+        self.assertEqual(self.system.top_spenders(30, 5),
+                         ['acc_c(300)', 'acc_e(300)', 'acc_a(100)', 'acc_b(100)', 'acc_d(0)'])
+        self.assertEqual(self.system.spender_rank(31, 'acc_c'), 1)
+        self.assertEqual(self.system.spender_rank(32, 'acc_e'), 2)
+        self.assertEqual(self.system.spender_rank(33, 'acc_b'), 4)
+        self.assertEqual(self.system.spender_rank(34, 'acc_d'), 5)
+        self.assertIsNone(self.system.spender_rank(35, 'acc_z'))
+        self.assertTrue(self.system.merge_accounts(36, 'acc_d', 'acc_c'))
+        self.assertIsNone(self.system.spender_rank(37, 'acc_c'))
+        self.assertEqual(self.system.spender_rank(38, 'acc_d'), 1)
+
+    def test_spenders_above(self):
+        self.assertEqual(self.system.spenders_above(30, 300), 0)
+        self.assertEqual(self.system.spenders_above(31, 299), 2)
+        self.assertEqual(self.system.spenders_above(32, 100), 2)
+        self.assertEqual(self.system.spenders_above(33, 0), 4)
+        self.assertEqual(self.system.spenders_above(34, -1), 5)
+
+    def test_top_spenders_page(self):
+        self.assertEqual(self.system.top_spenders_page(30, 0, 2), ['acc_c(300)', 'acc_e(300)'])
+        self.assertEqual(self.system.top_spenders_page(31, 2, 2), ['acc_a(100)', 'acc_b(100)'])
+        self.assertEqual(self.system.top_spenders_page(32, 4, 2), ['acc_d(0)'])
+        self.assertEqual(self.system.top_spenders_page(33, 10, 2), [])
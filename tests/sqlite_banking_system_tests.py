@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+import level_1_tests
+import level_2_tests
+import level_3_tests
+import level_4_tests
+from banking_system_sqlite import SqliteBankingSystem
+
+
+class SqliteLevel1Tests(level_1_tests.Level1Tests):
+    """
+    Level 1 suite run against the SQLite-backed implementation.
+    """
+
+    @classmethod
+    def setUp(cls):
+        cls.system = SqliteBankingSystem(batch_size=3)
+
+
+class SqliteLevel2Tests(level_2_tests.Level2Tests):
+    """
+    Level 2 suite run against the SQLite-backed implementation.
+    """
+
+    @classmethod
+    def setUp(cls):
+        cls.system = SqliteBankingSystem(batch_size=3)
+
+
+class SqliteLevel3Tests(level_3_tests.Level3Tests):
+    """
+    Level 3 suite run against the SQLite-backed implementation.
+    """
+
+    @classmethod
+    def setUp(cls):
+        cls.system = SqliteBankingSystem(batch_size=3)
+
+
+class SqliteLevel4Tests(level_4_tests.Level4Tests):
+    """
+    Level 4 suite run against the SQLite-backed implementation.
+    """
+
+    @classmethod
+    def setUp(cls):
+        cls.system = SqliteBankingSystem(batch_size=3)
+
+
+class SqlitePersistenceTests(unittest.TestCase):
+    """
+    State written by one SqliteBankingSystem is visible to the next one.
+    """
+
+    failureException = Exception
+
+    def test_reopen_preserves_state(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bank.db')
+            system = SqliteBankingSystem(path)
+            self.assertTrue(system.create_account(1, 'account1'))
+            self.assertEqual(system.deposit(2, 'account1', 1000), 1000)
+            self.assertEqual(system.pay(3, 'account1', 500), 'payment1')
+            system.close()
+
+            system = SqliteBankingSystem(path)
+            self.assertEqual(system.pay(4, 'account1', 100), 'payment2')
+            self.assertEqual(system.get_balance(86400003, 'account1', 86400003), 410)
+            self.assertEqual(system.get_payment_status(86400004, 'account1', 'payment1'), 'CASHBACK_RECEIVED')
+            self.assertEqual(system.top_spenders(86400005, 1), ['account1(600)'])
+            system.close()
@@ -0,0 +1,72 @@
+import unittest
+from banking_system_impl import BankingSystemImpl
+
+
+class StatementTests(unittest.TestCase):
+    """
+    Tests for get_statement and the per-account transaction log.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.system = BankingSystemImpl(transaction_log=True)
+        cls.system.create_account(1, 'account1')
+        cls.system.create_account(2, 'account2')
+        cls.system.create_account(3, 'account3')
+        cls.system.deposit(4, 'account1', 1000)
+        cls.system.deposit_many(5, [('account2', 300), ('account3', 50)])
+        cls.system.transfer(6, 'account1', 'account2', 200)
+        cls.system.pay(7, 'account1', 100)
+        cls.system.settle_transfers(8, [('account2', 'account3', 25)])
+        cls.system.merge_accounts(9, 'account1', 'account3')
+
+    def test_statement_lists_every_kind(self):
+        self.assertEqual(self.system.get_statement(86_400_007, 'account1', 0, 86_400_007), ([
+            (4, 'deposit', 1000, None),
+            (6, 'transfer_out', -200, 'account2'),
+            (7, 'pay', -100, 'payment1'),
+            (9, 'merge', 75, 'account3'),
+            (86_400_007, 'cashback', 2, 'payment1'),
+        ], None))
+        self.assertEqual(self.system.get_statement(10, 'account3', 0, 10), ([
+            (5, 'deposit', 50, None),
+            (8, 'settle', 25, None),
+            (9, 'merge', -75, 'account1'),
+        ], None))
+        self.assertEqual(self.system.get_statement(10, 'account2', 6, 6), ([(6, 'transfer_in', 200, 'account1')], None))
+        self.assertIsNone(self.system.get_statement(10, 'account4', 0, 10))
+
+    def test_pagination(self):
+        for ts in range(100, 350):
+            self.system.deposit(ts, 'account2', ts)
+        pages = []
+        cursor = None
+        while True:
+            page, cursor = self.system.get_statement(400, 'account2', 150, 299, limit=40, cursor=cursor)
+            pages.append(page)
+            if cursor is None:
+                break
+        self.assertEqual([len(page) for page in pages], [40, 40, 40, 30])
+        self.assertEqual([entry[0] for page in pages for entry in page], list(range(150, 300)))
+
+    def test_rollback_removes_transactions(self):
+        savepoint = self.system.savepoint()
+        self.system.transfer(10, 'account2', 'account1', 5)
+        self.system.create_account(11, 'account4')
+        self.system.rollback(savepoint)
+        self.assertEqual(self.system.get_statement(12, 'account2', 10, 12), ([], None))
+        self.assertNotIn('account4', self.system.account_handles)
+
+    def test_disabled_by_default(self):
+        system = BankingSystemImpl()
+        system.create_account(1, 'account1')
+        system.create_account(1, 'account2')
+        system.deposit(2, 'account1', 1000)
+        system.transfer(3, 'account1', 'account2', 200)
+        self.assertEqual(system.pay(4, 'account1', 100), 'payment1')
+        self.assertTrue(system.merge_accounts(5, 'account1', 'account2'))
+        self.assertIsNone(system.get_statement(6, 'account1', 0, 6))
+        self.assertEqual(system.transactions, {})
@@ -0,0 +1,72 @@
+import random
+import unittest
+from banking_system_impl import BankingSystemImpl
+
+DAY = 86_400_000
+
+
+class TickTests(unittest.TestCase):
+    """
+    Tests for settling cashbacks through advance_time() and tick().
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.system = BankingSystemImpl()
+        cls.system.create_account(1, 'account1')
+        cls.system.create_account(2, 'account2')
+        cls.system.deposit(3, 'account1', 10_000)
+        for ts in range(4, 14):
+            cls.system.pay(ts, 'account1', 100)
+
+    def test_advance_time_settles_in_chunks(self):
+        self.assertFalse(self.system.advance_time(DAY + 13, limit=4))
+        self.assertEqual(len(self.system.cashback), 6)
+        self.assertFalse(self.system.tick(limit=4))
+        self.assertTrue(self.system.tick(limit=4))
+        self.assertEqual(len(self.system.cashback), 0)
+        self.assertEqual(self.system.get_balance(DAY + 14, 'account1', DAY + 13), 9_020)
+        self.assertEqual(self.system.get_balance(DAY + 14, 'account1', DAY + 5), 9_004)
+        self.assertEqual(self.system.get_payment_status(DAY + 14, 'account1', 'payment10'), 'CASHBACK_RECEIVED')
+
+    def test_request_finishes_a_partial_drain(self):
+        self.assertFalse(self.system.advance_time(DAY + 13, limit=3))
+        self.assertEqual(self.system.get_pending_cashback(DAY + 13, 'account1'), (0, 0))
+        self.assertEqual(self.system.transfer(DAY + 13, 'account1', 'account2', 9_020), 0)
+
+    def test_clock_does_not_run_backwards(self):
+        self.system.advance_time(DAY + 8, limit=None)
+        self.system.advance_time(5, limit=None)
+        self.assertEqual(self.system.clock, DAY + 8)
+        self.assertEqual(len(self.system.cashback), 5)
+
+    def test_rollback_restores_unsettled_cashbacks(self):
+        savepoint = self.system.savepoint()
+        self.assertTrue(self.system.advance_time(DAY + 13, limit=None))
+        self.system.rollback(savepoint)
+        self.assertEqual(self.system.get_pending_cashback(20, 'account1'), (20, 10))
+        self.assertTrue(self.system.advance_time(DAY + 13, limit=None))
+        self.assertEqual(self.system.get_pending_cashback(DAY + 13, 'account1'), (0, 0))
+
+    def test_ticks_between_requests_do_not_change_results(self):
+        rng = random.Random(3)
+        ticked, plain = BankingSystemImpl(), BankingSystemImpl()
+        accounts = [f'account{i}' for i in range(5)]
+        ts = 0
+        for _ in range(500):
+            ts += rng.randint(1, DAY // 20)
+            ticked.advance_time(ts, limit=rng.randint(0, 3))
+            acc, other, amount = rng.choice(accounts), rng.choice(accounts), rng.randint(1, 500)
+            method, args = rng.choice([
+                ('create_account', (ts, acc)),
+                ('deposit', (ts, acc, amount)),
+                ('transfer', (ts, acc, other, amount)),
+                ('pay', (ts, acc, amount)),
+                ('get_balance', (ts, acc, rng.randint(0, ts))),
+                ('get_pending_cashback', (ts, acc)),
+                ('top_spenders', (ts, 3)),
+            ])
+            self.assertEqual(getattr(ticked, method)(*args), getattr(plain, method)(*args))
@@ -0,0 +1,87 @@
+import os
+import random
+import tempfile
+import unittest
+from banking_system_impl import BankingSystemImpl
+
+
+class TopSpendersAtTests(unittest.TestCase):
+    """
+    Tests for historical top_spenders queries.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.system = BankingSystemImpl(spending_checkpoint_interval=7)
+
+    def test_basic_history(self):
+        self.assertTrue(self.system.create_account(1, 'account1'))
+        self.assertTrue(self.system.create_account(2, 'account2'))
+        self.assertTrue(self.system.create_account(3, 'account3'))
+        self.assertEqual(self.system.deposit(4, 'account1', 1000), 1000)
+        self.assertEqual(self.system.deposit(5, 'account2', 1000), 1000)
+        self.assertEqual(self.system.transfer(6, 'account1', 'account3', 300), 700)
+        self.assertEqual(self.system.pay(7, 'account2', 500), 'payment1')
+        self.assertTrue(self.system.merge_accounts(8, 'account2', 'account1'))
+        self.assertEqual(self.system.top_spenders_at(9, 3, 0), [])
+        self.assertEqual(self.system.top_spenders_at(10, 3, 2), ['account1(0)', 'account2(0)'])
+        self.assertEqual(self.system.top_spenders_at(11, 3, 6), ['account1(300)', 'account2(0)', 'account3(0)'])
+        self.assertEqual(self.system.top_spenders_at(12, 2, 7), ['account2(500)', 'account1(300)'])
+        self.assertEqual(self.system.top_spenders_at(13, 3, 8), ['account2(800)', 'account3(0)'])
+
+    def test_matches_top_spenders_over_time(self):
+        rng = random.Random(3)
+        accounts = [f'account{i}' for i in range(8)]
+        expected = {}
+        for ts in range(1, 400):
+            acc = rng.choice(accounts)
+            roll = rng.random()
+            if roll < 0.1:
+                self.system.create_account(ts, acc)
+            elif roll < 0.4:
+                self.system.deposit(ts, acc, rng.randint(1, 500))
+            elif roll < 0.7:
+                self.system.transfer(ts, acc, rng.choice(accounts), rng.randint(1, 300))
+            elif roll < 0.95:
+                self.system.pay(ts, acc, rng.randint(1, 300))
+            else:
+                self.system.merge_accounts(ts, acc, rng.choice(accounts))
+            expected[ts] = self.system.top_spenders(ts, 5)
+        self.assertGreater(len(self.system.spending_checkpoints), 5)
+        for time_at, top in expected.items():
+            self.assertEqual(self.system.top_spenders_at(1000, 5, time_at), top)
+
+    def test_checkpoints_store_changes(self):
+        accounts = [f'account{i}' for i in range(300)]
+        for acc in accounts:
+            self.system.create_account(1, acc)
+            self.system.deposit(1, acc, 100_000)
+        rng = random.Random(5)
+        expected = {}
+        for ts in range(2, 3_000):
+            self.system.pay(ts, rng.choice(accounts[:20] if rng.random() < 0.9 else accounts), rng.randint(1, 50))
+            if ts % 97 == 0:
+                expected[ts] = self.system.top_spenders(ts, 10)
+        checkpoints = self.system.spending_checkpoints
+        full = [values for _, values, is_full in checkpoints if is_full]
+        self.assertGreater(len(checkpoints), 10 * len(full))
+        self.assertLessEqual(sum(len(values) for _, values, _ in checkpoints), 2 * len(self.system.outgoing_change_ts))
+        for time_at, top in expected.items():
+            self.assertEqual(self.system.top_spenders_at(5_000, 10, time_at), top)
+
+    def test_survives_snapshot(self):
+        self.assertTrue(self.system.create_account(1, 'account1'))
+        self.assertEqual(self.system.deposit(2, 'account1', 1000), 1000)
+        for ts in range(3, 20):
+            self.assertIsNotNone(self.system.pay(ts, 'account1', 10))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'state.snap')
+            self.system.snapshot(path)
+            restored = BankingSystemImpl.restore(path, lazy=True)
+            self.assertEqual(restored.top_spenders_at(30, 1, 10), ['account1(80)'])
+            self.assertEqual(restored.pay(31, 'account1', 10), 'payment18')
+            self.assertEqual(restored.top_spenders_at(32, 1, 31), ['account1(180)'])
+            restored.close()
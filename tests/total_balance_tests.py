@@ -0,0 +1,80 @@
+import os
+import random
+import tempfile
+import unittest
+from banking_system_impl import BankingSystemImpl
+
+
+class TotalBalanceTests(unittest.TestCase):
+    """
+    Tests for the system-wide total balance and outgoing histories.
+    """
+
+    failureException = Exception
+
+
+    @classmethod
+    def setUp(cls):
+        cls.system = BankingSystemImpl(total_history=True)
+
+    def test_totals_follow_operations(self):
+        self.assertEqual(self.system.total_balance_at(1, 0), 0)
+        self.assertTrue(self.system.create_account(2, 'account1'))
+        self.assertTrue(self.system.create_account(3, 'account2'))
+        self.assertEqual(self.system.deposit(4, 'account1', 1000), 1000)
+        self.assertEqual(self.system.transfer(5, 'account1', 'account2', 300), 700)
+        self.assertEqual(self.system.pay(6, 'account2', 100), 'payment1')
+        self.assertTrue(self.system.merge_accounts(7, 'account1', 'account2'))
+        self.assertEqual(self.system.total_balance_at(8, 4), 1000)
+        self.assertEqual(self.system.total_balance_at(9, 5), 1000)
+        self.assertEqual(self.system.total_balance_at(10, 6), 900)
+        self.assertEqual(self.system.total_outgoing_at(11, 4), 0)
+        self.assertEqual(self.system.total_outgoing_at(12, 5), 300)
+        self.assertEqual(self.system.total_outgoing_at(13, 7), 400)
+        self.assertEqual(self.system.total_balance_at(86400006, 86400006), 902)
+
+    def test_matches_sum_of_balances(self):
+        rng = random.Random(11)
+        accounts = [f'account{i}' for i in range(6)]
+        expected = {}
+        for ts in range(1, 300):
+            acc = rng.choice(accounts)
+            roll = rng.random()
+            if roll < 0.15:
+                self.system.create_account(ts, acc)
+            elif roll < 0.4:
+                self.system.deposit(ts, acc, rng.randint(1, 500))
+            elif roll < 0.5:
+                self.system.deposit_many(ts, [(rng.choice(accounts), rng.randint(1, 50)) for _ in range(3)])
+            elif roll < 0.65:
+                self.system.transfer(ts, acc, rng.choice(accounts), rng.randint(1, 300))
+            elif roll < 0.75:
+                self.system.settle_transfers(ts, [(acc, rng.choice(accounts), rng.randint(1, 300)) for _ in range(3)])
+            elif roll < 0.95:
+                self.system.pay(ts, acc, rng.randint(1, 300))
+            else:
+                self.system.merge_accounts(ts, acc, rng.choice(accounts))
+            expected[ts] = (sum(self.system.balances.values()), sum(self.system.outgoing.values()))
+        for time_at, (balance, outgoing) in expected.items():
+            self.assertEqual(self.system.total_balance_at(300, time_at), balance)
+            self.assertEqual(self.system.total_outgoing_at(301, time_at), outgoing)
+
+    def test_deposits_during_lazy_restore(self):
+        self.system.create_account(1, 'account1')
+        self.system.deposit(2, 'account1', 100)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'state.snap')
+            self.system.snapshot(path)
+            restored = BankingSystemImpl.restore(path, lazy=True)
+            self.assertEqual(restored.deposit(3, 'account1', 50), 150)
+            self.assertEqual(restored.total_balance_at(4, 2), 100)
+            self.assertEqual(restored.total_balance_at(5, 3), 150)
+            restored.close()
+
+    def test_disabled_by_default(self):
+        system = BankingSystemImpl()
+        system.create_account(1, 'account1')
+        system.deposit(2, 'account1', 100)
+        self.assertIsNone(system.total_balance_at(3, 2))
+        self.assertIsNone(system.total_outgoing_at(3, 2))
+        self.assertEqual(system.total_balance_history, [])
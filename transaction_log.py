@@ -0,0 +1,82 @@
+from array import array
+import bisect
+import sys
+
+import change_feed as cdc
+
+# Event kinds stored in the log, by code
+KINDS = (cdc.DEPOSIT, cdc.TRANSFER_OUT, cdc.TRANSFER_IN, cdc.SETTLE, cdc.PAY, cdc.CASHBACK, cdc.MERGE)
+DEPOSIT, TRANSFER_OUT, TRANSFER_IN, SETTLE, PAY, CASHBACK, MERGE = range(len(KINDS))
+NO_REF = -1
+
+
+class TransactionLog:
+    '''
+    Per-account log of balance-changing events held in parallel typed arrays
+
+    Each event takes 25 bytes: timestamp, kind code, signed balance change and
+    a reference, which is the counterparty's account handle for transfer legs
+    and merges, the payment number for payments and cashback, or NO_REF.
+    Entries are (timestamp, kind code, amount, ref) tuples, in timestamp order.
+    '''
+    __slots__ = ("timestamps", "kinds", "amounts", "refs")
+
+    def __init__(self, entries=()):
+        self.timestamps = array("q")
+        self.kinds = array("b")
+        self.amounts = array("q")
+        self.refs = array("q")
+        for entry in entries:
+            self.append(entry)
+
+    def append(self, entry: tuple):
+        timestamp, kind, amount, ref = entry
+        self.timestamps.append(timestamp)
+        self.kinds.append(kind)
+        self.amounts.append(amount)
+        self.refs.append(ref)
+
+    def pop(self) -> tuple:
+        return self.timestamps.pop(), self.kinds.pop(), self.amounts.pop(), self.refs.pop()
+
+    def copy(self) -> "TransactionLog":
+        other = TransactionLog.__new__(TransactionLog)
+        other.timestamps = array("q", self.timestamps)
+        other.kinds = array("b", self.kinds)
+        other.amounts = array("q", self.amounts)
+        other.refs = array("q", self.refs)
+        return other
+
+    def seek(self, timestamp: int) -> int:
+        '''
+        Return the position of the first event at or after `timestamp`
+
+        :param timestamp: Timestamp to seek to
+        :type timestamp: int
+        :rtype: int
+        '''
+        return bisect.bisect_left(self.timestamps, timestamp)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getitem__(self, i: int | slice) -> tuple | list:
+        if isinstance(i, slice):
+            return list(zip(self.timestamps[i], self.kinds[i], self.amounts[i], self.refs[i]))
+        return self.timestamps[i], self.kinds[i], self.amounts[i], self.refs[i]
+
+    def __iter__(self):
+        return zip(self.timestamps, self.kinds, self.amounts, self.refs)
+
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+
+    def __getstate__(self):
+        return self.timestamps, self.kinds, self.amounts, self.refs
+
+    def __setstate__(self, state):
+        self.timestamps, self.kinds, self.amounts, self.refs = state
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + sum(
+            sys.getsizeof(column) for column in (self.timestamps, self.kinds, self.amounts, self.refs))